@@ -0,0 +1,47 @@
+from datetime import datetime
+
+from buffered_counter import BufferedCounter
+from cache import MISSING, TTLCache, get_db
+
+API_KEY_CACHE_TTL = 60
+
+api_key_cache = TTLCache('api_keys', ttl=API_KEY_CACHE_TTL, max_size=10000)
+
+API_KEY_QUERY = 'SELECT * FROM api_keys WHERE key = ? AND is_active = 1'
+
+# Returns (key_record, company). Unknown or inactive keys are cached too so
+# bursts with a bad key don't reach the database either.
+def lookup_api_key(api_key):
+    entry = api_key_cache.get(api_key)
+    if entry is MISSING:
+        db = get_db()
+        key_record = db.execute(API_KEY_QUERY, (api_key,)).fetchone()
+        company = None
+        if key_record:
+            company = db.execute('SELECT * FROM companies WHERE id = ? AND is_active = 1', (key_record['company_id'],)).fetchone()
+        entry = api_key_cache.set(api_key, (key_record, company))
+    return entry
+
+def invalidate_api_key(api_key=MISSING):
+    api_key_cache.invalidate(api_key)
+
+class ApiKeyUsageCounter(BufferedCounter):
+    def __init__(self):
+        super().__init__('api_key_usage', flush_interval=10, flush_threshold=1000)
+
+    def record(self, key_id):
+        self.add(key_id, (1, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
+
+    def merge(self, current, amount):
+        if current is None:
+            return amount
+        return current[0] + amount[0], max(current[1], amount[1])
+
+    def size(self, amount):
+        return amount[0]
+
+    def write(self, conn, batch):
+        conn.executemany('UPDATE api_keys SET last_used = ?, usage_count = usage_count + ? WHERE id = ?',
+                         [(last_used, count, key_id) for key_id, (count, last_used) in batch.items()])
+
+usage_counter = ApiKeyUsageCounter()
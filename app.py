@@ -3,16 +3,22 @@ from flask import Flask, render_template, g, session, redirect, url_for
 from datetime import datetime, timedelta
 from functools import wraps
 from config import Config
-from db import get_db_connection, init_database
+from db import get_request_db as get_db, init_database
+from plan_expiry import run_due_expiries, start_scheduler
+from ingest_queue import ingest_writer
+from reminders import start_reminders
+from events import async_worker_active
+from page_cache import start_warm_up
+from static_cards import start_publisher
+from cache import get_session_user, get_master_settings
+from instrumentation import instrumentation
+from pagination import page_url
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = Config.SECRET_KEY
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
-
-def get_db():
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
+app.add_template_global(page_url)
+instrumentation.init_app(app)
 
 @app.teardown_appcontext
 def close_db(error):
@@ -21,11 +27,7 @@ def close_db(error):
         db.close()
 
 def get_current_user():
-    if 'user_id' not in session:
-        return None
-    db = get_db()
-    user = db.execute('SELECT * FROM users WHERE id = ? AND is_active = 1', (session['user_id'],)).fetchone()
-    return user
+    return get_session_user()
 
 def login_required(f):
     @wraps(f)
@@ -48,20 +50,8 @@ def role_required(*roles):
         return decorated_function
     return decorator
 
-def get_master_settings():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return settings
-
 def check_plan_expiry():
-    db = get_db()
-    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-    db.execute('''
-        UPDATE companies 
-        SET plan = 'free', cards_limit = 2, white_label_enabled = 0
-        WHERE plan != 'free' AND plan_expiry_date < ? AND plan_expiry_date IS NOT NULL
-    ''', (now,))
-    db.commit()
+    run_due_expiries(get_db())
 
 @app.context_processor
 def inject_globals():
@@ -69,13 +59,26 @@ def inject_globals():
         'current_user': get_current_user(),
         'master_settings': get_master_settings(),
         'current_year': datetime.utcnow().year,
-        'plans': Config.PLANS
+        'plans': Config.PLANS,
+        'sse_enabled': Config.SSE_ENABLED
     }
 
 @app.before_request
 def before_request():
     check_plan_expiry()
 
+if Config.PLAN_EXPIRY_SCHEDULER:
+    start_scheduler()
+
+if Config.FOLLOW_UP_REMINDERS:
+    start_reminders()
+
+ingest_writer.start()
+
+if Config.SSE_ENABLED and not async_worker_active():
+    print("SSE_ENABLED ignored: live notification streams need the gevent worker (gunicorn -k gevent); pages will poll instead.")
+    Config.SSE_ENABLED = False
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('errors/404.html'), 404
@@ -96,6 +99,7 @@ from routes.sales import sales_bp
 from routes.card import card_bp
 from routes.api import api_bp
 from routes.payment import payment_bp
+from routes.metrics import metrics_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(public_bp)
@@ -105,6 +109,13 @@ app.register_blueprint(sales_bp, url_prefix='/sales')
 app.register_blueprint(card_bp, url_prefix='/card')
 app.register_blueprint(api_bp, url_prefix='/api')
 app.register_blueprint(payment_bp, url_prefix='/payment')
+app.register_blueprint(metrics_bp)
+
+if Config.PAGE_CACHE_WARM_TENANTS:
+    start_warm_up(app)
+
+if Config.STATIC_CARDS_DIR and Config.STATIC_CARDS_URL:
+    start_publisher(app)
 
 if __name__ == '__main__':
     init_database()
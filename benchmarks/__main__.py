@@ -0,0 +1,337 @@
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+DEFAULT_THRESHOLD = 10.0
+SERVER_START_TIMEOUT = 30
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(q * len(sorted_values)) - 1)]
+
+def summarize(latencies, errors, wall_seconds):
+    values = sorted(latencies)
+    return {
+        'count': len(values),
+        'errors': errors,
+        'mean_ms': round(sum(values) / len(values) * 1000, 4) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 4),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 4),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 4),
+        'max_ms': round(values[-1] * 1000, 4) if values else 0.0,
+        'throughput_rps': round(len(values) / wall_seconds, 2) if wall_seconds else 0.0
+    }
+
+# Sends requests through the Flask test client: the whole stack minus the
+# network and WSGI server.
+class InProcessDriver:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def send(self, method, path, headers, body, content_type):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client(use_cookies=False)
+        response = client.open(path, method=method, headers=headers, data=body, content_type=content_type)
+        try:
+            return response.status_code, len(response.get_data())
+        finally:
+            response.close()
+
+class HttpDriver:
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+
+    def send(self, method, path, headers, body, content_type):
+        headers = dict(headers)
+        if content_type:
+            headers['Content-Type'] = content_type
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            return response.status, len(response.read())
+        finally:
+            conn.close()
+
+def session_cookies(app, target):
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie_name = app.config.get('SESSION_COOKIE_NAME', 'session')
+    cookies = {}
+    for role, user in target['users'].items():
+        if user is not None:
+            session = {'user_id': user['id'], 'role': user['role'], 'company_id': user['company_id']}
+            cookies[role] = f'{cookie_name}={serializer.dumps(session)}'
+    return cookies
+
+def skip_reason(scenario, target, cookies):
+    if scenario.get('requires') and not target.get(scenario['requires']):
+        return f"no {scenario['requires']} in the dataset"
+    if scenario.get('role') and scenario['role'] not in cookies:
+        return f"no {scenario['role']} user in the dataset"
+    if scenario.get('api_key') and not target.get('api_key'):
+        return 'no API key in the dataset'
+    return None
+
+def run_scenario(driver, scenario, target, cookies, requests, concurrency, warmup):
+    method = scenario.get('method', 'GET')
+    path = scenario['path'](target)
+    expected = scenario.get('status', (200,))
+    headers = {}
+    if scenario.get('role'):
+        headers['Cookie'] = cookies[scenario['role']]
+    if scenario.get('api_key'):
+        headers['X-API-Key'] = target['api_key']
+    requests = min(requests, scenario.get('requests', requests))
+
+    def send():
+        body, content_type = scenario['body']() if 'body' in scenario else (None, None)
+        return driver.send(method, path, headers, body, content_type)
+
+    for _ in range(warmup):
+        send()
+
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    remaining = iter(range(requests))
+
+    def worker():
+        own = []
+        own_errors = 0
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    break
+            started = time.perf_counter()
+            try:
+                status, size = send()
+                ok = status in expected
+            except Exception:
+                ok = False
+            own.append(time.perf_counter() - started)
+            own_errors += not ok
+        with lock:
+            latencies.extend(own)
+            errors[0] += own_errors
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+def run_micro(func, iterations, warmup):
+    for _ in range(warmup):
+        func()
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        call_started = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - call_started)
+    return summarize(latencies, 0, time.perf_counter() - started)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def start_gunicorn(port, workers, env):
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+               '--log-level', 'warning', 'app:app']
+    server = subprocess.Popen(command, cwd=ROOT, env=env)
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {server.returncode}')
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/v1/ready', timeout=2) as response:
+                if response.status == 200:
+                    return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError('gunicorn did not become ready in time')
+
+def run(args):
+    database = args.database
+    if database is None:
+        database = os.path.join(tempfile.mkdtemp(prefix='bench-'), 'bench.db')
+    env = dict(os.environ, DATABASE_PATH=os.path.abspath(database),
+               SESSION_SECRET=os.environ.get('SESSION_SECRET') or secrets.token_hex(32),
+               FOLLOW_UP_REMINDERS='0', PLAN_EXPIRY_SCHEDULER='0', PAGE_CACHE_WARM_TENANTS='0',
+               SLOW_REQUEST_MS=os.environ.get('SLOW_REQUEST_MS', '60000'))
+    os.environ.update(env)
+    sys.path.insert(0, ROOT)
+
+    from benchmarks.fixture import build_fixture, describe
+    from benchmarks.scenarios import SCENARIOS, MICRO_BENCHMARKS
+    from db import get_db_connection
+
+    if args.database is None:
+        print(f'Building fixture with {args.leads} leads in {database}...')
+        build_fixture(args.leads, args.seed)
+    conn = get_db_connection()
+    try:
+        target = describe(conn)
+    finally:
+        conn.close()
+
+    from app import app
+    cookies = session_cookies(app, target)
+    server = None
+    if args.target == 'gunicorn':
+        server = start_gunicorn(args.port, args.workers, env)
+        driver = HttpDriver('127.0.0.1', args.port)
+    else:
+        driver = InProcessDriver(app)
+
+    selected = set(args.only.split(',')) if args.only else None
+    results = {}
+    skipped = {}
+    try:
+        for name, scenario in SCENARIOS.items():
+            if selected and name not in selected:
+                continue
+            reason = skip_reason(scenario, target, cookies)
+            if reason:
+                skipped[name] = reason
+                continue
+            results[name] = run_scenario(driver, scenario, target, cookies, args.requests, args.concurrency, args.warmup)
+            print_result(name, results[name])
+        for name, func in MICRO_BENCHMARKS.items():
+            if selected and name not in selected:
+                continue
+            results[name] = run_micro(func, args.iterations, args.warmup)
+            print_result(name, results[name])
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+    for name, reason in skipped.items():
+        print(f'{name}: skipped ({reason})')
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': git_commit(),
+            'target': args.target,
+            'workers': args.workers if args.target == 'gunicorn' else None,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'iterations': args.iterations,
+            'dataset_leads': target['leads'],
+            'python': platform.python_version(),
+            'platform': platform.platform()
+        },
+        'results': results,
+        'skipped': skipped
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{args.target}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f'Results written to {output}')
+
+    if args.compare:
+        return compare_files(args.compare, output, args.threshold)
+    return 0
+
+def print_result(name, result):
+    print(f"{name:36} p50 {result['p50_ms']:9.3f}ms  p95 {result['p95_ms']:9.3f}ms  "
+          f"p99 {result['p99_ms']:9.3f}ms  {result['throughput_rps']:10.1f}/s"
+          + (f"  {result['errors']} errors" if result['errors'] else ''))
+
+# A benchmark regresses when its p50 or p95 grows, or its throughput drops,
+# by more than threshold percent, or when it starts returning errors.
+def compare(baseline, current, threshold):
+    regressions = []
+    rows = []
+    for name in sorted(set(baseline['results']) & set(current['results'])):
+        old, new = baseline['results'][name], current['results'][name]
+        problems = []
+        for metric in ('p50_ms', 'p95_ms'):
+            if old[metric] and new[metric] > old[metric] * (1 + threshold / 100):
+                problems.append(f'{metric} {old[metric]:.3f} -> {new[metric]:.3f}')
+        if old['throughput_rps'] and new['throughput_rps'] < old['throughput_rps'] * (1 - threshold / 100):
+            problems.append(f"throughput {old['throughput_rps']:.1f} -> {new['throughput_rps']:.1f}/s")
+        if new['errors'] > old['errors']:
+            problems.append(f"errors {old['errors']} -> {new['errors']}")
+        change = (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 if old['p95_ms'] else 0.0
+        rows.append((name, old['p95_ms'], new['p95_ms'], change, problems))
+        if problems:
+            regressions.append((name, problems))
+    return rows, regressions
+
+def compare_files(baseline_path, current_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+    rows, regressions = compare(baseline, current, threshold)
+    print(f'Comparing {current_path} against {baseline_path} (threshold {threshold:g}%)')
+    for name, old, new, change, problems in rows:
+        flag = 'REGRESSION' if problems else ''
+        print(f'{name:36} p95 {old:9.3f}ms -> {new:9.3f}ms  {change:+7.1f}%  {flag}')
+    for name, problems in regressions:
+        print(f"  {name}: {'; '.join(problems)}")
+    if regressions:
+        print(f'{len(regressions)} regression{"" if len(regressions) == 1 else "s"} beyond {threshold:g}%.')
+        return 1
+    print('No regressions.')
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Benchmark the application hot paths.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks and write a JSON report')
+    run_parser.add_argument('--target', choices=('inprocess', 'gunicorn'), default='inprocess')
+    run_parser.add_argument('--database', help='Existing database to run against (default: a fresh fixture)')
+    run_parser.add_argument('--leads', type=int, default=20000, help='Leads in the generated fixture')
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+    run_parser.add_argument('--concurrency', type=int, default=1)
+    run_parser.add_argument('--iterations', type=int, default=2000, help='Calls per micro-benchmark')
+    run_parser.add_argument('--warmup', type=int, default=20)
+    run_parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    run_parser.add_argument('--port', type=int, default=8765)
+    run_parser.add_argument('--only', help='Comma-separated benchmark names')
+    run_parser.add_argument('--output', help='Report path (default: benchmarks/results/<target>-<time>.json)')
+    run_parser.add_argument('--compare', help='Baseline report to compare the new results against')
+    run_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Regression threshold in percent')
+
+    compare_parser = commands.add_parser('compare', help='Compare two JSON reports')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+    if args.command == 'compare':
+        sys.exit(compare_files(args.baseline, args.current, args.threshold))
+    sys.exit(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import random
+import secrets
+import uuid
+from datetime import datetime, timedelta
+from werkzeug.security import generate_password_hash
+
+from db import get_db_connection, init_database
+from pagination import encode_cursor
+
+FIXTURE_SLUG = 'bench-co'
+FIXTURE_SALES_PEOPLE = 5
+FIXTURE_SOURCES = ('facebook_ads', 'google_ads', 'website', 'api', 'contact_form', 'card_call')
+FIXTURE_STATUSES = ('new', 'contacted', 'follow_up', 'interested', 'converted', 'closed')
+BATCH_SIZE = 5000
+
+# A small tenant for benchmarking against an empty database: one pro company
+# with sales people, a card, an API key and `leads` leads spread over the
+# last year. Deterministic for a given seed.
+def build_fixture(leads=20000, seed=1):
+    init_database()
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    timestamp = now.strftime('%Y-%m-%d %H:%M:%S')
+    password_hash = generate_password_hash(secrets.token_hex(16))
+    conn = get_db_connection()
+    try:
+        if conn.execute('SELECT id FROM companies WHERE slug = ?', (FIXTURE_SLUG,)).fetchone():
+            return
+        conn.execute('''
+            INSERT INTO master_settings (platform_name, master_name, master_footer) VALUES (?, ?, ?)
+        ''', ('Benchmark Platform', 'Benchmark', 'Benchmark'))
+        conn.execute('''
+            INSERT INTO users (uid, username, email, password_hash, role) VALUES (?, ?, ?, ?, 'master_admin')
+        ''', (str(uuid.uuid4()), 'bench-master', 'master@bench.test', password_hash))
+        company_id = conn.execute('''
+            INSERT INTO companies (uid, name, slug, email, plan, plan_expiry_date, cards_limit, white_label_enabled)
+            VALUES (?, ?, ?, ?, 'pro', ?, -1, 1)
+        ''', (str(uuid.uuid4()), 'Bench Co', FIXTURE_SLUG, 'admin@bench.test',
+              (now + timedelta(days=365)).strftime('%Y-%m-%d %H:%M:%S'))).lastrowid
+        users = [('bench-admin', 'company_admin')]
+        users += [(f'bench-sales-{i}', 'sales_person') for i in range(1, FIXTURE_SALES_PEOPLE + 1)]
+        conn.executemany('''
+            INSERT INTO users (uid, username, email, password_hash, role, company_id) VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(str(uuid.uuid4()), username, f'{username}@bench.test', password_hash, role, company_id)
+              for username, role in users])
+        sales_ids = [row[0] for row in conn.execute(
+            "SELECT id FROM users WHERE company_id = ? AND role = 'sales_person' ORDER BY id", (company_id,))]
+        conn.execute('''
+            INSERT INTO visiting_cards (uid, user_id, company_id, name, designation, phone, email)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (str(uuid.uuid4()), sales_ids[0], company_id, 'Bench Sales', 'Sales Manager', '9800000000', 'sales@bench.test'))
+        conn.execute('INSERT INTO api_keys (company_id, key, name, source_type) VALUES (?, ?, ?, ?)',
+                     (company_id, f'bench_{secrets.token_hex(16)}', 'Benchmark', 'api'))
+
+        rows = []
+        for i in range(leads):
+            created = now - timedelta(seconds=rng.randrange(365 * 86400))
+            status = rng.choice(FIXTURE_STATUSES)
+            assigned_to = rng.choice(sales_ids) if rng.random() < 0.7 else None
+            follow_up = None
+            if status == 'follow_up' and assigned_to:
+                follow_up = (now + timedelta(days=rng.randint(-30, 30))).strftime('%Y-%m-%d 10:00:00')
+            phone = f'9{rng.randrange(10 ** 9):09d}'
+            rows.append((str(uuid.uuid4()), f'Lead {i}', phone, f'+91{phone}', f'lead{i}@example.com',
+                         rng.choice(FIXTURE_SOURCES), company_id, assigned_to, status, follow_up,
+                         created.strftime('%Y-%m-%d %H:%M:%S'), timestamp))
+            if len(rows) == BATCH_SIZE:
+                insert_leads(conn, rows)
+                rows = []
+        insert_leads(conn, rows)
+        conn.commit()
+    finally:
+        conn.close()
+
+def insert_leads(conn, rows):
+    conn.executemany('''
+        INSERT INTO leads (uid, name, phone, phone_norm, email, source, company_id, assigned_to, status,
+                           follow_up_date, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', rows)
+
+# The users, card, API key and deep-page cursor the scenarios run as, taken
+# from the company with the most leads, so a generated dataset works as well
+# as the fixture.
+def describe(conn):
+    company = conn.execute('''
+        SELECT c.id, c.slug, COALESCE(s.total_leads, 0) AS leads FROM companies c
+        LEFT JOIN company_stats s ON s.company_id = c.id
+        WHERE c.is_active = 1 ORDER BY leads DESC LIMIT 1
+    ''').fetchone()
+    if company is None:
+        raise LookupError('No active company to benchmark against')
+    company_id = company['id']
+
+    def user(role, company_id=None):
+        query = 'SELECT id, role, company_id FROM users WHERE role = ? AND is_active = 1'
+        params = [role]
+        if company_id is not None:
+            query += ' AND company_id = ?'
+            params.append(company_id)
+        row = conn.execute(query + ' ORDER BY id LIMIT 1', params).fetchone()
+        return dict(row) if row else None
+
+    card = conn.execute('SELECT uid FROM visiting_cards WHERE company_id = ? AND is_active = 1 ORDER BY id LIMIT 1',
+                        (company_id,)).fetchone()
+    api_key = conn.execute('SELECT key FROM api_keys WHERE company_id = ? AND is_active = 1 ORDER BY id LIMIT 1',
+                           (company_id,)).fetchone()
+    deep = conn.execute('''
+        SELECT created_at, id FROM leads WHERE company_id = ? ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?
+    ''', (company_id, company['leads'] * 4 // 5)).fetchone()
+    return {
+        'company_id': company_id,
+        'slug': company['slug'],
+        'leads': company['leads'],
+        'users': {
+            'master_admin': user('master_admin'),
+            'company_admin': user('company_admin', company_id),
+            'sales_person': user('sales_person', company_id)
+        },
+        'card_uid': card['uid'] if card else None,
+        'api_key': api_key['key'] if api_key else None,
+        'deep_cursor': encode_cursor(deep['created_at'], deep['id']) if deep else None
+    }
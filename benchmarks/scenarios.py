@@ -0,0 +1,112 @@
+import itertools
+import json
+
+from paytm_checksum import generate_checksum, verify_checksum
+
+_phones = itertools.count(1)
+
+def unique_phone():
+    return f'7{next(_phones):09d}'
+
+def json_body(data):
+    return json.dumps(data).encode('utf-8'), 'application/json'
+
+def google_ads_payload():
+    return json_body({'campaign_id': 'bench', 'lead_form_submit_data': {'user_column_data': [
+        {'column_id': 'FULL_NAME', 'string_value': 'Bench Lead'},
+        {'column_id': 'PHONE_NUMBER', 'string_value': unique_phone()}
+    ]}})
+
+def facebook_payload():
+    return json_body({'entry': [{'changes': [{'value': {'form_id': 'bench', 'field_data': [
+        {'name': 'full_name', 'values': ['Bench Lead']},
+        {'name': 'phone_number', 'values': [unique_phone()]}
+    ]}}]}]})
+
+# HTTP scenarios against the hot endpoints. `path` takes the target from
+# fixture.describe(); `role` picks the session the request is sent with and
+# `api_key` adds the tenant's key. Bodies are rebuilt per request so lead
+# writes never collapse into duplicate merges.
+SCENARIOS = {
+    'card.view_card': {
+        'path': lambda target: f"/card/{target['card_uid']}",
+        'requires': 'card_uid'
+    },
+    'card.get_qr_code': {
+        'path': lambda target: f"/card/{target['card_uid']}/qr",
+        'requires': 'card_uid'
+    },
+    'api.create_lead': {
+        'method': 'POST',
+        'path': lambda target: '/api/v1/leads',
+        'body': lambda: json_body({'name': 'Bench Lead', 'phone': unique_phone(), 'source': 'api'}),
+        'api_key': True,
+        'status': (200, 201)
+    },
+    'api.google_ads_webhook': {
+        'method': 'POST',
+        'path': lambda target: '/api/v1/webhook/google-ads',
+        'body': google_ads_payload,
+        'api_key': True,
+        'status': (202,)
+    },
+    'api.facebook_webhook': {
+        'method': 'POST',
+        'path': lambda target: '/api/v1/webhook/facebook',
+        'body': facebook_payload,
+        'api_key': True,
+        'status': (202,)
+    },
+    'api.generic_webhook': {
+        'method': 'POST',
+        'path': lambda target: '/api/v1/webhook/generic',
+        'body': lambda: json_body({'name': 'Bench Lead', 'phone': unique_phone()}),
+        'api_key': True,
+        'status': (202,)
+    },
+    'company.leads': {
+        'path': lambda target: '/admin/leads',
+        'role': 'company_admin'
+    },
+    'company.leads.deep': {
+        'path': lambda target: f"/admin/leads?cursor={target['deep_cursor']}",
+        'role': 'company_admin',
+        'requires': 'deep_cursor'
+    },
+    'company.export_leads': {
+        'path': lambda target: '/admin/leads/export',
+        'role': 'company_admin',
+        'requests': 10
+    },
+    'company.dashboard': {
+        'path': lambda target: '/admin/dashboard',
+        'role': 'company_admin'
+    },
+    'sales.dashboard': {
+        'path': lambda target: '/sales/dashboard',
+        'role': 'sales_person'
+    },
+    'master.dashboard': {
+        'path': lambda target: '/master/dashboard',
+        'role': 'master_admin'
+    }
+}
+
+PAYTM_KEY = 'bench&key#1234ab'
+PAYTM_PARAMS = {
+    'MID': 'BENCH000000000000000',
+    'ORDER_ID': 'ORDER_BENCH_0001',
+    'CUST_ID': 'COMPANY_1',
+    'TXN_AMOUNT': '4999.00',
+    'CHANNEL_ID': 'WEB',
+    'WEBSITE': 'WEBSTAGING',
+    'INDUSTRY_TYPE_ID': 'Retail',
+    'CALLBACK_URL': 'https://example.com/payment/callback'
+}
+PAYTM_CHECKSUM = generate_checksum(PAYTM_PARAMS, PAYTM_KEY)
+
+# Function-level benchmarks, timed per call in-process.
+MICRO_BENCHMARKS = {
+    'paytm_checksum.generate_checksum': lambda: generate_checksum(PAYTM_PARAMS, PAYTM_KEY),
+    'paytm_checksum.verify_checksum': lambda: verify_checksum(PAYTM_PARAMS, PAYTM_KEY, PAYTM_CHECKSUM)
+}
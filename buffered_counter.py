@@ -0,0 +1,84 @@
+import atexit
+import threading
+from abc import ABC, abstractmethod
+
+from db import get_db_connection
+
+# Accumulates increments in memory and writes them in one transaction when
+# the buffer reaches flush_threshold, every flush_interval seconds, and at
+# process exit. Subclasses implement write(conn, batch); a subclass without
+# it fails when it is instantiated rather than in the flush thread.
+class BufferedCounter(ABC):
+    def __init__(self, name, flush_interval=5, flush_threshold=500):
+        self.name = name
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.flush_count = 0
+        self.error_count = 0
+        self._pending = {}
+        self._pending_total = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    @abstractmethod
+    def write(self, conn, batch):
+        pass
+
+    def merge(self, current, amount):
+        return (current or 0) + amount
+
+    def size(self, amount):
+        return 1
+
+    def add(self, key, amount=1):
+        with self._lock:
+            self._pending[key] = self.merge(self._pending.get(key), amount)
+            self._pending_total += self.size(amount)
+            should_flush = self._pending_total >= self.flush_threshold
+        self._ensure_timer()
+        if should_flush:
+            self.flush()
+
+    def pending(self):
+        return self._pending_total
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+            batch_total, self._pending_total = self._pending_total, 0
+        conn = None
+        try:
+            conn = get_db_connection()
+            self.write(conn, batch)
+            conn.commit()
+            self.flush_count += 1
+            return len(batch)
+        except Exception as e:
+            if conn is not None:
+                conn.rollback()
+            self.error_count += 1
+            with self._lock:
+                for key, amount in batch.items():
+                    self._pending[key] = self.merge(self._pending.get(key), amount)
+                self._pending_total += batch_total
+            print(f"{self.name} flush error: {e}")
+            return 0
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def _ensure_timer(self):
+        if self._timer is not None:
+            return
+        with self._lock:
+            if self._timer is None:
+                self._timer = threading.Thread(target=self._run, name=f'{self.name}-flush', daemon=True)
+                self._timer.start()
+
+    def _run(self):
+        stop = threading.Event()
+        while not stop.wait(self.flush_interval):
+            self.flush()
@@ -0,0 +1,84 @@
+import threading
+import time
+from flask import g, session
+
+from db import get_request_db as get_db
+
+MISSING = object()
+
+_stats = {}
+
+def record(name, hit):
+    counters = _stats.setdefault(name, [0, 0])
+    counters[0 if hit else 1] += 1
+
+def cache_stats():
+    stats = {}
+    for name, (hits, misses) in list(_stats.items()):
+        total = hits + misses
+        stats[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 4) if total else 0.0
+        }
+    return stats
+
+class TTLCache:
+    def __init__(self, name, ttl=60, max_size=None):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            record(self.name, True)
+            return entry[1]
+        record(self.name, False)
+        return MISSING
+
+    def set(self, key, value):
+        with self._lock:
+            if self.max_size and len(self._data) >= self.max_size and key not in self._data:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (time.monotonic() + self.ttl, value)
+        return value
+
+    def invalidate(self, key=MISSING):
+        with self._lock:
+            if key is MISSING:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+settings_cache = TTLCache('master_settings', ttl=300)
+
+def get_master_settings():
+    settings = settings_cache.get('settings')
+    if settings is MISSING:
+        settings = settings_cache.set('settings', get_db().execute('SELECT * FROM master_settings LIMIT 1').fetchone())
+    return settings
+
+def invalidate_master_settings():
+    settings_cache.invalidate()
+
+def get_session_user():
+    user_id = session.get('user_id')
+    if user_id is None:
+        return None
+    cached = g.get('_current_user')
+    if cached is not None and cached[0] == user_id:
+        record('session_user', True)
+        return cached[1]
+    record('session_user', False)
+    user = get_db().execute('SELECT * FROM users WHERE id = ? AND is_active = 1', (user_id,)).fetchone()
+    g._current_user = (user_id, user)
+    return user
+
+def invalidate_session_user():
+    g.pop('_current_user', None)
@@ -10,6 +10,21 @@ class Config:
     PAYTM_CHANNEL_ID = os.environ.get('PAYTM_CHANNEL_ID', 'WEB')
     PAYTM_ENVIRONMENT = os.environ.get('PAYTM_ENVIRONMENT', 'staging')
     
+    PLAN_EXPIRY_SCHEDULER = os.environ.get('PLAN_EXPIRY_SCHEDULER', '0') == '1'
+    FOLLOW_UP_REMINDERS = os.environ.get('FOLLOW_UP_REMINDERS', '0') == '1'
+    PAGE_CACHE_WARM_TENANTS = int(os.environ.get('PAGE_CACHE_WARM_TENANTS', '0'))
+    SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '500'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # Live notification streams hold a worker for as long as a tab is open, so
+    # they are only served when an async worker (gevent) is running the app.
+    SSE_ENABLED = os.environ.get('SSE_ENABLED', '0') == '1'
+    
+    APP_URL = os.environ.get('APP_URL', '')
+    STATIC_CARDS_DIR = os.environ.get('STATIC_CARDS_DIR', '')
+    STATIC_CARDS_URL = os.environ.get('STATIC_CARDS_URL', '')
+    
+    DEFAULT_COUNTRY_CODE = os.environ.get('DEFAULT_COUNTRY_CODE', '91')
+    
     PLANS = {
         'free': {
             'name': 'Free',
@@ -1,14 +1,183 @@
 import sqlite3
 import os
+import threading
+import time
 from contextlib import contextmanager
 
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'saas_platform.db')
+DATABASE_PATH = os.environ.get('DATABASE_PATH') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'saas_platform.db')
+
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '16'))
+POOL_TIMEOUT = 30
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+CONNECTION_PRAGMAS = [
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}",
+    "PRAGMA cache_size = -32000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY"
+]
+
+# close() hands the connection back to its pool instead of closing it, so
+# existing callers get pooling without changes. While a recorder is set (see
+# instrumentation.RequestMetrics) every statement is traced and every
+# execute() timed.
+class PooledConnection(sqlite3.Connection):
+    pool = None
+    checked_out = False
+    recorder = None
+
+    def set_recorder(self, recorder):
+        self.recorder = recorder
+        self.set_trace_callback(recorder.trace if recorder is not None else None)
+
+    def execute(self, sql, parameters=()):
+        if self.recorder is None:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self.recorder.record_sql(sql, time.perf_counter() - started)
+
+    def executemany(self, sql, parameters):
+        if self.recorder is None:
+            return super().executemany(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self.recorder.record_sql(sql, time.perf_counter() - started)
+
+    def close(self):
+        if self.pool is None:
+            return super().close()
+        self.pool.release(self)
+
+    def discard(self):
+        sqlite3.Connection.close(self)
+
+class ConnectionPool:
+    def __init__(self, path, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []
+        self.created = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.max_in_use = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, factory=PooledConnection, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            self.checkouts += 1
+            if not self._idle and self.created >= self.max_size:
+                self.waits += 1
+                started = time.monotonic()
+                deadline = started + self.timeout
+                while not self._idle and self.created >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._cond.wait(remaining):
+                        self.wait_seconds += time.monotonic() - started
+                        raise sqlite3.OperationalError('Timed out waiting for a database connection')
+                self.wait_seconds += time.monotonic() - started
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self.created += 1
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self.created -= 1
+                    self.in_use -= 1
+                    self._cond.notify()
+                raise
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        if not conn.checked_out:
+            return
+        conn.checked_out = False
+        if conn.recorder is not None:
+            conn.set_recorder(None)
+        reusable = True
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            reusable = False
+            conn.discard()
+        with self._cond:
+            self.in_use -= 1
+            if reusable and self._pid == os.getpid():
+                self._idle.append(conn)
+            else:
+                self.created -= 1
+            self._cond.notify()
+
+    def stats(self):
+        return {
+            'size': self.created,
+            'max_size': self.max_size,
+            'in_use': self.in_use,
+            'idle': len(self._idle),
+            'checkouts': self.checkouts,
+            'waits': self.waits,
+            'wait_seconds': round(self.wait_seconds, 4),
+            'max_in_use': self.max_in_use
+        }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None or _pool.path != DATABASE_PATH:
+        with _pool_lock:
+            if _pool is None or _pool.path != DATABASE_PATH:
+                _pool = ConnectionPool(DATABASE_PATH)
+    return _pool
+
+def pool_stats():
+    return get_pool().stats()
 
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    conn.execute("PRAGMA foreign_keys = ON")
-    return conn
+    return get_pool().acquire()
+
+def get_request_db():
+    from flask import g
+    if 'db' not in g:
+        g.db = get_db_connection()
+        metrics = g.get('request_metrics')
+        if metrics is not None:
+            metrics.attach(g.db)
+    return g.db
 
 @contextmanager
 def get_db():
@@ -22,6 +191,14 @@ def get_db():
     finally:
         conn.close()
 
+# Adds a column introduced after a database was first created.
+def ensure_column(cursor, table, column, definition):
+    columns = [row[1] for row in cursor.execute(f'PRAGMA table_xinfo({table})')]
+    if column in columns:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
 def init_database():
     os.makedirs(os.path.dirname(DATABASE_PATH), exist_ok=True)
     
@@ -79,6 +256,8 @@ def init_database():
             custom_logo TEXT,
             custom_footer TEXT,
             
+            duplicate_policy TEXT DEFAULT 'merge' CHECK(duplicate_policy IN ('merge', 'touch', 'insert')),
+            
             is_active INTEGER DEFAULT 1,
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
@@ -90,6 +269,7 @@ def init_database():
             uid TEXT UNIQUE NOT NULL,
             name TEXT,
             phone TEXT NOT NULL,
+            phone_norm TEXT,
             email TEXT,
             source TEXT NOT NULL,
             ip_address TEXT,
@@ -103,6 +283,8 @@ def init_database():
             
             follow_up_date TIMESTAMP,
             follow_up_time TEXT,
+            follow_up_day TEXT GENERATED ALWAYS AS (date(follow_up_date)) VIRTUAL,
+            follow_up_notified TIMESTAMP,
             last_contacted TIMESTAMP,
             
             created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
@@ -262,15 +444,104 @@ def init_database():
         )
     ''')
     
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS card_views_daily (
+            card_id INTEGER NOT NULL,
+            company_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            views INTEGER DEFAULT 0,
+            
+            PRIMARY KEY (card_id, day),
+            FOREIGN KEY (card_id) REFERENCES visiting_cards(id),
+            FOREIGN KEY (company_id) REFERENCES companies(id)
+        )
+    ''')
+    
+    ensure_column(cursor, 'companies', 'duplicate_policy', "TEXT DEFAULT 'merge' CHECK(duplicate_policy IN ('merge', 'touch', 'insert'))")
+    if ensure_column(cursor, 'leads', 'phone_norm', 'TEXT'):
+        from leads import backfill_phone_norm
+        backfill_phone_norm(conn)
+    ensure_column(cursor, 'leads', 'follow_up_day', 'TEXT GENERATED ALWAYS AS (date(follow_up_date)) VIRTUAL')
+    ensure_column(cursor, 'leads', 'follow_up_notified', 'TIMESTAMP')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_queue (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            company_id INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            source_type TEXT,
+            payload TEXT NOT NULL,
+            content_type TEXT,
+            ip_address TEXT,
+            received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_dead_letters (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            queue_id INTEGER,
+            company_id INTEGER,
+            kind TEXT NOT NULL,
+            source_type TEXT,
+            payload TEXT NOT NULL,
+            content_type TEXT,
+            ip_address TEXT,
+            error TEXT,
+            received_at TIMESTAMP,
+            failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_company ON users(company_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role ON users(role)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_company ON leads(company_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_assigned ON leads(assigned_to)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_status ON leads(status)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_company ON visiting_cards(company_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_user ON visiting_cards(user_id)")
-    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_company ON payments(company_id)")
     cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications(user_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_card_views_company_day ON card_views_daily(company_id, day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_company_created ON leads(company_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_assigned_created ON leads(assigned_to, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_created ON leads(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_created ON payments(created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_status_created ON payments(status, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_call_history_user_created ON call_history(user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_company_phone ON leads(company_id, phone_norm)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_company_source_created ON leads(company_id, source, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leads_follow_up_agenda ON leads(assigned_to, follow_up_day, follow_up_date, status)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cards_company_created ON visiting_cards(company_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_payments_company_created ON payments(company_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_call_history_lead_created ON call_history(lead_id, created_at)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_unread_created ON notifications(user_id, created_at) WHERE is_read = 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_companies_created ON companies(created_at)")
+    # Superseded by the wider indexes above, which start with the same
+    # columns; see query_plans.py. idx_notifications_user stays: ordered by
+    # rowid, it serves the event stream's catch-up by id.
+    for index in ('idx_cards_company', 'idx_payments_company', 'idx_notifications_unread', 'idx_leads_followup',
+                  'idx_leads_company', 'idx_leads_assigned'):
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leads_follow_up_pending ON leads(follow_up_date)
+        WHERE follow_up_date IS NOT NULL AND assigned_to IS NOT NULL AND status NOT IN ('converted', 'closed')
+    ''')
+    
+    # Once planner statistics exist they have to cover every index: one
+    # without a sqlite_stat1 row looks more selective than it is and gets
+    # picked over the index a query was written for. See query_plans.py.
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone():
+        unanalyzed = cursor.execute('''
+            SELECT name FROM sqlite_master WHERE type = 'index'
+                AND name NOT IN (SELECT idx FROM sqlite_stat1 WHERE idx IS NOT NULL)
+        ''').fetchall()
+        for (index,) in unanalyzed:
+            cursor.execute(f'ANALYZE {index}')
+    
+    from stats import create_stats_schema
+    create_stats_schema(conn)
+    from rollups import create_rollup_schema
+    create_rollup_schema(conn)
+    from search import create_search_schema
+    create_search_schema(conn)
     
     conn.commit()
     conn.close()
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from cache import MISSING, TTLCache
+from db import get_request_db as get_db
+from page_cache import invalidate_company_pages
+from static_cards import company_cards_changed
+
+RELOAD_INTERVAL = 300
+MISS_TTL = 30
+INDEX_COLUMNS = 'id, slug, custom_domain, white_label_enabled'
+
+def normalize_domain(value):
+    value = (value or '').strip().lower()
+    if '://' in value:
+        value = value.split('://', 1)[1]
+    value = value.split('/', 1)[0].split(':', 1)[0].rstrip('.')
+    if value.startswith('www.'):
+        value = value[4:]
+    return value
+
+# Slug and custom-domain lookups for active companies, held in memory so
+# resolving a microsite request never queries the database. Entries carry
+# only what routing and the page cache key need; the full row is loaded when
+# a page is actually rendered. Edits refresh single entries through
+# company_changed(); a slug or domain this worker hasn't seen yet (created,
+# renamed or reactivated in another worker) is looked up once and added, and
+# unknown ones are remembered for MISS_TTL seconds. The periodic reload
+# drops entries other workers deactivated.
+class DomainIndex:
+    def __init__(self):
+        self._by_id = {}
+        self._by_slug = {}
+        self._by_domain = {}
+        self._misses = TTLCache('domain_misses', ttl=MISS_TTL, max_size=10000)
+        self._lock = threading.Lock()
+        self._loaded_at = None
+
+    def needs_reload(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > RELOAD_INTERVAL
+
+    def load(self, db):
+        rows = db.execute(f'SELECT {INDEX_COLUMNS} FROM companies WHERE is_active = 1').fetchall()
+        by_id, by_slug, by_domain = {}, {}, {}
+        for row in rows:
+            entry = dict(row)
+            by_id[entry['id']] = entry
+            by_slug[entry['slug']] = entry
+            if normalize_domain(entry['custom_domain']):
+                by_domain[normalize_domain(entry['custom_domain'])] = entry
+        with self._lock:
+            self._by_id, self._by_slug, self._by_domain = by_id, by_slug, by_domain
+            self._loaded_at = time.monotonic()
+
+    def ensure_loaded(self):
+        if self.needs_reload():
+            self.load(get_db())
+
+    # Both must be called with self._lock held.
+    def _remove(self, company_id):
+        old = self._by_id.pop(company_id, None)
+        if old is not None:
+            self._by_slug.pop(old['slug'], None)
+            self._by_domain.pop(normalize_domain(old['custom_domain']), None)
+        return old
+
+    def _add(self, entry):
+        self._by_id[entry['id']] = entry
+        self._by_slug[entry['slug']] = entry
+        if normalize_domain(entry['custom_domain']):
+            self._by_domain[normalize_domain(entry['custom_domain'])] = entry
+        self._misses.invalidate(('slug', entry['slug']))
+        self._misses.invalidate(('custom_domain', normalize_domain(entry['custom_domain'])))
+
+    # Re-reads one company and returns the slugs it was and is reachable at.
+    def refresh(self, db, company_id):
+        row = db.execute(f'SELECT {INDEX_COLUMNS}, is_active FROM companies WHERE id = ?', (company_id,)).fetchone()
+        with self._lock:
+            old = self._remove(company_id)
+            if row is not None and row['is_active']:
+                self._add({key: row[key] for key in INDEX_COLUMNS.split(', ')})
+        return {company['slug'] for company in (old, row) if company is not None}
+
+    def _lookup(self, column, value):
+        if not value or self._misses.get((column, value)) is not MISSING:
+            return None
+        row = get_db().execute(f'SELECT {INDEX_COLUMNS} FROM companies WHERE {column} = ? AND is_active = 1',
+                               (value,)).fetchone()
+        if row is None:
+            self._misses.set((column, value), True)
+            return None
+        entry = dict(row)
+        with self._lock:
+            self._remove(entry['id'])
+            self._add(entry)
+        return entry
+
+    def by_slug(self, slug):
+        self.ensure_loaded()
+        return self._by_slug.get(slug) or self._lookup('slug', slug)
+
+    def by_host(self, host):
+        self.ensure_loaded()
+        domain = normalize_domain(host)
+        return self._by_domain.get(domain) or self._lookup('custom_domain', domain)
+
+    def stats(self):
+        return {'companies': len(self._by_id), 'domains': len(self._by_domain)}
+
+domain_index = DomainIndex()
+
+def resolve_slug(slug):
+    return domain_index.by_slug(slug)
+
+def resolve_host(host):
+    return domain_index.by_host(host)
+
+# Call after committing a change to a company's slug, custom domain,
+# white-label state or active flag. Also republishes the company's static
+# cards, which show its name, colours and white-label state.
+def company_changed(db, company_id):
+    for slug in domain_index.refresh(db, company_id):
+        invalidate_company_pages(slug)
+    company_cards_changed(company_id)
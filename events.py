@@ -0,0 +1,207 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from db import get_db_connection
+
+POLL_INTERVAL = 2.0
+HEARTBEAT_INTERVAL = 15
+STREAM_LIFETIME = 1800
+RETRY_MS = 5000
+QUEUE_SIZE = 100
+CATCH_UP_LIMIT = 100
+
+NOTIFICATION_COLUMNS = 'id, user_id, title, message, type, link, created_at'
+UNREAD_COUNT_QUERY = 'SELECT COUNT(*) FROM notifications WHERE user_id = ? AND is_read = 0'
+POLL_QUERY = f'SELECT {NOTIFICATION_COLUMNS} FROM notifications WHERE id > ? ORDER BY id LIMIT 1000'
+CATCH_UP_QUERY = f'SELECT {NOTIFICATION_COLUMNS} FROM notifications WHERE user_id = ? AND id > ? ORDER BY id DESC LIMIT ?'
+
+# Streams only scale when gevent has patched the standard library, as the
+# gunicorn gevent worker does before loading the app.
+def async_worker_active():
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+def unread_count(db, user_id):
+    return db.execute(UNREAD_COUNT_QUERY, (user_id,)).fetchone()[0]
+
+def unread_counts_query(count):
+    placeholders = ', '.join('?' * count)
+    return f'SELECT user_id, COUNT(*) FROM notifications WHERE user_id IN ({placeholders}) AND is_read = 0 GROUP BY user_id'
+
+def unread_counts(db, user_ids):
+    rows = db.execute(unread_counts_query(len(user_ids)), list(user_ids)).fetchall()
+    return {user_id: 0 for user_id in user_ids} | {row[0]: row[1] for row in rows}
+
+def notification_event(notification, unread=None):
+    data = {key: notification[key] for key in ('id', 'title', 'message', 'type', 'link', 'created_at')}
+    if unread is not None:
+        data['unread'] = unread
+    event = 'lead_assigned' if notification['type'] == 'lead_assigned' else 'notification'
+    return notification['id'], event, data
+
+def format_event(event_id, event, data):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return '\n'.join(lines) + '\n\n'
+
+class Subscription:
+    def __init__(self, user_id, last_id):
+        self.user_id = user_id
+        self.last_id = last_id
+        self.events = deque()
+        self.overflowed = False
+        self._ready = threading.Event()
+
+    def put(self, event):
+        if event[0] is not None and event[0] <= self.last_id:
+            return
+        if len(self.events) >= QUEUE_SIZE:
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self._ready.set()
+
+    def get(self, timeout):
+        self._ready.wait(timeout)
+        self._ready.clear()
+        events = []
+        while self.events:
+            event = self.events.popleft()
+            if event[0] is not None:
+                if event[0] <= self.last_id:
+                    continue
+                self.last_id = event[0]
+            events.append(event)
+        return events
+
+# In-process fan-out of new notifications to connected users. One thread per
+# process follows notifications by id (a primary key range read), so rows
+# written by any worker reach every stream and idle connections cost no
+# queries. Streams wait on their own Subscription; under a gevent worker both
+# are greenlets, so open connections don't pin OS threads.
+class EventHub:
+    def __init__(self):
+        self.high_water = None
+        self.dispatched = 0
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    # A stream without a last_id starts at the hub's current position.
+    def subscribe(self, db, user_id, last_id=None):
+        with self._lock:
+            if not self._subscribers:
+                self.high_water = db.execute('SELECT COALESCE(MAX(id), 0) FROM notifications').fetchone()[0]
+            subscription = Subscription(user_id, self.high_water if last_id is None else last_id)
+            self._subscribers[user_id].add(subscription)
+        self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    # Called after committing a notification so local streams see it without
+    # waiting for the next poll.
+    def notify(self):
+        self._wake.set()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-hub', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(POLL_INTERVAL)
+            self._wake.clear()
+            if not self._subscribers:
+                continue
+            conn = get_db_connection()
+            try:
+                self.poll(conn)
+            except Exception as e:
+                print(f"Event hub error: {e}")
+            finally:
+                conn.close()
+
+    def poll(self, conn):
+        rows = conn.execute(POLL_QUERY, (self.high_water,)).fetchall()
+        if not rows:
+            return 0
+        self.high_water = rows[-1]['id']
+        with self._lock:
+            listeners = {row['user_id'] for row in rows if row['user_id'] in self._subscribers}
+        if listeners:
+            counts = unread_counts(conn, listeners)
+            with self._lock:
+                for row in rows:
+                    for subscription in self._subscribers.get(row['user_id'], ()):
+                        subscription.put(notification_event(row, counts[row['user_id']]))
+        self.dispatched += len(rows)
+        if len(rows) == 1000:
+            self._wake.set()
+        return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'users': len(self._subscribers),
+                'connections': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'high_water': self.high_water,
+                'dispatched': self.dispatched
+            }
+
+event_hub = EventHub()
+
+def notify():
+    event_hub.notify()
+
+# The SSE body for one connection: a retry hint, the notifications missed
+# since last_id (the newest CATCH_UP_LIMIT of them) and the unread count, then
+# live events with a heartbeat comment while idle. The stream ends after
+# STREAM_LIFETIME, or early if the client falls QUEUE_SIZE events behind, and
+# the browser reconnects with Last-Event-ID. Everything that needs the
+# database happens up front; close() is called by the server even if the
+# client goes away before the first chunk.
+class EventStream:
+    def __init__(self, db, user_id, last_id=None):
+        self.subscription = event_hub.subscribe(db, user_id, last_id)
+        unread = unread_count(db, user_id)
+        missed = []
+        if last_id is not None:
+            missed = db.execute(CATCH_UP_QUERY, (user_id, last_id, CATCH_UP_LIMIT)).fetchall()[::-1]
+            if missed:
+                self.subscription.last_id = max(self.subscription.last_id, missed[-1]['id'])
+        self.initial = [f'retry: {RETRY_MS}\n\n']
+        self.initial.extend(format_event(*notification_event(row, unread)) for row in missed)
+        self.initial.append(format_event(None, 'unread', {'unread': unread}))
+
+    def __iter__(self):
+        yield ''.join(self.initial)
+        deadline = time.monotonic() + STREAM_LIFETIME
+        while time.monotonic() < deadline and not self.subscription.overflowed:
+            events = self.subscription.get(HEARTBEAT_INTERVAL)
+            if events:
+                yield ''.join(format_event(*event) for event in events)
+            else:
+                yield ': ping\n\n'
+
+    def close(self):
+        event_hub.unsubscribe(self.subscription)
@@ -0,0 +1,80 @@
+import csv
+import io
+import tempfile
+from flask import Response, send_file
+
+from db import get_db_connection
+
+LEAD_EXPORT_HEADERS = ['Name', 'Phone', 'Email', 'Source', 'Status', 'Assigned To', 'Remarks', 'Follow-up Date', 'Created']
+PLATFORM_LEAD_EXPORT_HEADERS = ['Company'] + LEAD_EXPORT_HEADERS
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+FETCH_SIZE = 1000
+CSV_CHUNK_SIZE = 64 * 1024
+
+def lead_export_row(lead):
+    return [
+        lead['name'] or '',
+        lead['phone'],
+        lead['email'] or '',
+        lead['source'],
+        lead['status'],
+        lead['assigned_username'] or 'Unassigned',
+        lead['remarks'] or '',
+        lead['follow_up_date'] or '',
+        lead['created_at']
+    ]
+
+def platform_lead_export_row(lead):
+    return [lead['company_name'] or ''] + lead_export_row(lead)
+
+def iter_cursor(cursor):
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        yield from rows
+
+# Exports use their own connection because the request's connection is
+# closed at teardown, before a streamed response body is consumed.
+def csv_response(query, params, headers, row_fn, filename):
+    def generate():
+        conn = get_db_connection()
+        try:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(headers)
+            for row in iter_cursor(conn.execute(query, params)):
+                writer.writerow(row_fn(row))
+                if buffer.tell() >= CSV_CHUNK_SIZE:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+            yield buffer.getvalue()
+        finally:
+            conn.close()
+
+    response = Response(generate(), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+def xlsx_response(query, params, headers, row_fn, filename, title='Leads'):
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(headers)
+    conn = get_db_connection()
+    try:
+        for row in iter_cursor(conn.execute(query, params)):
+            ws.append(row_fn(row))
+    finally:
+        conn.close()
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
+    output.seek(0)
+    return send_file(output, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name=filename)
+
+def export_response(query, params, format_type, headers, row_fn, basename):
+    if format_type == 'excel':
+        return xlsx_response(query, params, headers, row_fn, f'{basename}.xlsx')
+    return csv_response(query, params, headers, row_fn, f'{basename}.csv')
@@ -0,0 +1,63 @@
+from datetime import datetime
+
+AGENDA_COLUMNS = 'id, uid, name, phone, status, follow_up_date, follow_up_time, follow_up_day'
+CLOSED_STATUSES = ('converted', 'closed')
+CLOSED_SQL = ', '.join(f"'{status}'" for status in CLOSED_STATUSES)
+COUNT_CAP = 1000
+
+# Each bucket is a range on leads.follow_up_day, so with
+# idx_leads_follow_up_agenda (assigned_to, follow_up_day, follow_up_date,
+# status) both the page and the count are index range scans, already in
+# bucket order, that never touch the rest of a sales person's history.
+AGENDA_BUCKETS = {
+    'today': {
+        'where': 'follow_up_day = ?',
+        'order': 'follow_up_date',
+        'limit': 50
+    },
+    'upcoming': {
+        'where': 'follow_up_day > ?',
+        'order': 'follow_up_day, follow_up_date',
+        'limit': 20
+    },
+    'missed': {
+        'where': f"follow_up_day < ? AND status NOT IN ({CLOSED_SQL})",
+        'order': 'follow_up_day DESC, follow_up_date DESC',
+        'limit': 50
+    }
+}
+
+# Counts are capped at COUNT_CAP so a long backlog of missed follow-ups
+# costs no more than COUNT_CAP index entries to report.
+def count_query(bucket):
+    return f"SELECT COUNT(*) FROM (SELECT 1 FROM leads WHERE assigned_to = ? AND {bucket['where']} LIMIT ?)"
+
+def agenda_query(bucket):
+    return f'''
+        SELECT {AGENDA_COLUMNS} FROM leads WHERE assigned_to = ? AND {bucket['where']}
+        ORDER BY {bucket['order']} LIMIT ?
+    '''
+
+def bucket_count(db, bucket, params):
+    return db.execute(count_query(bucket), params + (COUNT_CAP,)).fetchone()[0]
+
+def follow_up_agenda(db, user_id, today=None, limit=None):
+    today = today or datetime.utcnow().strftime('%Y-%m-%d')
+    agenda = {'date': today}
+    for name, bucket in AGENDA_BUCKETS.items():
+        params = (user_id, today)
+        leads = db.execute(agenda_query(bucket), params + (limit or bucket['limit'],)).fetchall()
+        count = bucket_count(db, bucket, params)
+        agenda[name] = {'leads': leads, 'count': count, 'capped': count >= COUNT_CAP}
+    return agenda
+
+def serialize_agenda(agenda):
+    data = {'date': agenda['date']}
+    for name in AGENDA_BUCKETS:
+        bucket = agenda[name]
+        data[name] = {
+            'count': bucket['count'],
+            'capped': bucket['capped'],
+            'leads': [dict(lead) for lead in bucket['leads']]
+        }
+    return data
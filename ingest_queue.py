@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+import json
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+from db import get_db_connection
+from leads import ingest_leads
+
+BATCH_SIZE = 1000
+GROUP_COMMIT_DELAY = 0.05
+POLL_INTERVAL = 1.0
+
+def parse_payload(item):
+    if item['content_type'] == 'application/x-www-form-urlencoded':
+        return dict(parse_qsl(item['payload']))
+    data = json.loads(item['payload'] or 'null')
+    if not isinstance(data, dict):
+        raise ValueError('Expected a JSON object')
+    return data
+
+def parse_google_ads(data, source_type):
+    lead_data = data.get('lead_form_submit_data', data)
+    phone = ''
+    name = ''
+    email = ''
+
+    if isinstance(lead_data, dict):
+        user_column_data = lead_data.get('user_column_data', [])
+        for item in user_column_data:
+            column_id = item.get('column_id', '').lower()
+            value = item.get('string_value', '')
+
+            if 'phone' in column_id:
+                phone = value
+            elif 'name' in column_id or 'full_name' in column_id:
+                name = value
+            elif 'email' in column_id:
+                email = value
+
+        if not phone:
+            phone = lead_data.get('phone', lead_data.get('phone_number', ''))
+        if not name:
+            name = lead_data.get('name', lead_data.get('full_name', ''))
+        if not email:
+            email = lead_data.get('email', '')
+
+    if not phone:
+        raise ValueError('Phone number not found in webhook data')
+    return {'name': name, 'phone': phone, 'email': email, 'source': 'google_ads',
+            'remarks': f"Google Ads Lead - Campaign: {data.get('campaign_id', 'Unknown')}"}
+
+def parse_facebook(data, source_type):
+    entry = data.get('entry', [{}])[0]
+    changes = entry.get('changes', [{}])[0]
+    value = changes.get('value', {})
+    field_data = value.get('field_data', [])
+
+    phone = ''
+    name = ''
+    email = ''
+
+    for field in field_data:
+        field_name = field.get('name', '').lower()
+        values = field.get('values', [''])
+        value_str = values[0] if values else ''
+
+        if 'phone' in field_name:
+            phone = value_str
+        elif 'name' in field_name:
+            name = value_str
+        elif 'email' in field_name:
+            email = value_str
+
+    if not phone:
+        raise ValueError('Phone number not found')
+    return {'name': name, 'phone': phone, 'email': email, 'source': 'facebook_ads',
+            'remarks': f"Facebook Lead - Form: {value.get('form_id', 'Unknown')}"}
+
+def parse_generic(data, source_type):
+    phone = str(data.get('phone') or data.get('phone_number') or data.get('mobile') or data.get('contact') or '').strip()
+    if not phone:
+        raise ValueError('Phone number is required')
+    return {
+        'name': str(data.get('name') or data.get('full_name') or data.get('customer_name') or '').strip(),
+        'phone': phone,
+        'email': str(data.get('email') or data.get('email_address') or '').strip(),
+        'source': data.get('source', source_type or 'webhook'),
+        'remarks': data.get('remarks', data.get('message', data.get('notes', '')))
+    }
+
+PARSERS = {
+    'google_ads': parse_google_ads,
+    'facebook': parse_facebook,
+    'generic': parse_generic
+}
+
+def parse_item(item):
+    lead = PARSERS[item['kind']](parse_payload(item), item['source_type'])
+    lead['ip_address'] = item['ip_address']
+    lead['created_at'] = item['received_at']
+    return lead
+
+def enqueue(db, company_id, kind, payload, content_type, source_type, ip_address):
+    cursor = db.execute('''
+        INSERT INTO ingest_queue (company_id, kind, source_type, payload, content_type, ip_address, received_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (company_id, kind, source_type, payload, content_type, ip_address, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')))
+    db.commit()
+    ingest_writer.notify()
+    return cursor.lastrowid
+
+def dead_letter(conn, item, error):
+    conn.execute('''
+        INSERT INTO ingest_dead_letters (queue_id, company_id, kind, source_type, payload, content_type, ip_address, error, received_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (item['id'], item['company_id'], item['kind'], item['source_type'], item['payload'], item['content_type'],
+          item['ip_address'], error, item['received_at']))
+
+# Claims the oldest queued payloads under the write lock, turns them into
+# leads and removes them from the queue in the same transaction, so a crash
+# at any point leaves each payload either queued or ingested, never both.
+def drain_batch(conn, limit=BATCH_SIZE):
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        items = conn.execute('SELECT * FROM ingest_queue ORDER BY id LIMIT ?', (limit,)).fetchall()
+        if not items:
+            conn.rollback()
+            return 0, 0
+        leads = defaultdict(list)
+        failed = 0
+        for item in items:
+            try:
+                leads[item['company_id']].append(parse_item(item))
+            except Exception as e:
+                dead_letter(conn, item, f'{type(e).__name__}: {e}')
+                failed += 1
+        for company_id, company_leads in leads.items():
+            company = conn.execute('SELECT * FROM companies WHERE id = ?', (company_id,)).fetchone()
+            if company is None:
+                raise LookupError(f'Company {company_id} not found')
+            ingest_leads(conn, company, company_leads)
+        conn.execute('DELETE FROM ingest_queue WHERE id <= ?', (items[-1]['id'],))
+        conn.commit()
+        return len(items), failed
+    except Exception:
+        conn.rollback()
+        raise
+
+# Drains until the queue is empty. A batch that fails as a whole is retried
+# one payload at a time so only the offending payload is dead-lettered.
+def drain(conn, batch_size=BATCH_SIZE):
+    processed = failed = 0
+    while True:
+        try:
+            count, errors = drain_batch(conn, batch_size)
+        except sqlite3.OperationalError:
+            raise
+        except Exception:
+            count, errors = drain_singly(conn, batch_size)
+        if not count:
+            return processed, failed
+        processed += count
+        failed += errors
+
+def drain_singly(conn, limit):
+    processed = failed = 0
+    for _ in range(limit):
+        try:
+            count, errors = drain_batch(conn, 1)
+        except sqlite3.OperationalError:
+            raise
+        except Exception as e:
+            conn.execute('BEGIN IMMEDIATE')
+            item = conn.execute('SELECT * FROM ingest_queue ORDER BY id LIMIT 1').fetchone()
+            if item is None:
+                conn.rollback()
+                break
+            dead_letter(conn, item, f'{type(e).__name__}: {e}')
+            conn.execute('DELETE FROM ingest_queue WHERE id = ?', (item['id'],))
+            conn.commit()
+            count, errors = 1, 1
+        if not count:
+            break
+        processed += count
+        failed += errors
+    return processed, failed
+
+def queue_stats(db):
+    depth, oldest = db.execute('SELECT COUNT(*), MIN(received_at) FROM ingest_queue').fetchone()
+    lag = 0
+    if oldest:
+        lag = max(0, (datetime.utcnow() - datetime.strptime(oldest, '%Y-%m-%d %H:%M:%S')).total_seconds())
+    return {
+        'depth': depth,
+        'lag_seconds': lag,
+        'dead_letters': db.execute('SELECT COUNT(*) FROM ingest_dead_letters').fetchone()[0],
+        'writer': ingest_writer.stats()
+    }
+
+def replay_dead_letters(conn, ids=None):
+    query = 'SELECT * FROM ingest_dead_letters'
+    params = []
+    if ids:
+        query += f" WHERE id IN ({', '.join('?' * len(ids))})"
+        params = ids
+    letters = conn.execute(query + ' ORDER BY id', params).fetchall()
+    conn.executemany('''
+        INSERT INTO ingest_queue (company_id, kind, source_type, payload, content_type, ip_address, received_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(letter['company_id'], letter['kind'], letter['source_type'], letter['payload'], letter['content_type'],
+           letter['ip_address'], letter['received_at']) for letter in letters])
+    conn.executemany('DELETE FROM ingest_dead_letters WHERE id = ?', [(letter['id'],) for letter in letters])
+    conn.commit()
+    return len(letters)
+
+# Background writer. It wakes on enqueue, waits GROUP_COMMIT_DELAY so a burst
+# lands in one transaction, and also polls so payloads queued by other
+# processes or left over from a restart are picked up.
+class IngestWriter:
+    def __init__(self):
+        self.batches = 0
+        self.processed = 0
+        self.failed = 0
+        self.errors = 0
+        self.last_drain = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def notify(self):
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            if self._wake.wait(POLL_INTERVAL):
+                time.sleep(GROUP_COMMIT_DELAY)
+                self._wake.clear()
+            self.run_once()
+
+    def run_once(self):
+        conn = None
+        try:
+            conn = get_db_connection()
+            processed, failed = drain(conn)
+            if processed:
+                self.batches += 1
+                self.processed += processed
+                self.failed += failed
+            self.last_drain = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+            return processed
+        except Exception as e:
+            self.errors += 1
+            print(f"ingest writer error: {e}")
+            return 0
+        finally:
+            if conn is not None:
+                conn.close()
+
+    def stats(self):
+        return {
+            'running': self._thread is not None,
+            'drains': self.batches,
+            'processed': self.processed,
+            'dead_lettered': self.failed,
+            'errors': self.errors,
+            'last_drain': self.last_drain
+        }
+
+ingest_writer = IngestWriter()
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('drain', 'replay', 'status'):
+        print("Usage: python ingest_queue.py drain")
+        print("       python ingest_queue.py replay [dead_letter_id...]")
+        print("       python ingest_queue.py status")
+        sys.exit(1)
+
+    conn = get_db_connection()
+    try:
+        if sys.argv[1] == 'replay':
+            ids = [int(value) for value in sys.argv[2:]]
+            print(f"Requeued {replay_dead_letters(conn, ids)} dead letters.")
+        if sys.argv[1] in ('drain', 'replay'):
+            processed, failed = drain(conn)
+            print(f"Processed {processed} queued payloads ({failed} dead-lettered).")
+        stats = queue_stats(conn)
+        print(f"Queue depth: {stats['depth']}, lag: {stats['lag_seconds']:.0f}s, dead letters: {stats['dead_letters']}")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
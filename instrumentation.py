@@ -0,0 +1,218 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from flask import g, request, before_render_template, template_rendered
+
+from config import Config
+
+# Upper bounds in seconds; the last bucket is everything slower.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_LOG_SIZE = 100
+SLOW_LOG_STATEMENTS = 10
+STATEMENTS_KEPT = 200
+UNMATCHED = '<unmatched>'
+
+def elapsed_ms(seconds):
+    return round(seconds * 1000, 3)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    # Upper bound of the bucket holding the q-th observation, capped at the
+    # slowest one seen.
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class EndpointStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.sql_statements = 0
+        self.max_sql_statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.response_bytes = 0
+
+    def add(self, metrics, seconds, status, size):
+        self.latency.observe(seconds)
+        self.errors += status >= 500
+        self.sql_statements += metrics.statements
+        self.max_sql_statements = max(self.max_sql_statements, metrics.statements)
+        self.sql_seconds += metrics.sql_seconds
+        self.template_seconds += metrics.template_seconds
+        self.response_bytes += size
+
+    def snapshot(self):
+        requests = self.latency.count or 1
+        return {
+            'requests': self.latency.count,
+            'errors': self.errors,
+            'latency_ms': {
+                'mean': elapsed_ms(self.latency.sum / requests),
+                'p50': elapsed_ms(self.latency.quantile(0.5)),
+                'p95': elapsed_ms(self.latency.quantile(0.95)),
+                'p99': elapsed_ms(self.latency.quantile(0.99)),
+                'max': elapsed_ms(self.latency.max)
+            },
+            'histogram': {
+                'buckets': list(self.latency.buckets),
+                'counts': list(self.latency.counts),
+                'sum': self.latency.sum
+            },
+            'sql_statements': {
+                'mean': round(self.sql_statements / requests, 2),
+                'max': self.max_sql_statements
+            },
+            'sql_ms_mean': elapsed_ms(self.sql_seconds / requests),
+            'template_ms_mean': elapsed_ms(self.template_seconds / requests),
+            'response_bytes_mean': round(self.response_bytes / requests)
+        }
+
+# What one request spent on SQL and templates. Attached to the request's
+# connection: SQLite's trace hook counts every statement it runs (including
+# those fired by triggers and each row of an executemany), and the
+# connection's execute() reports the wall time of each call.
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.queries = []
+        self.template_seconds = 0.0
+        self._template_started = []
+
+    def attach(self, conn):
+        conn.set_recorder(self)
+
+    def trace(self, statement):
+        self.statements += 1
+
+    def record_sql(self, sql, seconds):
+        self.sql_seconds += seconds
+        if len(self.queries) < STATEMENTS_KEPT:
+            self.queries.append((sql, seconds))
+
+    def slowest_queries(self, limit=SLOW_LOG_STATEMENTS):
+        queries = sorted(self.queries, key=lambda query: query[1], reverse=True)[:limit]
+        return [{'sql': ' '.join(sql.split()), 'ms': elapsed_ms(seconds)} for sql, seconds in queries]
+
+class Instrumentation:
+    def __init__(self, slow_request_ms=None):
+        self.slow_seconds = (Config.SLOW_REQUEST_MS if slow_request_ms is None else slow_request_ms) / 1000
+        self.started_at = datetime.utcnow()
+        self.endpoints = {}
+        self.slow_requests = deque(maxlen=SLOW_LOG_SIZE)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        before_render_template.connect(self.template_started, app, weak=False)
+        template_rendered.connect(self.template_finished, app, weak=False)
+
+    def before_request(self):
+        g.request_metrics = RequestMetrics()
+        if 'db' in g:
+            g.request_metrics.attach(g.db)
+
+    def template_started(self, sender, **extra):
+        metrics = g.get('request_metrics')
+        if metrics is not None:
+            metrics._template_started.append(time.perf_counter())
+
+    def template_finished(self, sender, **extra):
+        metrics = g.get('request_metrics')
+        if metrics is not None and metrics._template_started:
+            started = metrics._template_started.pop()
+            if not metrics._template_started:
+                metrics.template_seconds += time.perf_counter() - started
+
+    # Runs before a streamed body is sent, so streams are timed to their
+    # first byte and their size is only counted when it is known up front.
+    def after_request(self, response):
+        metrics = g.pop('request_metrics', None)
+        if metrics is None:
+            return response
+        seconds = time.perf_counter() - metrics.started
+        endpoint = request.endpoint or UNMATCHED
+        size = response.content_length or 0
+        with self._lock:
+            stats = self.endpoints.get(endpoint)
+            if stats is None:
+                stats = self.endpoints[endpoint] = EndpointStats()
+            stats.add(metrics, seconds, response.status_code, size)
+        if seconds >= self.slow_seconds:
+            self.log_slow_request(metrics, endpoint, seconds, response.status_code)
+        return response
+
+    def log_slow_request(self, metrics, endpoint, seconds, status):
+        entry = {
+            'at': datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': endpoint,
+            'status': status,
+            'ms': elapsed_ms(seconds),
+            'sql_statements': metrics.statements,
+            'sql_ms': elapsed_ms(metrics.sql_seconds),
+            'template_ms': elapsed_ms(metrics.template_seconds),
+            'queries': metrics.slowest_queries()
+        }
+        self.slow_requests.appendleft(entry)
+        print(f"Slow request: {entry['method']} {entry['path']} ({endpoint}) {entry['ms']}ms, "
+              f"{entry['sql_statements']} SQL statements in {entry['sql_ms']}ms")
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {endpoint: stats.snapshot() for endpoint, stats in self.endpoints.items()}
+            slow_requests = list(self.slow_requests)
+        return {
+            'since': self.started_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'slow_request_ms': elapsed_ms(self.slow_seconds),
+            'endpoints': endpoints,
+            'slow_requests': slow_requests
+        }
+
+    # Raw per-endpoint totals for the Prometheus exposition.
+    def collect(self):
+        with self._lock:
+            return [{
+                'endpoint': endpoint,
+                'buckets': stats.latency.buckets,
+                'counts': list(stats.latency.counts),
+                'seconds': stats.latency.sum,
+                'errors': stats.errors,
+                'sql_statements': stats.sql_statements,
+                'sql_seconds': stats.sql_seconds,
+                'template_seconds': stats.template_seconds,
+                'response_bytes': stats.response_bytes
+            } for endpoint, stats in self.endpoints.items()]
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.utcnow()
+            self.endpoints = {}
+            self.slow_requests.clear()
+
+instrumentation = Instrumentation()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import re
+import sys
+import uuid
+from datetime import datetime
+
+from config import Config
+from db import get_db_connection
+from metrics import leads_ingested
+
+DUPLICATE_POLICIES = {
+    'merge': 'Merge into the existing lead',
+    'touch': 'Keep the existing lead and mark it as updated',
+    'insert': 'Always create a new lead'
+}
+DEFAULT_DUPLICATE_POLICY = 'merge'
+STATUS_RANK = {'new': 0, 'contacted': 1, 'follow_up': 2, 'interested': 3, 'converted': 4, 'closed': 5}
+BATCH_SIZE = 5000
+DUPLICATE_QUERY = '''
+    SELECT id, uid, name, email, remarks, card_id FROM leads
+    WHERE company_id = ? AND phone_norm = ? ORDER BY id DESC LIMIT 1
+'''
+
+def normalize_phone(phone, country_code=None):
+    country_code = country_code or Config.DEFAULT_COUNTRY_CODE
+    phone = (phone or '').strip()
+    digits = re.sub(r'\D', '', phone)
+    if phone.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0') and len(digits) == 11:
+        digits = country_code + digits[1:]
+    elif len(digits) == 10:
+        digits = country_code + digits
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+# Confirmed by the exact index lookup every time: ingest_leads() holds the
+# write lock while it checks, so a retry that lands on another worker at the
+# same moment waits and then finds the lead instead of inserting a second one.
+def find_duplicate(db, company_id, phone_norm):
+    return db.execute(DUPLICATE_QUERY, (company_id, phone_norm)).fetchone()
+
+def merge_fields(target, lead):
+    for key in ('name', 'email', 'card_id'):
+        if not target.get(key) and lead.get(key):
+            target[key] = lead[key]
+    remarks = lead.get('remarks')
+    if remarks and remarks not in (target.get('remarks') or ''):
+        target['remarks'] = f"{target['remarks']}\n{remarks}" if target.get('remarks') else remarks
+
+def duplicate_policy(company):
+    policy = company['duplicate_policy'] if 'duplicate_policy' in company.keys() else None
+    return policy if policy in DUPLICATE_POLICIES else DEFAULT_DUPLICATE_POLICY
+
+# Writes a batch of leads for one company, applying its duplicate policy
+# against existing rows and within the batch itself. Each lead is a dict with
+# phone and optionally name, email, source, remarks, card_id, ip_address and
+# created_at.
+# Returns (lead_uid, action) per lead, where action is 'created', 'merged' or
+# 'touched'. The caller commits.
+def ingest_leads(db, company, leads):
+    policy = duplicate_policy(company)
+    company_id = company['id']
+    now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    results = []
+    inserts = []
+    pending = {}
+    updates = {}
+    if policy != 'insert' and not db.in_transaction:
+        db.execute('BEGIN IMMEDIATE')
+
+    for lead in leads:
+        phone_norm = normalize_phone(lead['phone'])
+        target = None
+        if policy != 'insert' and phone_norm:
+            target = pending.get(phone_norm) or updates.get(phone_norm)
+            if target is None:
+                existing = find_duplicate(db, company_id, phone_norm)
+                if existing:
+                    target = updates[phone_norm] = dict(existing)
+
+        if target is None:
+            row = dict(lead, uid=str(uuid.uuid4()), phone_norm=phone_norm)
+            inserts.append(row)
+            if phone_norm:
+                pending[phone_norm] = row
+            results.append((row['uid'], 'created'))
+            continue
+
+        if policy == 'merge':
+            merge_fields(target, lead)
+        results.append((target['uid'], 'merged' if policy == 'merge' else 'touched'))
+
+    if inserts:
+        db.executemany('''
+            INSERT INTO leads (uid, name, phone, phone_norm, email, source, company_id, card_id, ip_address, remarks, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(row['uid'], row.get('name') or '', row['phone'], row['phone_norm'], row.get('email') or '',
+               row.get('source'), company_id, row.get('card_id'), row.get('ip_address'), row.get('remarks') or '',
+               row.get('created_at') or now, now) for row in inserts])
+    if updates and policy == 'merge':
+        db.executemany('UPDATE leads SET name = ?, email = ?, card_id = ?, remarks = ?, updated_at = ? WHERE id = ?',
+                       [(row['name'], row['email'], row['card_id'], row['remarks'], now, row['id']) for row in updates.values()])
+    elif updates:
+        db.executemany('UPDATE leads SET updated_at = ? WHERE id = ?', [(now, row['id']) for row in updates.values()])
+    for lead, (lead_uid, action) in zip(leads, results):
+        leads_ingested.inc(lead.get('source') or 'unknown', action)
+    return results
+
+def ingest_lead(db, company, lead):
+    return ingest_leads(db, company, [lead])[0]
+
+def backfill_phone_norm(conn):
+    updated = 0
+    last_id = 0
+    while True:
+        rows = conn.execute('SELECT id, phone FROM leads WHERE id > ? AND phone_norm IS NULL ORDER BY id LIMIT ?',
+                            (last_id, BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        batch = [(normalize_phone(row['phone']), row['id']) for row in rows]
+        conn.executemany('UPDATE leads SET phone_norm = ? WHERE id = ?', [item for item in batch if item[0]])
+        conn.commit()
+        updated += sum(1 for item in batch if item[0])
+    return updated
+
+# Collapses each (company_id, phone_norm) group into one lead: the most
+# advanced status wins (oldest on ties), empty fields are filled from the
+# others, remarks are combined and call history is moved over. Companies
+# using the 'insert' policy keep their duplicates.
+def dedupe_leads(conn, dry_run=False):
+    groups = conn.execute('''
+        SELECT l.company_id, l.phone_norm FROM leads l JOIN companies c ON c.id = l.company_id
+        WHERE l.phone_norm IS NOT NULL AND COALESCE(c.duplicate_policy, ?) != 'insert'
+        GROUP BY l.company_id, l.phone_norm HAVING COUNT(*) > 1
+    ''', (DEFAULT_DUPLICATE_POLICY,)).fetchall()
+
+    removed = 0
+    for group in groups:
+        leads = [dict(row) for row in conn.execute('SELECT * FROM leads WHERE company_id = ? AND phone_norm = ? ORDER BY id',
+                                                   (group['company_id'], group['phone_norm']))]
+        survivor = max(leads, key=lambda lead: (STATUS_RANK.get(lead['status'], 0), -lead['id']))
+        duplicates = [lead for lead in leads if lead['id'] != survivor['id']]
+        for lead in duplicates:
+            merge_fields(survivor, lead)
+            for key in ('assigned_to', 'follow_up_date', 'follow_up_time', 'last_contacted'):
+                if not survivor[key] and lead[key]:
+                    survivor[key] = lead[key]
+        removed += len(duplicates)
+        if dry_run:
+            continue
+
+        duplicate_ids = [lead['id'] for lead in duplicates]
+        placeholders = ', '.join('?' * len(duplicate_ids))
+        conn.execute(f'UPDATE call_history SET lead_id = ? WHERE lead_id IN ({placeholders})', [survivor['id']] + duplicate_ids)
+        conn.execute(f'DELETE FROM leads WHERE id IN ({placeholders})', duplicate_ids)
+        conn.execute('''
+            UPDATE leads SET name = ?, email = ?, card_id = ?, remarks = ?, assigned_to = ?,
+            follow_up_date = ?, follow_up_time = ?, last_contacted = ? WHERE id = ?
+        ''', (survivor['name'], survivor['email'], survivor['card_id'], survivor['remarks'], survivor['assigned_to'],
+              survivor['follow_up_date'], survivor['follow_up_time'], survivor['last_contacted'], survivor['id']))
+        conn.commit()
+    return len(groups), removed
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in ('backfill', 'dedupe'):
+        print("Usage: python leads.py backfill")
+        print("       python leads.py dedupe [--dry-run]")
+        sys.exit(1)
+
+    conn = get_db_connection()
+    try:
+        if sys.argv[1] == 'backfill':
+            print(f"Normalized {backfill_phone_norm(conn)} phone numbers.")
+        else:
+            dry_run = '--dry-run' in sys.argv[2:]
+            groups, removed = dedupe_leads(conn, dry_run)
+            verb = 'Would remove' if dry_run else 'Removed'
+            print(f"{verb} {removed} duplicate leads across {groups} phone numbers.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import sqlite3
+import time
+
+from db import BUSY_TIMEOUT_MS
+
+READY_BUSY_TIMEOUT_MS = 1000
+MAX_SERIES = 100
+OVERFLOW_LABEL = 'other'
+
+# Monotonic counters keyed by a tuple of label values. Increments are a dict
+# lookup and an in-place add on a list slot, with no lock: at worst a racing
+# increment is lost, which is acceptable for monitoring and keeps the request
+# path free of contention. Label values past the first max_series
+# combinations are folded into OVERFLOW_LABEL, since some (like lead sources)
+# come from clients.
+class Counter:
+    def __init__(self, name, help, labels=(), max_series=MAX_SERIES):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.max_series = max_series
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        slot = self._values.get(label_values)
+        if slot is None:
+            if len(self._values) >= self.max_series:
+                label_values = (OVERFLOW_LABEL,) * len(label_values)
+            slot = self._values.setdefault(label_values, [0])
+        slot[0] += amount
+
+    def samples(self):
+        return [(dict(zip(self.labels, key)), slot[0]) for key, slot in list(self._values.items())]
+
+leads_ingested = Counter('leads_ingested_total', 'Leads ingested, by source and duplicate action.', ('source', 'action'))
+webhook_payloads = Counter('webhook_payloads_total', 'Webhook payloads received, by kind and outcome.', ('kind', 'outcome'))
+api_auth_failures = Counter('api_auth_failures_total', 'API requests rejected before reaching an endpoint.', ('reason',))
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float):
+        return repr(value)
+    return str(int(value))
+
+# Accumulates metric families in the Prometheus text exposition format.
+class Exposition:
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help, samples):
+        self.lines.append(f'# HELP {name} {help}')
+        self.lines.append(f'# TYPE {name} {kind}')
+        for labels, value in samples:
+            self.lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+    def counter(self, name, help, samples):
+        self.family(name, 'counter', help, samples)
+
+    def gauge(self, name, help, samples):
+        self.family(name, 'gauge', help, samples)
+
+    def add_counter(self, counter):
+        self.counter(counter.name, counter.help, counter.samples())
+
+    # series is a list of (labels, bucket bounds, per-bucket counts with the
+    # overflow bucket last, sum); buckets are emitted cumulatively.
+    def histogram(self, name, help, series):
+        self.lines.append(f'# HELP {name} {help}')
+        self.lines.append(f'# TYPE {name} histogram')
+        for labels, bounds, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(list(bounds) + [float('inf')], counts):
+                cumulative += count
+                self.lines.append(f'{name}_bucket{format_labels(dict(labels, le=format_value(float(bound))))} {cumulative}')
+            self.lines.append(f'{name}_sum{format_labels(labels)} {format_value(float(total))}')
+            self.lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+# Times a read round trip and taking (then releasing) the write lock, with a
+# short busy timeout so a wedged writer fails the probe instead of hanging it.
+# Returns (ready, details).
+def check_readiness(conn):
+    details = {}
+    try:
+        started = time.perf_counter()
+        conn.execute('SELECT 1').fetchone()
+        details['db_read_ms'] = round((time.perf_counter() - started) * 1000, 3)
+
+        conn.execute(f'PRAGMA busy_timeout = {READY_BUSY_TIMEOUT_MS}')
+        try:
+            started = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            conn.rollback()
+            details['db_write_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        finally:
+            conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    except sqlite3.Error as e:
+        details['error'] = f'{type(e).__name__}: {e}'
+        return False, details
+    return True, details
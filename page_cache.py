@@ -0,0 +1,83 @@
+import hashlib
+import threading
+from flask import request, session, make_response
+
+from cache import TTLCache, MISSING
+from config import Config
+from db import get_db_connection
+
+PAGE_TTL = 600
+COMPANY_PAGES = ('home', 'about', 'features', 'pricing', 'contact', 'privacy', 'terms')
+PLATFORM_PAGES = ('home', 'about', 'features', 'privacy', 'terms', 'showcase')
+
+# Rendered public pages keyed by ('company', slug, page, white_label) or
+# ('platform', page). Entries are dropped by the invalidate_* helpers below
+# whenever the content they were rendered from is saved; the TTL only bounds
+# staleness for writes made by other worker processes.
+page_cache = TTLCache('public_pages', ttl=PAGE_TTL, max_size=5000)
+
+# Pages include the navbar and flashed messages, so only anonymous GETs with
+# nothing pending in the session share a rendering.
+def cacheable():
+    return request.method == 'GET' and 'user_id' not in session and '_flashes' not in session
+
+def cached_page(key, render):
+    if not cacheable():
+        return render()
+    entry = page_cache.get(key)
+    if entry is MISSING:
+        html = render()
+        entry = page_cache.set(key, (html, hashlib.sha1(html.encode('utf-8')).hexdigest()))
+    html, etag = entry
+    response = make_response(html)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+def company_page_key(company, page):
+    return ('company', company['slug'], page, company['white_label_enabled'])
+
+def invalidate_company_pages(slug):
+    for page in COMPANY_PAGES:
+        for white_label in (0, 1):
+            page_cache.invalidate(('company', slug, page, white_label))
+
+def invalidate_platform_pages():
+    for page in PLATFORM_PAGES:
+        page_cache.invalidate(('platform', page))
+
+def invalidate_all_pages():
+    page_cache.invalidate()
+
+def company_page_paths(slug):
+    return [f'/company/{slug}' if page == 'home' else f'/company/{slug}/{page}' for page in COMPANY_PAGES]
+
+# Renders the platform pages and every page of the top tenants (by card views)
+# through the app, so the first visitors after a deploy get cached pages.
+def warm_page_cache(app, tenants=None):
+    tenants = Config.PAGE_CACHE_WARM_TENANTS if tenants is None else tenants
+    conn = get_db_connection()
+    try:
+        slugs = [row['slug'] for row in conn.execute('''
+            SELECT c.slug FROM companies c LEFT JOIN company_stats s ON s.company_id = c.id
+            WHERE c.is_active = 1 ORDER BY COALESCE(s.total_views, 0) DESC LIMIT ?
+        ''', (tenants,))]
+    finally:
+        conn.close()
+    paths = ['/', '/about', '/features', '/privacy-policy', '/terms-conditions', '/showcase']
+    for slug in slugs:
+        paths.extend(company_page_paths(slug))
+    client = app.test_client()
+    warmed = 0
+    for path in paths:
+        try:
+            warmed += client.get(path).status_code == 200
+        except Exception as e:
+            print(f"Page cache warm-up failed for {path}: {e}")
+    return warmed
+
+def start_warm_up(app):
+    thread = threading.Thread(target=warm_page_cache, args=(app,), name='page-cache-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,47 @@
+import base64
+import json
+from flask import request, url_for
+
+def encode_cursor(created_at, row_id):
+    raw = json.dumps([created_at, row_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        return str(created_at), int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+# Appends a (created_at, id) keyset condition and ordering to a query that
+# already has a WHERE clause. Pages cost the same however deep they are, as
+# long as an index ends in created_at after the query's equality filters.
+def keyset_query(query, params, cursor, per_page, alias=None):
+    prefix = f'{alias}.' if alias else ''
+    params = list(params)
+    if cursor:
+        query += f' AND ({prefix}created_at, {prefix}id) < (?, ?)'
+        params.extend(cursor)
+    query += f' ORDER BY {prefix}created_at DESC, {prefix}id DESC LIMIT ?'
+    params.append(per_page + 1)
+    return query, params
+
+def keyset_page(db, query, params, cursor, per_page, alias=None):
+    query, params = keyset_query(query, params, cursor, per_page, alias)
+    rows = db.execute(query, params).fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    return rows, next_cursor
+
+def page_url(cursor=None):
+    args = request.args.to_dict()
+    args.pop('page', None)
+    args.pop('cursor', None)
+    if cursor:
+        args['cursor'] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+import heapq
+import threading
+import time
+from datetime import datetime
+
+from config import Config
+from db import get_db_connection
+from domains import company_changed
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+RELOAD_INTERVAL = 300
+
+def utc_now():
+    return datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+
+# Min-heap of upcoming plan expiries. Rescheduling a company pushes a new
+# entry; stale entries are skipped because they no longer match _expiry.
+class ExpiryIndex:
+    def __init__(self):
+        self._heap = []
+        self._expiry = {}
+        self._lock = threading.Lock()
+        self._loaded_at = None
+
+    def needs_reload(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > RELOAD_INTERVAL
+
+    def load(self, conn):
+        rows = conn.execute('''
+            SELECT id, plan_expiry_date FROM companies
+            WHERE plan != 'free' AND plan_expiry_date IS NOT NULL
+        ''').fetchall()
+        with self._lock:
+            self._expiry = {row['id']: row['plan_expiry_date'] for row in rows}
+            self._heap = [(expiry, company_id) for company_id, expiry in self._expiry.items()]
+            heapq.heapify(self._heap)
+            self._loaded_at = time.monotonic()
+
+    def schedule(self, company_id, plan, expiry_date):
+        with self._lock:
+            if plan == 'free' or not expiry_date:
+                self._expiry.pop(company_id, None)
+                return
+            self._expiry[company_id] = expiry_date
+            heapq.heappush(self._heap, (expiry_date, company_id))
+            if len(self._heap) > 2 * len(self._expiry) + 64:
+                self._heap = [(expiry, cid) for cid, expiry in self._expiry.items()]
+                heapq.heapify(self._heap)
+
+    def next_expiry(self):
+        with self._lock:
+            while self._heap and self._expiry.get(self._heap[0][1]) != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def has_due(self, now):
+        next_expiry = self.next_expiry()
+        return next_expiry is not None and next_expiry < now
+
+    def pop_due(self, now):
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                expiry, company_id = heapq.heappop(self._heap)
+                if self._expiry.get(company_id) == expiry:
+                    del self._expiry[company_id]
+                    due.append(company_id)
+        return due
+
+expiry_index = ExpiryIndex()
+
+def downgrade_companies(conn, company_ids, now):
+    if not company_ids:
+        return 0
+    free_plan = Config.PLANS['free']
+    placeholders = ','.join('?' * len(company_ids))
+    downgraded = conn.execute(f'''
+        UPDATE companies
+        SET plan = 'free', cards_limit = ?, white_label_enabled = 0
+        WHERE id IN ({placeholders}) AND plan != 'free' AND plan_expiry_date < ?
+        RETURNING id
+    ''', (free_plan['cards_limit'], *company_ids, now)).fetchall()
+    conn.commit()
+    for company in downgraded:
+        company_changed(conn, company['id'])
+    return len(downgraded)
+
+def expire_due_companies(conn, now=None):
+    now = now or utc_now()
+    free_plan = Config.PLANS['free']
+    downgraded = conn.execute('''
+        UPDATE companies
+        SET plan = 'free', cards_limit = ?, white_label_enabled = 0
+        WHERE plan != 'free' AND plan_expiry_date < ? AND plan_expiry_date IS NOT NULL
+        RETURNING id
+    ''', (free_plan['cards_limit'], now)).fetchall()
+    conn.commit()
+    for company in downgraded:
+        company_changed(conn, company['id'])
+    return len(downgraded)
+
+# Only touches the heap unless something is actually due, so regular
+# requests never take the write lock.
+def run_due_expiries(conn):
+    if expiry_index.needs_reload():
+        expiry_index.load(conn)
+    now = utc_now()
+    if not expiry_index.has_due(now):
+        return 0
+    return downgrade_companies(conn, expiry_index.pop_due(now), now)
+
+class ExpiryScheduler(threading.Thread):
+    def __init__(self, max_sleep=60):
+        super().__init__(name='plan-expiry', daemon=True)
+        self.max_sleep = max_sleep
+        self._wakeup = threading.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def seconds_until_next(self):
+        next_expiry = expiry_index.next_expiry()
+        if next_expiry is None:
+            return self.max_sleep
+        delay = (datetime.strptime(next_expiry, TIMESTAMP_FORMAT) - datetime.utcnow()).total_seconds()
+        return min(self.max_sleep, max(1, delay + 1))
+
+    def run(self):
+        while True:
+            conn = get_db_connection()
+            try:
+                run_due_expiries(conn)
+            except Exception as e:
+                print(f"Plan expiry scheduler error: {e}")
+            finally:
+                conn.close()
+            self._wakeup.wait(self.seconds_until_next())
+            self._wakeup.clear()
+
+_scheduler = None
+
+def start_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ExpiryScheduler()
+        _scheduler.start()
+    return _scheduler
+
+def schedule_company(company_id, plan, expiry_date):
+    expiry_index.schedule(company_id, plan, expiry_date)
+    if _scheduler is not None:
+        _scheduler.wake()
+
+def main():
+    conn = get_db_connection()
+    try:
+        expired = expire_due_companies(conn)
+    finally:
+        conn.close()
+    print(f"Downgraded {expired} expired compan{'y' if expired == 1 else 'ies'} to the free plan.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import qrcode
+import qrcode.image.svg
+
+from config import Config
+from db import DATABASE_PATH, get_db_connection
+
+INSTANCE_DIR = os.path.dirname(DATABASE_PATH)
+QR_DIR = os.path.join(INSTANCE_DIR, 'qr')
+QR_MAX_AGE = 365 * 24 * 3600
+
+QR_SIZES = {'small': 5, 'medium': 10, 'large': 20}
+QR_FORMATS = {'png': 'image/png', 'svg': 'image/svg+xml'}
+DEFAULT_SIZE = 'medium'
+DEFAULT_FORMAT = 'png'
+
+# The Host header is client supplied, so QR codes encode APP_URL when it is
+# configured and only fall back to the request's own origin.
+def qr_base_url(host_url):
+    return Config.APP_URL or host_url
+
+def card_url(host_url, uid):
+    return f"{host_url.rstrip('/')}/card/{uid}"
+
+# QR images only depend on the encoded URL, size and format, so the hash of
+# those is both the file name and a strong ETag.
+def qr_key(url, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    return hashlib.sha256(f'{url}|{size}|{fmt}'.encode('utf-8')).hexdigest()
+
+def qr_relative_path(key, fmt=DEFAULT_FORMAT):
+    return os.path.join('qr', key[:2], f'{key}.{fmt}')
+
+def qr_file_path(key, fmt=DEFAULT_FORMAT):
+    return os.path.join(INSTANCE_DIR, qr_relative_path(key, fmt))
+
+def render_qr(url, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
+                       box_size=QR_SIZES[size], border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+
+    output = io.BytesIO()
+    if fmt == 'svg':
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(output)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(output, 'PNG')
+    return output.getvalue()
+
+def ensure_qr(url, size=DEFAULT_SIZE, fmt=DEFAULT_FORMAT):
+    key = qr_key(url, size, fmt)
+    path = qr_file_path(key, fmt)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(render_qr(url, size, fmt))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return key, path
+
+def pregenerate_qr(url):
+    for size in QR_SIZES:
+        for fmt in QR_FORMATS:
+            ensure_qr(url, size, fmt)
+    return qr_relative_path(qr_key(url))
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python qr_cache.py <base_url>")
+        print("Example: python qr_cache.py https://cards.example.com/")
+        sys.exit(1)
+
+    base_url = sys.argv[1]
+    conn = get_db_connection()
+    try:
+        cards = conn.execute('SELECT id, uid FROM visiting_cards WHERE is_active = 1').fetchall()
+        for card in cards:
+            conn.execute('UPDATE visiting_cards SET qr_code_path = ? WHERE id = ?',
+                         (pregenerate_qr(card_url(base_url, card['uid'])), card['id']))
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"Generated QR codes for {len(cards)} cards.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# The routes' hot statements. query_plans.py checks the plans of these same
+# strings, so a change here is what the catalog tests. Statements ending in
+# a WHERE clause are extended with filters and then paged by keyset_query().
+
+CARD_BY_UID = 'SELECT * FROM visiting_cards WHERE uid = ? AND is_active = 1'
+
+COMPANY_LEADS = 'SELECT * FROM leads WHERE company_id = ?'
+OFFSET_PAGE_ORDER = ' ORDER BY created_at DESC, id DESC LIMIT ? OFFSET ?'
+COMPANY_RECENT_LEADS = 'SELECT * FROM leads WHERE company_id = ? ORDER BY created_at DESC LIMIT 10'
+COMPANY_LEADS_PAGE = '''SELECT l.*, u.username as assigned_username FROM leads l
+               LEFT JOIN users u ON l.assigned_to = u.id WHERE l.company_id = ?'''
+COMPANY_LEAD = 'SELECT * FROM leads WHERE id = ? AND company_id = ?'
+COMPANY_SALES_PERSONS = "SELECT id, username FROM users WHERE company_id = ? AND role = 'sales_person'"
+COMPANY_CARDS = '''SELECT vc.*, u.username FROM visiting_cards vc
+               LEFT JOIN users u ON vc.user_id = u.id WHERE vc.company_id = ?'''
+COMPANY_PAYMENTS = 'SELECT * FROM payments WHERE company_id = ? ORDER BY created_at DESC LIMIT 10'
+LEAD_CALLS = 'SELECT ch.*, u.username FROM call_history ch LEFT JOIN users u ON ch.user_id = u.id WHERE ch.lead_id = ? ORDER BY ch.created_at DESC'
+
+ASSIGNED_LEADS_COUNT = 'SELECT COUNT(*) FROM leads WHERE assigned_to = ?'
+ASSIGNED_NEW_LEADS_COUNT = "SELECT COUNT(*) FROM leads WHERE assigned_to = ? AND status = 'new'"
+ASSIGNED_RECENT_LEADS = 'SELECT * FROM leads WHERE assigned_to = ? ORDER BY created_at DESC LIMIT 10'
+ASSIGNED_LEADS_PAGE = 'SELECT * FROM leads WHERE assigned_to = ?'
+USER_CALLS_PAGE = '''SELECT ch.*, l.name, l.phone FROM call_history ch
+               JOIN leads l ON ch.lead_id = l.id WHERE ch.user_id = ?'''
+USER_RECENT_CALLS = USER_CALLS_PAGE + ' ORDER BY ch.created_at DESC LIMIT 10'
+USER_NOTIFICATIONS_PAGE = 'SELECT * FROM notifications WHERE user_id = ?'
+USER_RECENT_UNREAD = 'SELECT * FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC LIMIT 5'
+
+RECENT_COMPANIES = 'SELECT * FROM companies ORDER BY created_at DESC LIMIT 5'
+RECENT_PAYMENTS = '''SELECT p.*, c.name as company_name FROM payments p JOIN companies c ON p.company_id = c.id
+               WHERE p.status = 'success' ORDER BY p.created_at DESC LIMIT 5'''
+COMPANIES_PAGE = 'SELECT * FROM companies ORDER BY created_at DESC LIMIT ? OFFSET ?'
+PLATFORM_LEADS_PAGE = '''SELECT l.*, c.name as company_name, u.username as assigned_username FROM leads l
+               LEFT JOIN companies c ON l.company_id = c.id LEFT JOIN users u ON l.assigned_to = u.id WHERE 1=1'''
+PLATFORM_PAYMENTS_PAGE = 'SELECT p.*, c.name as company_name FROM payments p LEFT JOIN companies c ON p.company_id = c.id WHERE 1=1'
+
+PAYMENT_BY_ORDER = 'SELECT * FROM payments WHERE order_id = ?'
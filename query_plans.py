@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+import sys
+from fnmatch import fnmatchcase
+from datetime import datetime, timedelta
+
+from api_keys import API_KEY_QUERY
+from db import get_db_connection
+from events import CATCH_UP_QUERY, POLL_QUERY, UNREAD_COUNT_QUERY, unread_counts_query
+from followups import AGENDA_BUCKETS, agenda_query, count_query
+from leads import DUPLICATE_QUERY
+from pagination import keyset_query
+from queries import (
+    ASSIGNED_LEADS_COUNT, ASSIGNED_LEADS_PAGE, ASSIGNED_NEW_LEADS_COUNT, ASSIGNED_RECENT_LEADS,
+    CARD_BY_UID, COMPANIES_PAGE, COMPANY_CARDS, COMPANY_LEAD, COMPANY_LEADS, COMPANY_LEADS_PAGE,
+    COMPANY_PAYMENTS, COMPANY_RECENT_LEADS, COMPANY_SALES_PERSONS, LEAD_CALLS, OFFSET_PAGE_ORDER,
+    PAYMENT_BY_ORDER, PLATFORM_LEADS_PAGE, PLATFORM_PAYMENTS_PAGE, RECENT_COMPANIES,
+    RECENT_PAYMENTS, USER_CALLS_PAGE, USER_NOTIFICATIONS_PAGE, USER_RECENT_CALLS, USER_RECENT_UNREAD
+)
+from reminders import PENDING_QUERY
+from rollups import LEAD_SERIES_QUERY, LEAD_SOURCES_QUERY, PLATFORM
+from view_counter import VIEW_TREND_QUERY
+
+PER_PAGE = 50
+MIN_LEADS = 10000
+
+# The application's hot statements, each with the plan lines it must
+# produce. `query` builds the SQL and parameters from sample(), using the
+# statements and helpers the application itself executes, with the same
+# filters appended as the route would. `expect` lists prefixes of plan
+# details that must appear, with COVERING INDEX read as INDEX and `*` standing
+# for any index where several are equally good; a SCAN is only accepted when it
+# is listed there, as an index walk in ORDER BY order that stops at the
+# LIMIT. `allow` lists temp B-trees that are accepted, for sorts over a
+# handful of aggregated rows.
+QUERY_PLANS = {
+    'card.view_card': {
+        'query': lambda s: (CARD_BY_UID, (s['card_uid'],)),
+        'expect': ['SEARCH visiting_cards USING INDEX sqlite_autoindex_visiting_cards_1 (uid=?)']
+    },
+    'api.require_api_key': {
+        'query': lambda s: (API_KEY_QUERY, (s['api_key'],)),
+        'expect': ['SEARCH api_keys USING INDEX sqlite_autoindex_api_keys_1 (key=?)']
+    },
+    'api.list_leads': {
+        'query': lambda s: (COMPANY_LEADS + OFFSET_PAGE_ORDER, (s['company_id'], PER_PAGE, PER_PAGE * 10)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_company_created (company_id=?)']
+    },
+    'api.list_leads.cursor': {
+        'query': lambda s: keyset_query(COMPANY_LEADS + ' AND source = ?', [s['company_id'], 'google_ads'],
+                                        s['lead_cursor'], PER_PAGE),
+        'expect': ['SEARCH leads USING INDEX idx_leads_company_source_created (company_id=? AND source=? AND created_at<?)']
+    },
+    'leads.find_duplicate': {
+        'query': lambda s: (DUPLICATE_QUERY, (s['company_id'], s['phone_norm'])),
+        'expect': ['SEARCH leads USING INDEX idx_leads_company_phone (company_id=? AND phone_norm=?)']
+    },
+    'company.dashboard.recent_leads': {
+        'query': lambda s: (COMPANY_RECENT_LEADS, (s['company_id'],)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_company_created (company_id=?)']
+    },
+    'company.dashboard.view_trend': {
+        'query': lambda s: (VIEW_TREND_QUERY, (s['company_id'], s['month_ago'])),
+        'expect': ['SEARCH card_views_daily USING INDEX idx_card_views_company_day (company_id=? AND day>?)']
+    },
+    'company.leads': {
+        'query': lambda s: keyset_query(COMPANY_LEADS_PAGE, [s['company_id']], None, PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_created (company_id=?)',
+                   'SEARCH u USING INTEGER PRIMARY KEY (rowid=?)']
+    },
+    'company.leads.cursor': {
+        'query': lambda s: keyset_query(COMPANY_LEADS_PAGE, [s['company_id']], s['lead_cursor'], PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_created (company_id=? AND created_at<?)']
+    },
+    'company.leads.status': {
+        'query': lambda s: keyset_query(COMPANY_LEADS_PAGE + ' AND l.status = ?', [s['company_id'], 'follow_up'],
+                                        s['lead_cursor'], PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_created (company_id=? AND created_at<?)']
+    },
+    'company.leads.source': {
+        'query': lambda s: keyset_query(COMPANY_LEADS_PAGE + ' AND l.source = ?', [s['company_id'], 'website'],
+                                        s['lead_cursor'], PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_source_created (company_id=? AND source=? AND created_at<?)']
+    },
+    'company.leads.assigned': {
+        'query': lambda s: keyset_query(COMPANY_LEADS_PAGE + ' AND l.assigned_to = ?', [s['company_id'], s['sales_id']],
+                                        None, PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_assigned_created (assigned_to=?)']
+    },
+    'company.export_leads': {
+        'query': lambda s: (COMPANY_LEADS_PAGE + " AND l.created_at >= ? AND l.created_at < date(?, '+1 day') ORDER BY l.created_at DESC, l.id DESC",
+                            (s['company_id'], s['month_ago'], s['today'])),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_created (company_id=? AND created_at>? AND created_at<?)']
+    },
+    'company.view_lead': {
+        'query': lambda s: (COMPANY_LEAD, (s['lead_id'], s['company_id'])),
+        'expect': ['SEARCH leads USING INTEGER PRIMARY KEY (rowid=?)']
+    },
+    'company.view_lead.calls': {
+        'query': lambda s: (LEAD_CALLS, (s['lead_id'],)),
+        'expect': ['SEARCH ch USING INDEX idx_call_history_lead_created (lead_id=?)']
+    },
+    'company.cards': {
+        'query': lambda s: (COMPANY_CARDS + ' ORDER BY vc.created_at DESC', (s['company_id'],)),
+        'expect': ['SEARCH vc USING INDEX idx_cards_company_created (company_id=?)']
+    },
+    'company.sales_persons': {
+        'query': lambda s: (COMPANY_SALES_PERSONS, (s['company_id'],)),
+        'expect': ['SEARCH users USING INDEX idx_users_company (company_id=?)']
+    },
+    'company.payments': {
+        'query': lambda s: (COMPANY_PAYMENTS, (s['company_id'],)),
+        'expect': ['SEARCH payments USING INDEX idx_payments_company_created (company_id=?)']
+    },
+    'sales.dashboard.total_leads': {
+        'query': lambda s: (ASSIGNED_LEADS_COUNT, (s['sales_id'],)),
+        'expect': ['SEARCH leads USING INDEX * (assigned_to=?)']
+    },
+    'sales.dashboard.new_leads': {
+        'query': lambda s: (ASSIGNED_NEW_LEADS_COUNT, (s['sales_id'],)),
+        'expect': ['SEARCH leads USING INDEX']
+    },
+    'sales.dashboard.recent_leads': {
+        'query': lambda s: (ASSIGNED_RECENT_LEADS, (s['sales_id'],)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_assigned_created (assigned_to=?)']
+    },
+    'sales.dashboard.recent_calls': {
+        'query': lambda s: (USER_RECENT_CALLS, (s['sales_id'],)),
+        'expect': ['SEARCH ch USING INDEX idx_call_history_user_created (user_id=?)',
+                   'SEARCH l USING INTEGER PRIMARY KEY (rowid=?)']
+    },
+    'sales.dashboard.notifications': {
+        'query': lambda s: (USER_RECENT_UNREAD, (s['sales_id'],)),
+        'expect': ['SEARCH notifications USING INDEX idx_notifications_unread_created (user_id=?)']
+    },
+    'sales.leads': {
+        'query': lambda s: keyset_query(ASSIGNED_LEADS_PAGE, [s['sales_id']], s['lead_cursor'], PER_PAGE),
+        'expect': ['SEARCH leads USING INDEX idx_leads_assigned_created (assigned_to=? AND created_at<?)']
+    },
+    'sales.leads.status': {
+        'query': lambda s: keyset_query(ASSIGNED_LEADS_PAGE + ' AND status = ?', [s['sales_id'], 'contacted'],
+                                        None, PER_PAGE),
+        'expect': ['SEARCH leads USING INDEX idx_leads_assigned_created (assigned_to=?)']
+    },
+    'sales.call_history': {
+        'query': lambda s: keyset_query(USER_CALLS_PAGE, [s['sales_id']], None, PER_PAGE, alias='ch'),
+        'expect': ['SEARCH ch USING INDEX idx_call_history_user_created (user_id=?)']
+    },
+    'sales.notifications': {
+        'query': lambda s: keyset_query(USER_NOTIFICATIONS_PAGE, [s['sales_id']], None, PER_PAGE),
+        'expect': ['SEARCH notifications USING INDEX idx_notifications_user_created (user_id=?)']
+    },
+    'sales.unread_count': {
+        'query': lambda s: (UNREAD_COUNT_QUERY, (s['sales_id'],)),
+        'expect': ['SEARCH notifications USING INDEX idx_notifications_unread_created (user_id=?)']
+    },
+    'sales.follow_ups.today': {
+        'query': lambda s: (agenda_query(AGENDA_BUCKETS['today']), (s['sales_id'], s['today'], 50)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_follow_up_agenda (assigned_to=? AND follow_up_day=?)']
+    },
+    'sales.follow_ups.upcoming': {
+        'query': lambda s: (agenda_query(AGENDA_BUCKETS['upcoming']), (s['sales_id'], s['today'], 20)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_follow_up_agenda (assigned_to=? AND follow_up_day>?)']
+    },
+    'sales.follow_ups.missed': {
+        'query': lambda s: (agenda_query(AGENDA_BUCKETS['missed']), (s['sales_id'], s['today'], 50)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_follow_up_agenda (assigned_to=? AND follow_up_day<?)']
+    },
+    'sales.follow_ups.missed_count': {
+        'query': lambda s: (count_query(AGENDA_BUCKETS['missed']), (s['sales_id'], s['today'], 1000)),
+        'expect': ['SEARCH leads USING INDEX idx_leads_follow_up_agenda (assigned_to=? AND follow_up_day<?)']
+    },
+    'events.unread_counts': {
+        'query': lambda s: (unread_counts_query(2), (s['sales_id'], s['sales_id'] + 1)),
+        'expect': ['SEARCH notifications USING INDEX idx_notifications_unread_created (user_id=?)']
+    },
+    'events.poll': {
+        'query': lambda s: (POLL_QUERY, (s['notification_id'],)),
+        'expect': ['SEARCH notifications USING INTEGER PRIMARY KEY (rowid>?)']
+    },
+    'events.catch_up': {
+        'query': lambda s: (CATCH_UP_QUERY, (s['sales_id'], s['notification_id'], 100)),
+        'expect': ['SEARCH notifications USING INDEX']
+    },
+    'reminders.pending_follow_ups': {
+        'query': lambda s: (PENDING_QUERY, (60, s['today'], s['tomorrow'])),
+        'expect': ['SEARCH leads USING INDEX idx_leads_follow_up_pending (follow_up_date>? AND follow_up_date<?)']
+    },
+    'master.dashboard.recent_companies': {
+        'query': lambda s: (RECENT_COMPANIES, ()),
+        'expect': ['SCAN companies USING INDEX idx_companies_created']
+    },
+    'master.dashboard.recent_payments': {
+        'query': lambda s: (RECENT_PAYMENTS, ()),
+        'expect': ['SEARCH p USING INDEX idx_payments_status_created (status=?)',
+                   'SEARCH c USING INTEGER PRIMARY KEY (rowid=?)']
+    },
+    'master.companies': {
+        'query': lambda s: (COMPANIES_PAGE, (PER_PAGE, PER_PAGE)),
+        'expect': ['SCAN companies USING INDEX idx_companies_created']
+    },
+    'master.leads': {
+        'query': lambda s: keyset_query(PLATFORM_LEADS_PAGE, [], s['lead_cursor'], PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_created (created_at<?)']
+    },
+    'master.leads.company': {
+        'query': lambda s: keyset_query(PLATFORM_LEADS_PAGE + ' AND l.company_id = ?', [s['company_id']], None, PER_PAGE, alias='l'),
+        'expect': ['SEARCH l USING INDEX idx_leads_company_created (company_id=?)']
+    },
+    'master.leads.source': {
+        'query': lambda s: keyset_query(PLATFORM_LEADS_PAGE + ' AND l.source = ?', ['website'], None, PER_PAGE, alias='l'),
+        'expect': ['SCAN l USING INDEX idx_leads_created']
+    },
+    'master.payments': {
+        'query': lambda s: keyset_query(PLATFORM_PAYMENTS_PAGE, [], None, PER_PAGE, alias='p'),
+        'expect': ['SCAN p USING INDEX idx_payments_created']
+    },
+    'master.payments.status': {
+        'query': lambda s: keyset_query(PLATFORM_PAYMENTS_PAGE + ' AND p.status = ?', ['failed'], None, PER_PAGE, alias='p'),
+        'expect': ['SEARCH p USING INDEX idx_payments_status_created (status=?)']
+    },
+    'master.analytics.lead_series': {
+        'query': lambda s: (LEAD_SERIES_QUERY, (PLATFORM, 'day', s['month_ago'], s['today'])),
+        'expect': ['SEARCH leads_rollup USING PRIMARY KEY (company_id=? AND period=? AND bucket>? AND bucket<?)']
+    },
+    'master.analytics.lead_sources': {
+        'query': lambda s: (LEAD_SOURCES_QUERY, (PLATFORM, 'day', s['month_ago'], s['today'])),
+        'expect': ['SEARCH leads_rollup USING PRIMARY KEY (company_id=? AND period=? AND bucket>? AND bucket<?)'],
+        'allow': ['USE TEMP B-TREE FOR GROUP BY', 'USE TEMP B-TREE FOR ORDER BY']
+    },
+    'payment.callback': {
+        'query': lambda s: (PAYMENT_BY_ORDER, (s['order_id'],)),
+        'expect': ['SEARCH payments USING INDEX sqlite_autoindex_payments_2 (order_id=?)']
+    }
+}
+
+# Parameter values taken from the company with the most leads and its
+# busiest sales person, so every statement is planned against real data.
+# An empty database still gets planned, with placeholder values.
+def sample(conn):
+    company = conn.execute('SELECT company_id FROM company_stats ORDER BY total_leads DESC LIMIT 1').fetchone()
+    company_id = company[0] if company else 0
+    sales = conn.execute('''
+        SELECT assigned_to FROM leads WHERE company_id = ? AND assigned_to IS NOT NULL
+        GROUP BY assigned_to ORDER BY COUNT(*) DESC LIMIT 1
+    ''', (company_id,)).fetchone()
+    lead = conn.execute('''
+        SELECT id, phone_norm, created_at FROM leads WHERE company_id = ? ORDER BY created_at DESC LIMIT 1 OFFSET 100
+    ''', (company_id,)).fetchone() or conn.execute('SELECT id, phone_norm, created_at FROM leads LIMIT 1').fetchone()
+    card = conn.execute('SELECT uid FROM visiting_cards ORDER BY id LIMIT 1').fetchone()
+    api_key = conn.execute('SELECT key FROM api_keys ORDER BY id LIMIT 1').fetchone()
+    payment = conn.execute('SELECT order_id FROM payments ORDER BY id LIMIT 1').fetchone()
+    notification = conn.execute('SELECT COALESCE(MAX(id), 0) - 1000 FROM notifications').fetchone()
+    today = datetime.utcnow().date()
+    return {
+        'company_id': company_id,
+        'sales_id': sales[0] if sales else 0,
+        'lead_id': lead['id'] if lead else 0,
+        'phone_norm': lead['phone_norm'] if lead else '',
+        'lead_cursor': (lead['created_at'], lead['id']) if lead else (today.isoformat(), 0),
+        'card_uid': card[0] if card else '',
+        'api_key': api_key[0] if api_key else '',
+        'order_id': payment[0] if payment else '',
+        'notification_id': max(notification[0], 0),
+        'today': today.isoformat(),
+        'tomorrow': (today + timedelta(days=1)).isoformat(),
+        'month_ago': (today - timedelta(days=30)).isoformat()
+    }
+
+def explain(conn, sql, params):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+# Returns the problems with a plan: table scans and temp B-trees that aren't
+# accepted for the entry, automatic indexes, and expected lines that are
+# missing.
+def matches(detail, line):
+    return fnmatchcase(detail, line + '*')
+
+def check_plan(entry, plan):
+    details = [detail.replace('COVERING INDEX', 'INDEX') for detail in plan]
+    expected = entry.get('expect', [])
+    allowed = entry.get('allow', [])
+    problems = []
+    for detail in details:
+        if detail.startswith('SCAN ') and not detail.startswith('SCAN (') and 'VIRTUAL TABLE' not in detail \
+                and detail != 'SCAN CONSTANT ROW':
+            if not any(matches(detail, line) for line in expected):
+                problems.append(f'full scan: {detail}')
+        elif 'TEMP B-TREE' in detail and detail not in allowed:
+            problems.append(f'temp B-tree: {detail}')
+        elif 'AUTOMATIC' in detail:
+            problems.append(f'automatic index: {detail}')
+    for line in expected:
+        if not any(matches(detail, line) for detail in details):
+            problems.append(f'expected: {line}')
+    return problems
+
+def check_all(conn, names=None):
+    values = sample(conn)
+    failures = {}
+    for name, entry in QUERY_PLANS.items():
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        sql, params = entry['query'](values)
+        plan = explain(conn, sql, params)
+        problems = check_plan(entry, plan)
+        if problems:
+            failures[name] = (problems, plan)
+        else:
+            print(f"ok    {name}")
+    return failures
+
+def main():
+    names = sys.argv[1:]
+    conn = get_db_connection()
+    try:
+        leads = conn.execute('SELECT COUNT(*) FROM leads').fetchone()[0]
+        if leads < MIN_LEADS:
+            print(f"Only {leads} leads: plans on a small database may differ. Generate one with seed_data.py.")
+        failures = check_all(conn, names)
+    finally:
+        conn.close()
+
+    for name, (problems, plan) in failures.items():
+        print(f"FAIL  {name}")
+        for problem in problems:
+            print(f"        {problem}")
+        for detail in plan:
+            print(f"        | {detail}")
+    if failures:
+        print(f"{len(failures)} queries with degraded plans.")
+        sys.exit(1)
+    print("All query plans OK.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+import calendar
+import threading
+import time
+from array import array
+from datetime import datetime
+
+from db import get_db_connection
+from events import notify
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+TICK_SECONDS = 60
+# (slots, ticks per slot) from the finest level up: minutes for the next
+# hour, hours for the next day, days for the next month. Each level's slot
+# spans a whole turn of the level below it.
+WHEEL_LEVELS = ((60, 1), (24, 60), (32, 1440))
+# Reminders that came due while no scheduler was running are still sent if
+# they are at most this old; older ones only show up as missed follow-ups.
+REMINDER_GRACE = 24 * 3600
+CLOSED_STATUSES = ('converted', 'closed')
+BATCH_SIZE = 500
+PENDING_QUERY = '''
+    SELECT id, CAST(strftime('%s', follow_up_date) AS INTEGER) / ? AS due FROM leads
+    WHERE follow_up_date >= ? AND follow_up_date < ?
+        AND follow_up_date IS NOT NULL AND assigned_to IS NOT NULL AND status NOT IN ('converted', 'closed')
+        AND follow_up_notified IS NOT follow_up_date
+'''
+
+def to_tick(timestamp):
+    return calendar.timegm(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timetuple()) // TICK_SECONDS
+
+def from_tick(tick):
+    return datetime.utcfromtimestamp(tick * TICK_SECONDS).strftime(TIMESTAMP_FORMAT)
+
+def current_tick():
+    return int(time.time()) // TICK_SECONDS
+
+# Hierarchical timing wheel of (due_tick, lead_id) pairs packed into int64
+# arrays, 16 bytes per reminder. Entries are never removed: a rescheduled or
+# cancelled follow-up leaves its old entry behind, and the database check in
+# send_follow_up_reminders() discards it when it fires.
+class TimingWheel:
+    def __init__(self, tick, levels=WHEEL_LEVELS):
+        self.levels = levels
+        self.wheels = [[array('q') for _ in range(slots)] for slots, span in levels]
+        self.tick = tick
+        self.overdue = array('q')
+        self.size = 0
+
+    # First tick that no longer fits on the wheel.
+    def limit(self):
+        slots, span = self.levels[-1]
+        return ((self.tick + 1) // span + slots) * span
+
+    def _place(self, due, lead_id, now):
+        for level, (slots, span) in enumerate(self.levels):
+            if due // span - now // span < slots:
+                self.wheels[level][(due // span) % slots].extend((due, lead_id))
+                return True
+        return False
+
+    def add(self, lead_id, due):
+        if due <= self.tick:
+            self.overdue.extend((due, lead_id))
+        elif not self._place(due, lead_id, self.tick + 1):
+            return False
+        self.size += 1
+        return True
+
+    # Moves the wheel forward to `tick`, cascading coarse slots down as their
+    # span begins, and returns the lead ids that came due on the way.
+    def advance(self, tick):
+        due_ids = list(self.overdue[1::2])
+        self.overdue = array('q')
+        while self.tick < tick:
+            now = self.tick + 1
+            for level in range(len(self.levels) - 1, 0, -1):
+                slots, span = self.levels[level]
+                if now % span == 0:
+                    index = (now // span) % slots
+                    entries = self.wheels[level][index]
+                    self.wheels[level][index] = array('q')
+                    for i in range(0, len(entries), 2):
+                        self._place(entries[i], entries[i + 1], now)
+            slots, span = self.levels[0]
+            entries = self.wheels[0][now % slots]
+            if entries:
+                due_ids.extend(entries[1::2])
+                self.wheels[0][now % slots] = array('q')
+            self.tick = now
+        self.size -= len(due_ids)
+        return due_ids
+
+    def memory_bytes(self):
+        return sum(slot.buffer_info()[1] * slot.itemsize for wheel in self.wheels for slot in wheel)
+
+# Loads pending follow-ups due in [start, end) through the partial index on
+# leads.follow_up_date; only reminders not sent yet are returned.
+def pending_follow_ups(conn, start, end):
+    return conn.execute(PENDING_QUERY, (TICK_SECONDS, start, end))
+
+# Marks due follow-ups as notified and writes their notifications in one
+# transaction. The conditional UPDATE makes each reminder fire exactly once
+# across processes, and skips leads whose follow-up moved, was cleared or
+# was closed since they were put on a wheel.
+def send_follow_up_reminders(conn, lead_ids, now=None):
+    now = now or datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+    lead_ids = sorted(set(lead_ids))
+    sent = 0
+    for i in range(0, len(lead_ids), BATCH_SIZE):
+        batch = lead_ids[i:i + BATCH_SIZE]
+        placeholders = ', '.join('?' * len(batch))
+        leads = conn.execute(f'''
+            UPDATE leads SET follow_up_notified = follow_up_date
+            WHERE id IN ({placeholders}) AND follow_up_date <= ? AND assigned_to IS NOT NULL
+                AND status NOT IN ('converted', 'closed') AND follow_up_notified IS NOT follow_up_date
+            RETURNING id, assigned_to, name, phone, follow_up_time
+        ''', batch + [now]).fetchall()
+        conn.executemany('''
+            INSERT INTO notifications (user_id, title, message, type, link)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(lead['assigned_to'], 'Follow-up Due',
+               f"Time to follow up with {lead['name'] or lead['phone']}"
+               + (f" ({lead['follow_up_time']})." if lead['follow_up_time'] else '.'),
+               'follow_up', f"/sales/leads/{lead['id']}") for lead in leads])
+        sent += len(leads)
+    conn.commit()
+    if sent:
+        notify()
+    return sent
+
+class ReminderScheduler(threading.Thread):
+    def __init__(self):
+        super().__init__(name='follow-up-reminders', daemon=True)
+        self.wheel = TimingWheel(current_tick())
+        self.loaded_until = None
+        self.sent = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    # Extends the loaded range to the wheel's current limit. The range only
+    # grows by one top-level slot a day, so this is a small index range scan
+    # rather than a poll of the whole table.
+    def refill(self, conn):
+        with self._lock:
+            limit = self.wheel.limit()
+            if self.loaded_until is None:
+                start = from_tick(self.wheel.tick - REMINDER_GRACE // TICK_SECONDS)
+            elif self.loaded_until < limit:
+                start = from_tick(self.loaded_until)
+            else:
+                return 0
+            loaded = 0
+            for row in pending_follow_ups(conn, start, from_tick(limit)):
+                loaded += self.wheel.add(row['id'], row['due'])
+            self.loaded_until = limit
+            return loaded
+
+    def schedule(self, lead_id, follow_up_date):
+        with self._lock:
+            if self.loaded_until is None:
+                return
+            try:
+                due = to_tick(follow_up_date)
+            except ValueError:
+                return
+            if self.wheel.tick - due > REMINDER_GRACE // TICK_SECONDS or due >= self.loaded_until:
+                return
+            self.wheel.add(lead_id, due)
+        if due <= self.wheel.tick:
+            self._wakeup.set()
+
+    def run_once(self, conn):
+        self.refill(conn)
+        with self._lock:
+            due_ids = self.wheel.advance(current_tick())
+        if not due_ids:
+            return
+        try:
+            self.sent += send_follow_up_reminders(conn, due_ids)
+        except Exception:
+            with self._lock:
+                for lead_id in due_ids:
+                    self.wheel.add(lead_id, self.wheel.tick)
+            raise
+
+    def seconds_until_next_tick(self):
+        return TICK_SECONDS - time.time() % TICK_SECONDS + 0.5
+
+    def run(self):
+        while True:
+            conn = get_db_connection()
+            try:
+                self.run_once(conn)
+            except Exception as e:
+                print(f"Follow-up reminder scheduler error: {e}")
+            finally:
+                conn.close()
+            self._wakeup.wait(self.seconds_until_next_tick())
+            self._wakeup.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self.wheel.size,
+                'wheel_bytes': self.wheel.memory_bytes(),
+                'loaded_until': from_tick(self.loaded_until) if self.loaded_until else None,
+                'sent': self.sent
+            }
+
+_scheduler = None
+
+def start_reminders():
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = ReminderScheduler()
+        _scheduler.start()
+    return _scheduler
+
+# Called after a lead's follow-up date or assignee is committed. Leads that
+# no longer need a reminder are left to the fire-time check.
+def schedule_follow_up(lead_id, follow_up_date, status=None):
+    if _scheduler is None or not follow_up_date or status in CLOSED_STATUSES:
+        return
+    _scheduler.schedule(lead_id, follow_up_date)
+
+def reminder_stats():
+    return _scheduler.stats() if _scheduler is not None else None
+
+def main():
+    conn = get_db_connection()
+    try:
+        now = datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+        start = from_tick(current_tick() - REMINDER_GRACE // TICK_SECONDS)
+        due_ids = [row['id'] for row in pending_follow_ups(conn, start, from_tick(current_tick() + 1))]
+        sent = send_follow_up_reminders(conn, due_ids, now)
+    finally:
+        conn.close()
+    print(f"Sent {sent} follow-up reminder{'' if sent == 1 else 's'}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+from datetime import datetime, timedelta
+
+from db import get_db_connection
+
+# Rollup rows keyed by company_id = PLATFORM hold the platform-wide totals.
+PLATFORM = 0
+
+PERIODS = {
+    'hour': "strftime('%Y-%m-%d %H', {ts})",
+    'day': "date({ts})",
+    'month': "strftime('%Y-%m', {ts})"
+}
+DEFAULT_SPANS = {'hour': 2, 'day': 30, 'month': 365}
+LEAD_SERIES_QUERY = '''
+    SELECT bucket, SUM(leads) AS count FROM leads_rollup
+    WHERE company_id = ? AND period = ? AND bucket BETWEEN ? AND ?
+    GROUP BY bucket HAVING count > 0 ORDER BY bucket DESC
+'''
+LEAD_SOURCES_QUERY = '''
+    SELECT source, SUM(leads) AS count FROM leads_rollup
+    WHERE company_id = ? AND period = ? AND bucket BETWEEN ? AND ?
+    GROUP BY source HAVING count > 0 ORDER BY count DESC
+'''
+
+ROLLUP_TABLES = [
+    '''
+        CREATE TABLE IF NOT EXISTS leads_rollup (
+            company_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            source TEXT NOT NULL,
+            leads INTEGER DEFAULT 0,
+            PRIMARY KEY (company_id, period, bucket, source)
+        ) WITHOUT ROWID
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS revenue_rollup (
+            company_id INTEGER NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            plan TEXT NOT NULL,
+            amount REAL DEFAULT 0,
+            payments INTEGER DEFAULT 0,
+            PRIMARY KEY (company_id, period, bucket, plan)
+        ) WITHOUT ROWID
+    '''
+]
+
+# A rollup spec describes how one base-table row maps onto a rollup table:
+# the timestamp it is bucketed by, its grouping column, the measures it
+# contributes and the condition under which it counts at all.
+LEADS_SPEC = {
+    'table': 'leads_rollup',
+    'ts': '{ref}.created_at',
+    'key': 'source',
+    'measures': {'leads': '1'},
+    'where': '1'
+}
+
+REVENUE_SPEC = {
+    'table': 'revenue_rollup',
+    'ts': 'COALESCE({ref}.completed_at, {ref}.created_at)',
+    'key': 'plan',
+    'measures': {'amount': '{ref}.amount', 'payments': '1'},
+    'where': "{ref}.status = 'success'"
+}
+
+def rollup_add(spec, ref='NEW'):
+    ts = spec['ts'].format(ref=ref)
+    measures = [value.format(ref=ref) for value in spec['measures'].values()]
+    rows = []
+    for company in (f'{ref}.company_id', str(PLATFORM)):
+        for period, bucket in PERIODS.items():
+            rows.append(f"SELECT {company}, '{period}', {bucket.format(ts=ts)}, {ref}.{spec['key']}, {', '.join(measures)}")
+    columns = ', '.join(spec['measures'])
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in spec['measures'])
+    return f'''
+        INSERT INTO {spec['table']} (company_id, period, bucket, {spec['key']}, {columns})
+        SELECT * FROM ({' UNION ALL '.join(rows)}) WHERE {spec['where'].format(ref=ref)}
+        ON CONFLICT(company_id, period, bucket, {spec['key']}) DO UPDATE SET {updates};
+    '''
+
+def rollup_remove(spec, ref='OLD'):
+    ts = spec['ts'].format(ref=ref)
+    updates = ', '.join(f"{column} = {column} - {value.format(ref=ref)}" for column, value in spec['measures'].items())
+    statements = []
+    for period, bucket in PERIODS.items():
+        statements.append(f'''
+        UPDATE {spec['table']} SET {updates}
+        WHERE company_id IN ({ref}.company_id, {PLATFORM}) AND period = '{period}'
+            AND bucket = {bucket.format(ts=ts)} AND {spec['key']} = {ref}.{spec['key']}
+            AND {spec['where'].format(ref=ref)};''')
+    return ''.join(statements)
+
+ROLLUP_TRIGGERS = {
+    'rollup_leads_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_leads_insert AFTER INSERT ON leads BEGIN
+            {rollup_add(LEADS_SPEC)}
+        END
+    ''',
+    'rollup_leads_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_leads_delete AFTER DELETE ON leads BEGIN
+            {rollup_remove(LEADS_SPEC)}
+        END
+    ''',
+    'rollup_leads_update': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_leads_update AFTER UPDATE OF company_id, source, created_at ON leads
+        WHEN OLD.company_id IS NOT NEW.company_id OR OLD.source IS NOT NEW.source OR OLD.created_at IS NOT NEW.created_at
+        BEGIN
+            {rollup_remove(LEADS_SPEC)}
+            {rollup_add(LEADS_SPEC)}
+        END
+    ''',
+    'rollup_payments_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_payments_insert AFTER INSERT ON payments BEGIN
+            {rollup_add(REVENUE_SPEC)}
+        END
+    ''',
+    'rollup_payments_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_payments_delete AFTER DELETE ON payments BEGIN
+            {rollup_remove(REVENUE_SPEC)}
+        END
+    ''',
+    'rollup_payments_update': f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_payments_update AFTER UPDATE OF company_id, plan, status, amount, completed_at ON payments
+        WHEN OLD.status = 'success' OR NEW.status = 'success'
+        BEGIN
+            {rollup_remove(REVENUE_SPEC)}
+            {rollup_add(REVENUE_SPEC)}
+        END
+    '''
+}
+
+def create_rollup_schema(conn):
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'leads_rollup'").fetchone()
+    for statement in ROLLUP_TABLES:
+        conn.execute(statement)
+    for statement in ROLLUP_TRIGGERS.values():
+        conn.execute(statement)
+    if not exists:
+        rebuild_rollups(conn)
+
+def drop_rollup_triggers(conn):
+    for name in ROLLUP_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def rebuild_rollups(conn):
+    conn.execute('DELETE FROM leads_rollup')
+    conn.execute('DELETE FROM revenue_rollup')
+    revenue_ts = REVENUE_SPEC['ts'].format(ref='payments')
+    for period, bucket in PERIODS.items():
+        for company, group in (('company_id', 'company_id, '), (str(PLATFORM), '')):
+            conn.execute(f'''
+                INSERT INTO leads_rollup (company_id, period, bucket, source, leads)
+                SELECT {company}, '{period}', {bucket.format(ts='created_at')} AS b, source, COUNT(*)
+                FROM leads GROUP BY {group}b, source
+            ''')
+            conn.execute(f'''
+                INSERT INTO revenue_rollup (company_id, period, bucket, plan, amount, payments)
+                SELECT {company}, '{period}', {bucket.format(ts=revenue_ts)} AS b, plan, SUM(amount), COUNT(*)
+                FROM payments WHERE status = 'success' GROUP BY {group}b, plan
+            ''')
+
+def parse_day(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+# Returns the inclusive bucket bounds covering [date_from, date_to] at the
+# given granularity.
+def bucket_bounds(granularity, date_from, date_to):
+    start, end = date_from.strftime('%Y-%m-%d'), date_to.strftime('%Y-%m-%d')
+    if granularity == 'hour':
+        return f'{start} 00', f'{end} 23'
+    if granularity == 'month':
+        return start[:7], end[:7]
+    return start, end
+
+def analytics_range(args):
+    granularity = args.get('granularity', 'month')
+    if granularity not in PERIODS:
+        granularity = 'month'
+    date_to = parse_day(args.get('date_to')) or datetime.utcnow()
+    date_from = parse_day(args.get('date_from')) or date_to - timedelta(days=DEFAULT_SPANS[granularity] - 1)
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    return granularity, date_from, date_to
+
+def lead_series(db, granularity, date_from, date_to, company_id=PLATFORM):
+    start, end = bucket_bounds(granularity, date_from, date_to)
+    return db.execute(LEAD_SERIES_QUERY, (company_id, granularity, start, end)).fetchall()
+
+def lead_sources(db, granularity, date_from, date_to, company_id=PLATFORM):
+    start, end = bucket_bounds(granularity, date_from, date_to)
+    return db.execute(LEAD_SOURCES_QUERY, (company_id, granularity, start, end)).fetchall()
+
+def revenue_series(db, granularity, date_from, date_to, company_id=PLATFORM):
+    start, end = bucket_bounds(granularity, date_from, date_to)
+    return db.execute('''
+        SELECT bucket, SUM(amount) AS total, SUM(payments) AS payments FROM revenue_rollup
+        WHERE company_id = ? AND period = ? AND bucket BETWEEN ? AND ?
+        GROUP BY bucket HAVING payments > 0 ORDER BY bucket DESC
+    ''', (company_id, granularity, start, end)).fetchall()
+
+def revenue_by_plan(db, granularity, date_from, date_to, company_id=PLATFORM):
+    start, end = bucket_bounds(granularity, date_from, date_to)
+    return db.execute('''
+        SELECT plan, SUM(amount) AS total, SUM(payments) AS payments FROM revenue_rollup
+        WHERE company_id = ? AND period = ? AND bucket BETWEEN ? AND ?
+        GROUP BY plan HAVING payments > 0 ORDER BY total DESC
+    ''', (company_id, granularity, start, end)).fetchall()
+
+def main():
+    conn = get_db_connection()
+    try:
+        rebuild_rollups(conn)
+        conn.commit()
+        leads = conn.execute('SELECT COUNT(*) FROM leads_rollup').fetchone()[0]
+        revenue = conn.execute('SELECT COUNT(*) FROM revenue_rollup').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"Rebuilt rollups: {leads} lead buckets, {revenue} revenue buckets.")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,20 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 from functools import wraps
-import uuid
+import json
+import time
+from pagination import decode_cursor, encode_cursor, keyset_page
+from api_keys import lookup_api_key, usage_counter
+from leads import ingest_lead, ingest_leads
+from ingest_queue import enqueue
+from metrics import webhook_payloads, api_auth_failures, check_readiness
+from db import get_request_db as get_db
+from queries import COMPANY_LEADS, OFFSET_PAGE_ORDER
 
 api_bp = Blueprint('api', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
+BULK_LEADS_LIMIT = 50000
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
 
 def require_api_key(f):
     @wraps(f)
@@ -18,21 +22,20 @@ def require_api_key(f):
         api_key = request.headers.get('X-API-Key') or request.args.get('api_key')
         
         if not api_key:
+            api_auth_failures.inc('missing_key')
             return jsonify({'error': 'API key required', 'status': 'error'}), 401
         
-        db = get_db()
-        key_record = db.execute('SELECT * FROM api_keys WHERE key = ? AND is_active = 1', (api_key,)).fetchone()
+        key_record, company = lookup_api_key(api_key)
         
         if not key_record:
+            api_auth_failures.inc('invalid_key')
             return jsonify({'error': 'Invalid API key', 'status': 'error'}), 401
         
-        company = db.execute('SELECT * FROM companies WHERE id = ? AND is_active = 1', (key_record['company_id'],)).fetchone()
         if not company:
+            api_auth_failures.inc('inactive_company')
             return jsonify({'error': 'Company not active', 'status': 'error'}), 403
         
-        db.execute('UPDATE api_keys SET last_used = ?, usage_count = usage_count + 1 WHERE id = ?',
-                  (datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), key_record['id']))
-        db.commit()
+        usage_counter.record(key_record['id'])
         
         request.api_key = key_record
         request.company = company
@@ -40,133 +43,218 @@ def require_api_key(f):
         return f(*args, **kwargs)
     return decorated
 
+def clean_field(data, *keys):
+    for key in keys:
+        value = data.get(key)
+        if value is not None and value != '':
+            return str(value).strip()
+    return ''
+
+def lead_fields(data, default_source):
+    return {
+        'name': clean_field(data, 'name'),
+        'phone': clean_field(data, 'phone'),
+        'email': clean_field(data, 'email'),
+        'source': clean_field(data, 'source') or default_source,
+        'remarks': clean_field(data, 'remarks')
+    }
+
 @api_bp.route('/v1/leads', methods=['POST'])
 @require_api_key
 def create_lead():
     data = request.get_json() or request.form.to_dict()
+    lead = lead_fields(data, request.api_key['source_type'] or 'api')
     
-    phone = data.get('phone', '').strip()
+    phone = lead['phone']
     if not phone:
         return jsonify({'error': 'Phone number is required', 'status': 'error'}), 400
     
-    source = data.get('source', request.api_key['source_type'] or 'api')
+    source = lead['source']
+    lead['ip_address'] = request.remote_addr
     
     db = get_db()
-    lead_uid = str(uuid.uuid4())
-    
-    db.execute('''
-        INSERT INTO leads (uid, name, phone, email, source, company_id, ip_address, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        lead_uid,
-        data.get('name', '').strip(),
-        phone,
-        data.get('email', '').strip(),
-        source,
-        request.company['id'],
-        request.remote_addr,
-        data.get('remarks', '').strip()
-    ))
+    lead_uid, action = ingest_lead(db, request.company, lead)
     db.commit()
     
+    created = action == 'created'
     return jsonify({
         'status': 'success',
-        'message': 'Lead created successfully',
+        'message': 'Lead created successfully' if created else f'Duplicate lead {action}',
         'data': {
             'lead_id': lead_uid,
             'phone': phone,
             'source': source,
+            'duplicate': not created,
             'created_at': datetime.utcnow().isoformat()
         }
-    }), 201
+    }), 201 if created else 200
+
+def read_bulk_records():
+    if request.mimetype in NDJSON_MIMETYPES:
+        records = []
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            if len(records) >= BULK_LEADS_LIMIT:
+                raise ValueError(f'A maximum of {BULK_LEADS_LIMIT} leads can be sent per request')
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append(None)
+        return records
+    
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('leads')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of leads, an object with a "leads" array, or NDJSON')
+    if len(data) > BULK_LEADS_LIMIT:
+        raise ValueError(f'A maximum of {BULK_LEADS_LIMIT} leads can be sent per request')
+    return data
+
+@api_bp.route('/v1/leads/bulk', methods=['POST'])
+@require_api_key
+def create_leads_bulk():
+    started = time.perf_counter()
+    try:
+        records = read_bulk_records()
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    
+    default_source = request.api_key['source_type'] or 'api'
+    remote_addr = request.remote_addr
+    leads = []
+    results = []
+    
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results.append({'index': index, 'status': 'error', 'error': 'Invalid lead record'})
+            continue
+        lead = lead_fields(record, default_source)
+        if not lead['phone']:
+            results.append({'index': index, 'status': 'error', 'error': 'Phone number is required'})
+            continue
+        lead['ip_address'] = remote_addr
+        result = {'index': index}
+        leads.append(lead)
+        results.append(result)
+    
+    if leads:
+        db = get_db()
+        outcomes = ingest_leads(db, request.company, leads)
+        db.commit()
+        accepted = [result for result in results if 'status' not in result]
+        for result, (lead_uid, action) in zip(accepted, outcomes):
+            result.update({'status': action, 'lead_id': lead_uid})
+    
+    elapsed = time.perf_counter() - started
+    created = sum(1 for result in results if result['status'] == 'created')
+    duplicates = sum(1 for result in results if result['status'] in ('merged', 'touched'))
+    failed = len(results) - created - duplicates
+    
+    if (created or duplicates) and not failed:
+        status, code = 'success', 201
+    elif created or duplicates:
+        status, code = 'partial', 207
+    else:
+        status, code = 'error', 400
+    
+    return jsonify({
+        'status': status,
+        'data': {
+            'received': len(records),
+            'created': created,
+            'duplicates': duplicates,
+            'failed': failed,
+            'elapsed_ms': round(elapsed * 1000, 2),
+            'leads_per_second': round(len(leads) / elapsed) if elapsed > 0 else len(leads),
+            'results': results
+        }
+    }), code
+
+def serialize_lead(lead):
+    return {
+        'id': lead['uid'],
+        'name': lead['name'],
+        'phone': lead['phone'],
+        'email': lead['email'],
+        'source': lead['source'],
+        'status': lead['status'],
+        'created_at': lead['created_at']
+    }
 
 @api_bp.route('/v1/leads', methods=['GET'])
 @require_api_key
 def list_leads():
-    page = request.args.get('page', 1, type=int)
     per_page = min(request.args.get('per_page', 50, type=int), 100)
     source = request.args.get('source', '')
-    offset = (page - 1) * per_page
+    cursor = request.args.get('cursor')
+    position = decode_cursor(cursor)
+    if cursor and position is None:
+        return jsonify({'error': 'Invalid cursor', 'status': 'error'}), 400
     
     db = get_db()
-    query = 'SELECT * FROM leads WHERE company_id = ?'
+    query = COMPANY_LEADS
     params = [request.company['id']]
     
     if source:
         query += ' AND source = ?'
         params.append(source)
     
-    query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
+    if cursor is not None:
+        leads, next_cursor = keyset_page(db, query, params, position, per_page)
+        return jsonify({
+            'status': 'success',
+            'data': {
+                'leads': [serialize_lead(lead) for lead in leads],
+                'pagination': {
+                    'per_page': per_page,
+                    'next_cursor': next_cursor
+                }
+            }
+        })
+    
+    page = request.args.get('page', 1, type=int)
+    offset = (page - 1) * per_page
+    
+    query += OFFSET_PAGE_ORDER
     params.extend([per_page, offset])
     
     leads = db.execute(query, params).fetchall()
     total = db.execute('SELECT COUNT(*) FROM leads WHERE company_id = ?', (request.company['id'],)).fetchone()[0]
+    next_cursor = encode_cursor(leads[-1]['created_at'], leads[-1]['id']) if len(leads) == per_page else None
     
     return jsonify({
         'status': 'success',
         'data': {
-            'leads': [{
-                'id': lead['uid'],
-                'name': lead['name'],
-                'phone': lead['phone'],
-                'email': lead['email'],
-                'source': lead['source'],
-                'status': lead['status'],
-                'created_at': lead['created_at']
-            } for lead in leads],
+            'leads': [serialize_lead(lead) for lead in leads],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
                 'total': total,
-                'pages': (total + per_page - 1) // per_page
+                'pages': (total + per_page - 1) // per_page,
+                'next_cursor': next_cursor
             }
         }
     })
 
+# Webhooks only journal the raw payload and acknowledge it; the ingest writer
+# parses and stores the leads in batches (see ingest_queue.py).
+def accept_webhook(kind):
+    payload = request.get_data(as_text=True)
+    if not payload.strip():
+        webhook_payloads.inc(kind, 'rejected')
+        return jsonify({'error': 'Empty payload', 'status': 'error'}), 400
+    queue_id = enqueue(get_db(), request.company['id'], kind, payload, request.mimetype,
+                       request.api_key['source_type'], request.remote_addr)
+    webhook_payloads.inc(kind, 'accepted')
+    return jsonify({'status': 'accepted', 'queue_id': queue_id}), 202
+
 @api_bp.route('/v1/webhook/google-ads', methods=['POST'])
 @require_api_key
 def google_ads_webhook():
-    data = request.get_json() or request.form.to_dict()
-    lead_data = data.get('lead_form_submit_data', data)
-    
-    phone = ''
-    name = ''
-    email = ''
-    
-    if isinstance(lead_data, dict):
-        user_column_data = lead_data.get('user_column_data', [])
-        for item in user_column_data:
-            column_id = item.get('column_id', '').lower()
-            value = item.get('string_value', '')
-            
-            if 'phone' in column_id:
-                phone = value
-            elif 'name' in column_id or 'full_name' in column_id:
-                name = value
-            elif 'email' in column_id:
-                email = value
-        
-        if not phone:
-            phone = lead_data.get('phone', lead_data.get('phone_number', ''))
-        if not name:
-            name = lead_data.get('name', lead_data.get('full_name', ''))
-        if not email:
-            email = lead_data.get('email', '')
-    
-    if not phone:
-        return jsonify({'error': 'Phone number not found in webhook data', 'status': 'error'}), 400
-    
-    db = get_db()
-    lead_uid = str(uuid.uuid4())
-    
-    db.execute('''
-        INSERT INTO leads (uid, name, phone, email, source, company_id, ip_address, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (lead_uid, name, phone, email, 'google_ads', request.company['id'], request.remote_addr,
-          f"Google Ads Lead - Campaign: {data.get('campaign_id', 'Unknown')}"))
-    db.commit()
-    
-    return jsonify({'status': 'success', 'lead_id': lead_uid}), 201
+    return accept_webhook('google_ads')
 
 @api_bp.route('/v1/webhook/facebook', methods=['POST', 'GET'])
 @require_api_key
@@ -177,69 +265,21 @@ def facebook_webhook():
             return request.args.get('hub.challenge', '')
         return 'Verification failed', 403
     
-    data = request.get_json() or {}
-    entry = data.get('entry', [{}])[0]
-    changes = entry.get('changes', [{}])[0]
-    value = changes.get('value', {})
-    field_data = value.get('field_data', [])
-    
-    phone = ''
-    name = ''
-    email = ''
-    
-    for field in field_data:
-        field_name = field.get('name', '').lower()
-        values = field.get('values', [''])
-        value_str = values[0] if values else ''
-        
-        if 'phone' in field_name:
-            phone = value_str
-        elif 'name' in field_name:
-            name = value_str
-        elif 'email' in field_name:
-            email = value_str
-    
-    if not phone:
-        return jsonify({'error': 'Phone number not found', 'status': 'error'}), 400
-    
-    db = get_db()
-    lead_uid = str(uuid.uuid4())
-    
-    db.execute('''
-        INSERT INTO leads (uid, name, phone, email, source, company_id, ip_address, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (lead_uid, name, phone, email, 'facebook_ads', request.company['id'], request.remote_addr,
-          f"Facebook Lead - Form: {value.get('form_id', 'Unknown')}"))
-    db.commit()
-    
-    return jsonify({'status': 'success', 'lead_id': lead_uid}), 201
+    return accept_webhook('facebook')
 
 @api_bp.route('/v1/webhook/generic', methods=['POST'])
 @require_api_key
 def generic_webhook():
-    data = request.get_json() or request.form.to_dict()
-    
-    phone = (data.get('phone') or data.get('phone_number') or data.get('mobile') or data.get('contact') or '').strip()
-    
-    if not phone:
-        return jsonify({'error': 'Phone number is required', 'status': 'error'}), 400
-    
-    name = (data.get('name') or data.get('full_name') or data.get('customer_name') or '').strip()
-    email = (data.get('email') or data.get('email_address') or '').strip()
-    source = data.get('source', request.api_key['source_type'] or 'webhook')
-    
-    db = get_db()
-    lead_uid = str(uuid.uuid4())
-    
-    db.execute('''
-        INSERT INTO leads (uid, name, phone, email, source, company_id, ip_address, remarks)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (lead_uid, name, phone, email, source, request.company['id'], request.remote_addr,
-          data.get('remarks', data.get('message', data.get('notes', '')))))
-    db.commit()
-    
-    return jsonify({'status': 'success', 'message': 'Lead created successfully', 'lead_id': lead_uid}), 201
+    return accept_webhook('generic')
 
 @api_bp.route('/v1/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()})
+
+# Readiness for the load balancer: 503 unless the database answers a read and
+# grants the write lock within READY_BUSY_TIMEOUT_MS.
+@api_bp.route('/v1/ready', methods=['GET'])
+def readiness_check():
+    ready, details = check_readiness(get_db())
+    details['status'] = 'ready' if ready else 'unavailable'
+    return jsonify(details), 200 if ready else 503
@@ -2,16 +2,12 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 import uuid
+from page_cache import invalidate_platform_pages
+from domains import company_changed
+from db import get_request_db as get_db
 
 auth_bp = Blueprint('auth', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 @auth_bp.route('/login', methods=['GET', 'POST'])
 def auth_login():
     if 'user_id' in session:
@@ -115,6 +111,8 @@ def auth_register():
         ''', (user_uid, username, email, password_hash, 'company_admin', company_id, 1))
         
         db.commit()
+        company_changed(db, company_id)
+        invalidate_platform_pages()
         
         flash('Registration successful! You can now login.', 'success')
         return redirect(url_for('auth.auth_login'))
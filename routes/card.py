@@ -1,37 +1,45 @@
 from flask import Blueprint, render_template, redirect, url_for, request, send_file, current_app
 from datetime import datetime
-import qrcode
+from view_counter import view_counter
+from leads import ingest_lead
+from static_cards import vcard_text, beacon_card
+from qr_cache import QR_SIZES, QR_FORMATS, QR_MAX_AGE, DEFAULT_SIZE, DEFAULT_FORMAT, card_url, ensure_qr, qr_base_url, qr_key, render_qr
 import io
-import os
-import uuid
+from config import Config
+from db import get_request_db as get_db
+from queries import CARD_BY_UID
+from domains import normalize_domain, resolve_host
 
 card_bp = Blueprint('card', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 @card_bp.route('/<uid>')
 def view_card(uid):
     db = get_db()
-    card = db.execute('SELECT * FROM visiting_cards WHERE uid = ? AND is_active = 1', (uid,)).fetchone()
+    card = db.execute(CARD_BY_UID, (uid,)).fetchone()
     if not card:
         return render_template('errors/404.html'), 404
     
-    db.execute('UPDATE visiting_cards SET views_count = views_count + 1 WHERE uid = ?', (uid,))
-    db.commit()
+    view_counter.record(card)
     
     company = db.execute('SELECT * FROM companies WHERE id = ?', (card['company_id'],)).fetchone()
     
     return render_template('card/view.html', card=card, company=company)
 
+# Counts a view of a statically published card. The page fires it with
+# sendBeacon (POST) or an image request (GET); either way the answer is an
+# empty, uncacheable 204.
+@card_bp.route('/<uid>/beacon', methods=['GET', 'POST'])
+def view_beacon(uid):
+    card = beacon_card(get_db(), uid)
+    if card is None:
+        return '', 404
+    view_counter.record(card)
+    return '', 204, {'Cache-Control': 'no-store'}
+
 @card_bp.route('/<uid>/action', methods=['POST'])
 def card_action(uid):
     db = get_db()
-    card = db.execute('SELECT * FROM visiting_cards WHERE uid = ? AND is_active = 1', (uid,)).fetchone()
+    card = db.execute(CARD_BY_UID, (uid,)).fetchone()
     if not card:
         return render_template('errors/404.html'), 404
     
@@ -45,11 +53,10 @@ def card_action(uid):
         return render_template('card/view.html', card=card, company=company, 
                               show_phone_modal=True, action=action)
     
-    lead_uid = str(uuid.uuid4())
-    db.execute('''
-        INSERT INTO leads (uid, name, phone, source, company_id, card_id, ip_address)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (lead_uid, visitor_name, visitor_phone, f'card_{action}', card['company_id'], card['id'], request.remote_addr))
+    ingest_lead(db, company, {
+        'name': visitor_name, 'phone': visitor_phone, 'source': f'card_{action}',
+        'card_id': card['id'], 'ip_address': request.remote_addr
+    })
     db.commit()
     
     if action == 'call':
@@ -65,49 +72,48 @@ def card_action(uid):
     
     return redirect(url_for('card.view_card', uid=uid))
 
+# Without APP_URL, QR images are only cached on disk for this app's
+# SERVER_NAME and the custom domains of active companies.
+def trusted_qr_host(host):
+    server_name = normalize_domain(current_app.config.get('SERVER_NAME'))
+    if server_name and normalize_domain(host) == server_name:
+        return True
+    return resolve_host(host) is not None
+
 @card_bp.route('/<uid>/qr')
 def get_qr_code(uid):
-    db = get_db()
-    card = db.execute('SELECT * FROM visiting_cards WHERE uid = ?', (uid,)).fetchone()
-    if not card:
+    size = request.args.get('size', DEFAULT_SIZE)
+    fmt = request.args.get('format', DEFAULT_FORMAT)
+    if size not in QR_SIZES or fmt not in QR_FORMATS:
         return render_template('errors/404.html'), 404
     
-    card_url = f"{request.host_url}card/{card['uid']}"
-    
-    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
-    qr.add_data(card_url)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    img_io = io.BytesIO()
-    img.save(img_io, 'PNG')
-    img_io.seek(0)
+    db = get_db()
+    if not db.execute('SELECT id FROM visiting_cards WHERE uid = ?', (uid,)).fetchone():
+        return render_template('errors/404.html'), 404
     
-    return send_file(img_io, mimetype='image/png')
+    url = card_url(qr_base_url(request.host_url), uid)
+    key = qr_key(url, size, fmt)
+    if Config.APP_URL or trusted_qr_host(request.host):
+        key, path = ensure_qr(url, size, fmt)
+        response = send_file(path, mimetype=QR_FORMATS[fmt], etag=key, max_age=QR_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    
+    # Unknown hosts are rendered but never written to disk, so a forged Host
+    # header cannot grow the cache.
+    return send_file(io.BytesIO(render_qr(url, size, fmt)), mimetype=QR_FORMATS[fmt], etag=key)
 
 @card_bp.route('/<uid>/vcard')
 def download_vcard(uid):
     db = get_db()
-    card = db.execute('SELECT * FROM visiting_cards WHERE uid = ? AND is_active = 1', (uid,)).fetchone()
+    card = db.execute(CARD_BY_UID, (uid,)).fetchone()
     if not card:
         return render_template('errors/404.html'), 404
     
     company = db.execute('SELECT * FROM companies WHERE id = ?', (card['company_id'],)).fetchone()
     
-    vcard = f"""BEGIN:VCARD
-VERSION:3.0
-FN:{card['name']}
-ORG:{company['name']}
-TITLE:{card['designation'] or ''}
-TEL;TYPE=CELL:{card['phone']}
-EMAIL:{card['email'] or ''}
-ADR:{card['address'] or ''}
-NOTE:{card['bio'] or ''}
-END:VCARD"""
-    
     return send_file(
-        io.BytesIO(vcard.encode()),
+        io.BytesIO(vcard_text(card, company).encode()),
         mimetype='text/vcard',
         as_attachment=True,
         download_name=f'{card["name"].replace(" ", "_")}.vcf'
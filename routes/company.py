@@ -2,19 +2,24 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from werkzeug.security import generate_password_hash
 from datetime import datetime, timedelta
 from config import Config
+from view_counter import view_trend
+from stats import company_stats
+from search import build_match_query, match_clause
+from leads import DUPLICATE_POLICIES, DEFAULT_DUPLICATE_POLICY
+from api_keys import invalidate_api_key
+from qr_cache import card_url, pregenerate_qr, qr_base_url, qr_key, qr_relative_path
+from pagination import decode_cursor, keyset_page
+from reminders import schedule_follow_up
+from events import notify
+from page_cache import invalidate_company_pages
+from static_cards import card_changed, company_cards_changed
+from exports import LEAD_EXPORT_HEADERS, lead_export_row, export_response
 import uuid
-import csv
-import io
+from db import get_request_db as get_db
+from queries import COMPANY_CARDS, COMPANY_LEAD, COMPANY_LEADS_PAGE, COMPANY_PAYMENTS, COMPANY_RECENT_LEADS, COMPANY_SALES_PERSONS, LEAD_CALLS
 
 company_bp = Blueprint('company', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 def company_required(f):
     from functools import wraps
     @wraps(f)
@@ -43,16 +48,8 @@ def dashboard():
         return redirect(url_for('master.companies'))
     
     db = get_db()
-    total_cards = db.execute('SELECT COUNT(*) FROM visiting_cards WHERE company_id = ?', (company['id'],)).fetchone()[0]
-    total_leads = db.execute('SELECT COUNT(*) FROM leads WHERE company_id = ?', (company['id'],)).fetchone()[0]
-    total_views = db.execute('SELECT COALESCE(SUM(views_count), 0) FROM visiting_cards WHERE company_id = ?', (company['id'],)).fetchone()[0]
-    total_sales = db.execute("SELECT COUNT(*) FROM users WHERE company_id = ? AND role = 'sales_person'", (company['id'],)).fetchone()[0]
-    
-    recent_leads = db.execute('SELECT * FROM leads WHERE company_id = ? ORDER BY created_at DESC LIMIT 10', (company['id'],)).fetchall()
-    unassigned_leads = db.execute('SELECT COUNT(*) FROM leads WHERE company_id = ? AND assigned_to IS NULL', (company['id'],)).fetchone()[0]
-    
-    today = datetime.utcnow().strftime('%Y-%m-%d')
-    today_leads = db.execute("SELECT COUNT(*) FROM leads WHERE company_id = ? AND date(created_at) = ?", (company['id'], today)).fetchone()[0]
+    stats = company_stats(db, company['id'])
+    recent_leads = db.execute(COMPANY_RECENT_LEADS, (company['id'],)).fetchall()
     
     plan_info = Config.PLANS.get(company['plan'], Config.PLANS['free'])
     days_remaining = 0
@@ -60,10 +57,13 @@ def dashboard():
         expiry = datetime.strptime(company['plan_expiry_date'], '%Y-%m-%d %H:%M:%S')
         days_remaining = max(0, (expiry - datetime.utcnow()).days)
     
+    views_trend = view_trend(db, company['id'])
+    
     return render_template('company/dashboard.html', company=company,
-        total_cards=total_cards, total_leads=total_leads, total_views=total_views,
-        total_sales=total_sales, recent_leads=recent_leads, unassigned_leads=unassigned_leads,
-        today_leads=today_leads, plan_info=plan_info, days_remaining=days_remaining)
+        total_cards=stats['total_cards'], total_leads=stats['total_leads'], total_views=stats['total_views'],
+        total_sales=stats['total_sales'], recent_leads=recent_leads, unassigned_leads=stats['unassigned_leads'],
+        today_leads=stats['leads_today'], plan_info=plan_info, days_remaining=days_remaining,
+        views_trend=views_trend)
 
 @company_bp.route('/sales-persons')
 @company_required
@@ -167,17 +167,20 @@ def leads():
         return redirect(url_for('master.companies'))
     
     db = get_db()
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     source = request.args.get('source', '')
     status = request.args.get('status', '')
     assigned_to = request.args.get('assigned_to', type=int)
+    search = request.args.get('search', '').strip()
     per_page = 50
-    offset = (page - 1) * per_page
     
-    query = '''SELECT l.*, u.username as assigned_username FROM leads l 
-               LEFT JOIN users u ON l.assigned_to = u.id WHERE l.company_id = ?'''
+    query = COMPANY_LEADS_PAGE
     params = [company['id']]
     
+    match = build_match_query(search, 'leads_fts')
+    if match:
+        query += ' AND ' + match_clause('leads_fts', 'l.id')
+        params.append(match)
     if source:
         query += ' AND l.source = ?'
         params.append(source)
@@ -188,14 +191,12 @@ def leads():
         query += ' AND l.assigned_to = ?'
         params.append(assigned_to)
     
-    query += ' ORDER BY l.created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, offset])
-    
-    leads = db.execute(query, params).fetchall()
-    sales_persons = db.execute("SELECT id, username FROM users WHERE company_id = ? AND role = 'sales_person'", (company['id'],)).fetchall()
+    leads, next_cursor = keyset_page(db, query, params, cursor, per_page, alias='l')
+    sales_persons = db.execute(COMPANY_SALES_PERSONS, (company['id'],)).fetchall()
     
     return render_template('company/leads.html', company=company, leads=leads, sales_persons=sales_persons,
-                          selected_source=source, selected_status=status, selected_assigned_to=assigned_to, page=page)
+                          selected_source=source, selected_status=status, selected_assigned_to=assigned_to,
+                          search=search, next_cursor=next_cursor)
 
 @company_bp.route('/leads/<int:id>')
 @company_required
@@ -205,12 +206,12 @@ def view_lead(id):
         return redirect(url_for('master.companies'))
     
     db = get_db()
-    lead = db.execute('SELECT * FROM leads WHERE id = ? AND company_id = ?', (id, company['id'])).fetchone()
+    lead = db.execute(COMPANY_LEAD, (id, company['id'])).fetchone()
     if not lead:
         return render_template('errors/404.html'), 404
     
-    sales_persons = db.execute("SELECT id, username FROM users WHERE company_id = ? AND role = 'sales_person'", (company['id'],)).fetchall()
-    call_history = db.execute('SELECT ch.*, u.username FROM call_history ch LEFT JOIN users u ON ch.user_id = u.id WHERE ch.lead_id = ? ORDER BY ch.created_at DESC', (id,)).fetchall()
+    sales_persons = db.execute(COMPANY_SALES_PERSONS, (company['id'],)).fetchall()
+    call_history = db.execute(LEAD_CALLS, (id,)).fetchall()
     
     return render_template('company/view_lead.html', company=company, lead=lead, 
                           sales_persons=sales_persons, call_history=call_history)
@@ -229,7 +230,7 @@ def assign_lead(id):
         db.execute('UPDATE leads SET assigned_to = ?, updated_at = ? WHERE id = ? AND company_id = ?',
                   (sales_person_id, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'), id, company['id']))
         
-        lead = db.execute('SELECT name, phone FROM leads WHERE id = ?', (id,)).fetchone()
+        lead = db.execute('SELECT name, phone, status, follow_up_date FROM leads WHERE id = ?', (id,)).fetchone()
         db.execute('''
             INSERT INTO notifications (user_id, title, message, type, link)
             VALUES (?, ?, ?, ?, ?)
@@ -238,6 +239,8 @@ def assign_lead(id):
               'lead_assigned', f'/sales/leads/{id}'))
         
         db.commit()
+        schedule_follow_up(id, lead['follow_up_date'], lead['status'])
+        notify()
         flash('Lead assigned successfully!', 'success')
     
     return redirect(url_for('company.view_lead', id=id))
@@ -255,59 +258,23 @@ def export_leads():
     date_to = request.args.get('date_to')
     sales_person_id = request.args.get('sales_person_id', type=int)
     
-    query = '''SELECT l.*, u.username as assigned_username FROM leads l 
-               LEFT JOIN users u ON l.assigned_to = u.id WHERE l.company_id = ?'''
+    query = COMPANY_LEADS_PAGE
     params = [company['id']]
     
     if date_from:
-        query += ' AND date(l.created_at) >= ?'
+        query += ' AND l.created_at >= ?'
         params.append(date_from)
     if date_to:
-        query += ' AND date(l.created_at) <= ?'
+        query += " AND l.created_at < date(?, '+1 day')"
         params.append(date_to)
     if sales_person_id:
         query += ' AND l.assigned_to = ?'
         params.append(sales_person_id)
     
-    leads = db.execute(query, params).fetchall()
-    
-    data = []
-    for lead in leads:
-        data.append({
-            'Name': lead['name'] or '',
-            'Phone': lead['phone'],
-            'Email': lead['email'] or '',
-            'Source': lead['source'],
-            'Status': lead['status'],
-            'Assigned To': lead['assigned_username'] or 'Unassigned',
-            'Remarks': lead['remarks'] or '',
-            'Follow-up Date': lead['follow_up_date'] or '',
-            'Created': lead['created_at']
-        })
-    
-    if format_type == 'excel':
-        from openpyxl import Workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = 'Leads'
-        headers = ['Name', 'Phone', 'Email', 'Source', 'Status', 'Assigned To', 'Remarks', 'Follow-up Date', 'Created']
-        ws.append(headers)
-        for row in data:
-            ws.append([row[h] for h in headers])
-        output = io.BytesIO()
-        wb.save(output)
-        output.seek(0)
-        return send_file(output, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                        as_attachment=True, download_name=f'leads_{company["slug"]}_{datetime.now().strftime("%Y%m%d")}.xlsx')
-    else:
-        output = io.StringIO()
-        headers = ['Name', 'Phone', 'Email', 'Source', 'Status', 'Assigned To', 'Remarks', 'Follow-up Date', 'Created']
-        writer = csv.DictWriter(output, fieldnames=headers)
-        writer.writeheader()
-        writer.writerows(data)
-        output.seek(0)
-        return send_file(io.BytesIO(output.getvalue().encode()), mimetype='text/csv',
-                        as_attachment=True, download_name=f'leads_{company["slug"]}_{datetime.now().strftime("%Y%m%d")}.csv')
+    query += ' ORDER BY l.created_at DESC, l.id DESC'
+    
+    return export_response(query, params, format_type, LEAD_EXPORT_HEADERS, lead_export_row,
+                           f'leads_{company["slug"]}_{datetime.now().strftime("%Y%m%d")}')
 
 @company_bp.route('/cards')
 @company_required
@@ -317,15 +284,23 @@ def cards():
         return redirect(url_for('master.companies'))
     
     db = get_db()
-    cards = db.execute('''SELECT vc.*, u.username FROM visiting_cards vc 
-                         LEFT JOIN users u ON vc.user_id = u.id WHERE vc.company_id = ? 
-                         ORDER BY vc.created_at DESC''', (company['id'],)).fetchall()
+    search = request.args.get('search', '').strip()
+    query = COMPANY_CARDS
+    params = [company['id']]
+    
+    match = build_match_query(search, 'cards_fts')
+    if match:
+        query += ' AND ' + match_clause('cards_fts', 'vc.id')
+        params.append(match)
     
-    used_cards = len(cards)
+    cards = db.execute(query + ' ORDER BY vc.created_at DESC', params).fetchall()
+    
+    used_cards = company_stats(db, company['id'])['total_cards']
     cards_limit = company['cards_limit']
     cards_remaining = float('inf') if cards_limit == -1 else max(0, cards_limit - used_cards)
     
-    return render_template('company/cards.html', company=company, cards=cards, cards_remaining=cards_remaining)
+    return render_template('company/cards.html', company=company, cards=cards, cards_remaining=cards_remaining,
+                          search=search)
 
 @company_bp.route('/cards/create', methods=['GET', 'POST'])
 @company_required
@@ -341,7 +316,7 @@ def create_card():
         flash('You have reached your card limit. Please upgrade your plan.', 'warning')
         return redirect(url_for('company.cards'))
     
-    sales_persons = db.execute("SELECT id, username FROM users WHERE company_id = ? AND role = 'sales_person'", (company['id'],)).fetchall()
+    sales_persons = db.execute(COMPANY_SALES_PERSONS, (company['id'],)).fetchall()
     
     if request.method == 'POST':
         user_id = request.form.get('user_id', type=int)
@@ -350,9 +325,10 @@ def create_card():
             return render_template('company/create_card.html', company=company, sales_persons=sales_persons)
         
         card_uid = str(uuid.uuid4())
+        qr_url = card_url(qr_base_url(request.host_url), card_uid)
         db.execute('''
-            INSERT INTO visiting_cards (uid, user_id, company_id, name, designation, phone, whatsapp, email, address, bio, theme, background_color, text_color)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO visiting_cards (uid, user_id, company_id, name, designation, phone, whatsapp, email, address, bio, theme, background_color, text_color, qr_code_path)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         ''', (
             card_uid, user_id, company['id'],
             request.form.get('name', '').strip(),
@@ -364,9 +340,12 @@ def create_card():
             request.form.get('bio', '').strip(),
             request.form.get('theme', 'modern'),
             request.form.get('background_color', '#ffffff'),
-            request.form.get('text_color', '#000000')
+            request.form.get('text_color', '#000000'),
+            qr_relative_path(qr_key(qr_url))
         ))
         db.commit()
+        pregenerate_qr(qr_url)
+        card_changed(db.execute('SELECT id, uid FROM visiting_cards WHERE uid = ?', (card_uid,)).fetchone())
         
         flash('Visiting card created successfully!', 'success')
         return redirect(url_for('company.cards'))
@@ -405,6 +384,7 @@ def edit_card(id):
             id
         ))
         db.commit()
+        card_changed(card)
         
         flash('Card updated successfully!', 'success')
         return redirect(url_for('company.cards'))
@@ -421,9 +401,13 @@ def website_settings():
     db = get_db()
     
     if request.method == 'POST':
+        duplicate_policy = request.form.get('duplicate_policy')
+        if duplicate_policy not in DUPLICATE_POLICIES:
+            duplicate_policy = DEFAULT_DUPLICATE_POLICY
         db.execute('''
             UPDATE companies SET homepage_title = ?, homepage_subtitle = ?, about_content = ?,
-            features_content = ?, pricing_content = ?, contact_content = ?, privacy_policy = ?, terms_conditions = ?
+            features_content = ?, pricing_content = ?, contact_content = ?, privacy_policy = ?, terms_conditions = ?,
+            duplicate_policy = ?
             WHERE id = ?
         ''', (
             request.form.get('homepage_title', '').strip(),
@@ -434,14 +418,17 @@ def website_settings():
             request.form.get('contact_content', '').strip(),
             request.form.get('privacy_policy', '').strip(),
             request.form.get('terms_conditions', '').strip(),
+            duplicate_policy,
             company['id']
         ))
         db.commit()
+        invalidate_api_key()
+        invalidate_company_pages(company['slug'])
         flash('Website content updated!', 'success')
         return redirect(url_for('company.website_settings'))
     
     company = db.execute('SELECT * FROM companies WHERE id = ?', (company['id'],)).fetchone()
-    return render_template('company/website_settings.html', company=company)
+    return render_template('company/website_settings.html', company=company, duplicate_policies=DUPLICATE_POLICIES)
 
 @company_bp.route('/branding', methods=['GET', 'POST'])
 @company_required
@@ -476,6 +463,8 @@ def branding():
         
         db.execute(updates, params)
         db.commit()
+        invalidate_company_pages(company['slug'])
+        company_cards_changed(company['id'])
         flash('Branding settings updated!', 'success')
         return redirect(url_for('company.branding'))
     
@@ -497,7 +486,7 @@ def plan():
         expiry = datetime.strptime(company['plan_expiry_date'], '%Y-%m-%d %H:%M:%S')
         days_remaining = max(0, (expiry - datetime.utcnow()).days)
     
-    payments = db.execute('SELECT * FROM payments WHERE company_id = ? ORDER BY created_at DESC LIMIT 10', (company['id'],)).fetchall()
+    payments = db.execute(COMPANY_PAYMENTS, (company['id'],)).fetchall()
     
     return render_template('company/plan.html', company=company, plans=Config.PLANS,
                           current_plan=current_plan, days_remaining=days_remaining, payments=payments)
@@ -1,19 +1,26 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta
 from config import Config
+from plan_expiry import schedule_company
+from cache import get_master_settings, invalidate_master_settings, get_session_user
+from pagination import decode_cursor, keyset_page
+from exports import PLATFORM_LEAD_EXPORT_HEADERS, platform_lead_export_row, export_response
+from api_keys import invalidate_api_key
+from page_cache import invalidate_platform_pages, invalidate_all_pages
+from domains import company_changed, normalize_domain
+from static_cards import all_cards_changed
+from instrumentation import instrumentation
+from stats import platform_stats
+from search import build_match_query, match_clause
+from rollups import PLATFORM, analytics_range, lead_series, lead_sources, revenue_series, revenue_by_plan
 import uuid
 import secrets
+from db import get_request_db as get_db
+from queries import COMPANIES_PAGE, COMPANY_PAYMENTS, PLATFORM_LEADS_PAGE, PLATFORM_PAYMENTS_PAGE, RECENT_COMPANIES, RECENT_PAYMENTS
 
 master_bp = Blueprint('master', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 def master_required(f):
     from functools import wraps
     @wraps(f)
@@ -28,28 +35,22 @@ def master_required(f):
 @master_required
 def dashboard():
     db = get_db()
-    total_companies = db.execute('SELECT COUNT(*) FROM companies').fetchone()[0]
-    active_companies = db.execute('SELECT COUNT(*) FROM companies WHERE is_active = 1').fetchone()[0]
-    total_users = db.execute("SELECT COUNT(*) FROM users WHERE role != 'master_admin'").fetchone()[0]
-    total_leads = db.execute('SELECT COUNT(*) FROM leads').fetchone()[0]
-    total_revenue = db.execute("SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'success'").fetchone()[0]
+    stats = platform_stats(db)
     
-    recent_companies = db.execute('SELECT * FROM companies ORDER BY created_at DESC LIMIT 5').fetchall()
-    recent_payments = db.execute("SELECT p.*, c.name as company_name FROM payments p JOIN companies c ON p.company_id = c.id WHERE p.status = 'success' ORDER BY p.created_at DESC LIMIT 5").fetchall()
+    recent_companies = db.execute(RECENT_COMPANIES).fetchall()
+    recent_payments = db.execute(RECENT_PAYMENTS).fetchall()
     
     plan_stats = {
-        'free': db.execute("SELECT COUNT(*) FROM companies WHERE plan = 'free'").fetchone()[0],
-        'basic': db.execute("SELECT COUNT(*) FROM companies WHERE plan = 'basic'").fetchone()[0],
-        'pro': db.execute("SELECT COUNT(*) FROM companies WHERE plan = 'pro'").fetchone()[0]
+        'free': stats['free_companies'],
+        'basic': stats['basic_companies'],
+        'pro': stats['pro_companies']
     }
     
-    api_usage = db.execute('SELECT COALESCE(SUM(usage_count), 0) FROM api_keys').fetchone()[0]
-    
     return render_template('master/dashboard.html',
-        total_companies=total_companies, active_companies=active_companies,
-        total_users=total_users, total_leads=total_leads, total_revenue=total_revenue,
+        total_companies=stats['total_companies'], active_companies=stats['active_companies'],
+        total_users=stats['total_users'], total_leads=stats['total_leads'], total_revenue=stats['total_revenue'],
         recent_companies=recent_companies, recent_payments=recent_payments,
-        plan_stats=plan_stats, api_usage=api_usage)
+        plan_stats=plan_stats, api_usage=stats['api_usage'])
 
 @master_bp.route('/companies')
 @master_required
@@ -60,13 +61,14 @@ def companies():
     per_page = 20
     offset = (page - 1) * per_page
     
-    if search:
-        companies = db.execute('SELECT * FROM companies WHERE name LIKE ? ORDER BY created_at DESC LIMIT ? OFFSET ?', 
-                              (f'%{search}%', per_page, offset)).fetchall()
-        total = db.execute('SELECT COUNT(*) FROM companies WHERE name LIKE ?', (f'%{search}%',)).fetchone()[0]
+    match = build_match_query(search, 'companies_fts')
+    if match:
+        companies = db.execute('SELECT * FROM companies WHERE ' + match_clause('companies_fts', 'id') + ' ORDER BY created_at DESC LIMIT ? OFFSET ?',
+                              (match, per_page, offset)).fetchall()
+        total = db.execute('SELECT COUNT(*) FROM companies_fts WHERE companies_fts MATCH ?', (match,)).fetchone()[0]
     else:
-        companies = db.execute('SELECT * FROM companies ORDER BY created_at DESC LIMIT ? OFFSET ?', (per_page, offset)).fetchall()
-        total = db.execute('SELECT COUNT(*) FROM companies').fetchone()[0]
+        companies = db.execute(COMPANIES_PAGE, (per_page, offset)).fetchall()
+        total = platform_stats(db)['total_companies']
     
     total_pages = (total + per_page - 1) // per_page
     
@@ -120,6 +122,9 @@ def create_company():
         ''', (user_uid, admin_username, admin_email, password_hash, 'company_admin', company_id, 1))
         
         db.commit()
+        schedule_company(company_id, plan, expiry_date)
+        company_changed(db, company_id)
+        invalidate_platform_pages()
         flash(f'Company "{name}" created successfully!', 'success')
         return redirect(url_for('master.companies'))
     
@@ -136,7 +141,7 @@ def view_company(id):
     users = db.execute('SELECT * FROM users WHERE company_id = ?', (id,)).fetchall()
     leads_count = db.execute('SELECT COUNT(*) FROM leads WHERE company_id = ?', (id,)).fetchone()[0]
     cards_count = db.execute('SELECT COUNT(*) FROM visiting_cards WHERE company_id = ?', (id,)).fetchone()[0]
-    payments = db.execute('SELECT * FROM payments WHERE company_id = ? ORDER BY created_at DESC LIMIT 10', (id,)).fetchall()
+    payments = db.execute(COMPANY_PAYMENTS, (id,)).fetchall()
     api_keys = db.execute('SELECT * FROM api_keys WHERE company_id = ?', (id,)).fetchall()
     
     return render_template('master/view_company.html', company=company, users=users,
@@ -151,6 +156,12 @@ def edit_company(id):
         return render_template('errors/404.html'), 404
     
     if request.method == 'POST':
+        custom_domain = normalize_domain(request.form.get('custom_domain')) or None
+        if custom_domain and db.execute('SELECT id FROM companies WHERE custom_domain = ? AND id != ?',
+                                        (custom_domain, id)).fetchone():
+            flash(f'{custom_domain} is already used by another company.', 'danger')
+            return render_template('master/edit_company.html', company=company)
+        
         db.execute('''
             UPDATE companies SET
                 name = ?, email = ?, phone = ?, address = ?, custom_domain = ?,
@@ -165,7 +176,7 @@ def edit_company(id):
             request.form.get('email', '').strip(),
             request.form.get('phone', '').strip(),
             request.form.get('address', '').strip(),
-            request.form.get('custom_domain', '').strip() or None,
+            custom_domain,
             request.form.get('homepage_title', '').strip(),
             request.form.get('homepage_subtitle', '').strip(),
             request.form.get('about_content', '').strip(),
@@ -183,6 +194,9 @@ def edit_company(id):
             id
         ))
         db.commit()
+        invalidate_api_key()
+        company_changed(db, id)
+        invalidate_platform_pages()
         flash('Company updated successfully!', 'success')
         return redirect(url_for('master.view_company', id=id))
     
@@ -201,6 +215,8 @@ def update_company_plan(id):
         WHERE id = ?
     ''', (plan, expiry_date, plan_config['cards_limit'], 1 if plan_config['white_label'] else 0, id))
     db.commit()
+    schedule_company(id, plan, expiry_date)
+    company_changed(db, id)
     
     flash(f'Plan updated to {plan_config["name"]}!', 'success')
     return redirect(url_for('master.view_company', id=id))
@@ -213,6 +229,9 @@ def toggle_company(id):
     new_status = 0 if company['is_active'] else 1
     db.execute('UPDATE companies SET is_active = ? WHERE id = ?', (new_status, id))
     db.commit()
+    invalidate_api_key()
+    company_changed(db, id)
+    invalidate_platform_pages()
     flash(f'Company {"activated" if new_status else "deactivated"} successfully!', 'success')
     return redirect(url_for('master.view_company', id=id))
 
@@ -234,6 +253,7 @@ def manage_api_keys(id):
             VALUES (?, ?, ?, ?)
         ''', (id, api_key, name, source_type))
         db.commit()
+        invalidate_api_key(api_key)
         flash(f'API Key created: {api_key}', 'success')
         return redirect(url_for('master.manage_api_keys', id=id))
     
@@ -244,10 +264,11 @@ def manage_api_keys(id):
 @master_required
 def toggle_api_key(company_id, key_id):
     db = get_db()
-    key = db.execute('SELECT is_active FROM api_keys WHERE id = ? AND company_id = ?', (key_id, company_id)).fetchone()
+    key = db.execute('SELECT key, is_active FROM api_keys WHERE id = ? AND company_id = ?', (key_id, company_id)).fetchone()
     if key:
         db.execute('UPDATE api_keys SET is_active = ? WHERE id = ?', (0 if key['is_active'] else 1, key_id))
         db.commit()
+        invalidate_api_key(key['key'])
     flash('API Key status updated!', 'success')
     return redirect(url_for('master.manage_api_keys', id=company_id))
 
@@ -255,8 +276,11 @@ def toggle_api_key(company_id, key_id):
 @master_required
 def delete_api_key(company_id, key_id):
     db = get_db()
+    key = db.execute('SELECT key FROM api_keys WHERE id = ? AND company_id = ?', (key_id, company_id)).fetchone()
     db.execute('DELETE FROM api_keys WHERE id = ? AND company_id = ?', (key_id, company_id))
     db.commit()
+    if key:
+        invalidate_api_key(key['key'])
     flash('API Key deleted!', 'success')
     return redirect(url_for('master.manage_api_keys', id=company_id))
 
@@ -264,15 +288,19 @@ def delete_api_key(company_id, key_id):
 @master_required
 def all_leads():
     db = get_db()
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     company_id = request.args.get('company_id', type=int)
     source = request.args.get('source', '')
+    search = request.args.get('search', '').strip()
     per_page = 50
-    offset = (page - 1) * per_page
     
-    query = 'SELECT l.*, c.name as company_name, u.username as assigned_username FROM leads l LEFT JOIN companies c ON l.company_id = c.id LEFT JOIN users u ON l.assigned_to = u.id WHERE 1=1'
+    query = PLATFORM_LEADS_PAGE
     params = []
     
+    match = build_match_query(search, 'leads_fts')
+    if match:
+        query += ' AND ' + match_clause('leads_fts', 'l.id')
+        params.append(match)
     if company_id:
         query += ' AND l.company_id = ?'
         params.append(company_id)
@@ -280,42 +308,71 @@ def all_leads():
         query += ' AND l.source = ?'
         params.append(source)
     
-    query += ' ORDER BY l.created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, offset])
-    
-    leads = db.execute(query, params).fetchall()
+    leads, next_cursor = keyset_page(db, query, params, cursor, per_page, alias='l')
     companies = db.execute('SELECT id, name FROM companies').fetchall()
     
     return render_template('master/leads.html', leads=leads, companies=companies,
-                          selected_company=company_id, selected_source=source, page=page)
+                          selected_company=company_id, selected_source=source, search=search, next_cursor=next_cursor)
+
+@master_bp.route('/leads/export')
+@master_required
+def export_leads():
+    db = get_db()
+    format_type = request.args.get('format', 'csv')
+    company_id = request.args.get('company_id', type=int)
+    source = request.args.get('source', '')
+    search = request.args.get('search', '').strip()
+    date_from = request.args.get('date_from')
+    date_to = request.args.get('date_to')
+    
+    query = PLATFORM_LEADS_PAGE
+    params = []
+    
+    match = build_match_query(search, 'leads_fts')
+    if match:
+        query += ' AND ' + match_clause('leads_fts', 'l.id')
+        params.append(match)
+    if company_id:
+        query += ' AND l.company_id = ?'
+        params.append(company_id)
+    if source:
+        query += ' AND l.source = ?'
+        params.append(source)
+    if date_from:
+        query += ' AND l.created_at >= ?'
+        params.append(date_from)
+    if date_to:
+        query += " AND l.created_at < date(?, '+1 day')"
+        params.append(date_to)
+    
+    query += ' ORDER BY l.created_at DESC, l.id DESC'
+    
+    return export_response(query, params, format_type, PLATFORM_LEAD_EXPORT_HEADERS,
+                           platform_lead_export_row, f'leads_all_{datetime.now().strftime("%Y%m%d")}')
 
 @master_bp.route('/payments')
 @master_required
 def all_payments():
     db = get_db()
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     status = request.args.get('status', '')
     per_page = 50
-    offset = (page - 1) * per_page
     
-    query = 'SELECT p.*, c.name as company_name FROM payments p LEFT JOIN companies c ON p.company_id = c.id WHERE 1=1'
+    query = PLATFORM_PAYMENTS_PAGE
     params = []
     
     if status:
         query += ' AND p.status = ?'
         params.append(status)
     
-    query += ' ORDER BY p.created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, offset])
-    
-    payments = db.execute(query, params).fetchall()
-    return render_template('master/payments.html', payments=payments, selected_status=status, page=page)
+    payments, next_cursor = keyset_page(db, query, params, cursor, per_page, alias='p')
+    return render_template('master/payments.html', payments=payments, selected_status=status, next_cursor=next_cursor)
 
 @master_bp.route('/settings', methods=['GET', 'POST'])
 @master_required
 def settings():
     db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
+    settings = get_master_settings()
     
     if request.method == 'POST':
         db.execute('''
@@ -343,6 +400,9 @@ def settings():
             settings['id']
         ))
         db.commit()
+        invalidate_master_settings()
+        invalidate_all_pages()
+        all_cards_changed()
         flash('Settings updated successfully!', 'success')
         return redirect(url_for('master.settings'))
     
@@ -373,6 +433,7 @@ def add_showcase():
             1 if request.form.get('is_featured') == 'on' else 0
         ))
         db.commit()
+        invalidate_platform_pages()
         flash('Project added to showcase!', 'success')
         return redirect(url_for('master.showcase_projects'))
     
@@ -383,7 +444,9 @@ def add_showcase():
 @master_required
 def profile():
     db = get_db()
-    user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+    user = get_session_user()
+    if user is None:
+        return redirect(url_for('auth.auth_logout'))
     
     if request.method == 'POST':
         new_username = request.form.get('username', '').strip()
@@ -420,20 +483,46 @@ def profile():
 @master_required
 def analytics():
     db = get_db()
+    granularity, date_from, date_to = analytics_range(request.args)
+    company_id = request.args.get('company_id', PLATFORM, type=int)
     
-    leads_by_month = db.execute('''
-        SELECT strftime('%Y-%m', created_at) as month, COUNT(*) as count
-        FROM leads GROUP BY month ORDER BY month DESC LIMIT 12
-    ''').fetchall()
+    leads_by_period = lead_series(db, granularity, date_from, date_to, company_id)
+    revenue_by_period = revenue_series(db, granularity, date_from, date_to, company_id)
+    leads_by_source = lead_sources(db, granularity, date_from, date_to, company_id)
+    revenue_plans = revenue_by_plan(db, granularity, date_from, date_to, company_id)
     
-    revenue_by_month = db.execute('''
-        SELECT strftime('%Y-%m', completed_at) as month, SUM(amount) as total
-        FROM payments WHERE status = 'success' GROUP BY month ORDER BY month DESC LIMIT 12
-    ''').fetchall()
-    
-    leads_by_source = db.execute('''
-        SELECT source, COUNT(*) as count FROM leads GROUP BY source
-    ''').fetchall()
+    companies = db.execute('SELECT id, name FROM companies ORDER BY name').fetchall()
     
     return render_template('master/analytics.html',
-        leads_by_month=leads_by_month, revenue_by_month=revenue_by_month, leads_by_source=leads_by_source)
+        leads_by_period=leads_by_period, revenue_by_period=revenue_by_period,
+        leads_by_source=leads_by_source, revenue_plans=revenue_plans, companies=companies,
+        granularity=granularity, company_id=company_id,
+        date_from=date_from.strftime('%Y-%m-%d'), date_to=date_to.strftime('%Y-%m-%d'))
+
+PERFORMANCE_SORTS = {
+    'p95': lambda stats: stats['latency_ms']['p95'],
+    'requests': lambda stats: stats['requests'],
+    'sql': lambda stats: stats['sql_statements']['mean']
+}
+
+@master_bp.route('/performance')
+@master_required
+def performance():
+    snapshot = instrumentation.snapshot()
+    sort = request.args.get('sort')
+    if sort not in PERFORMANCE_SORTS:
+        sort = 'p95'
+    endpoints = sorted(snapshot['endpoints'].items(), key=lambda item: PERFORMANCE_SORTS[sort](item[1]), reverse=True)
+    return render_template('master/performance.html', snapshot=snapshot, endpoints=endpoints, sort=sort)
+
+@master_bp.route('/performance.json')
+@master_required
+def performance_json():
+    return jsonify(instrumentation.snapshot())
+
+@master_bp.route('/performance/reset', methods=['POST'])
+@master_required
+def reset_performance():
+    instrumentation.reset()
+    flash('Performance counters reset.', 'success')
+    return redirect(url_for('master.performance'))
@@ -0,0 +1,113 @@
+import hmac
+import time
+from flask import Blueprint, render_template, request
+
+from config import Config
+from cache import cache_stats
+from db import get_request_db as get_db, pool_stats
+from instrumentation import instrumentation
+from ingest_queue import ingest_writer
+from api_keys import usage_counter
+from view_counter import view_counter
+from events import event_hub
+from domains import domain_index
+from reminders import reminder_stats
+from static_cards import publisher_stats
+from metrics import Exposition, leads_ingested, webhook_payloads, api_auth_failures
+
+metrics_bp = Blueprint('metrics', __name__)
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+STARTED_AT = time.time()
+
+def authorized():
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {Config.METRICS_TOKEN}')
+
+def request_metrics(out):
+    endpoints = instrumentation.collect()
+    out.histogram('http_request_duration_seconds', 'Request latency by endpoint, to the first byte.',
+                  [({'endpoint': e['endpoint']}, e['buckets'], e['counts'], e['seconds']) for e in endpoints])
+    out.counter('http_request_errors_total', 'Requests answered with a 5xx status.',
+                [({'endpoint': e['endpoint']}, e['errors']) for e in endpoints])
+    out.counter('http_request_sql_statements_total', 'SQL statements run while handling requests.',
+                [({'endpoint': e['endpoint']}, e['sql_statements']) for e in endpoints])
+    out.counter('http_request_sql_seconds_total', 'Time spent in SQL while handling requests.',
+                [({'endpoint': e['endpoint']}, e['sql_seconds']) for e in endpoints])
+    out.counter('http_request_template_seconds_total', 'Time spent rendering templates.',
+                [({'endpoint': e['endpoint']}, e['template_seconds']) for e in endpoints])
+    out.counter('http_response_bytes_total', 'Response bytes sent, excluding streamed bodies.',
+                [({'endpoint': e['endpoint']}, e['response_bytes']) for e in endpoints])
+
+# Pool checkouts that had to wait are the app's lock waits: SQLite's own busy
+# waits happen inside busy_timeout and show up as SQL time.
+def database_metrics(out):
+    pool = pool_stats()
+    out.gauge('db_pool_connections', 'Pooled SQLite connections by state.',
+              [({'state': 'in_use'}, pool['in_use']), ({'state': 'idle'}, pool['idle'])])
+    out.gauge('db_pool_max_connections', 'Pool size limit.', [({}, pool['max_size'])])
+    out.counter('db_pool_checkouts_total', 'Connections taken from the pool.', [({}, pool['checkouts'])])
+    out.counter('db_pool_waits_total', 'Checkouts that waited for a free connection.', [({}, pool['waits'])])
+    out.counter('db_pool_wait_seconds_total', 'Time spent waiting for a free connection.', [({}, pool['wait_seconds'])])
+    out.gauge('db_pool_max_in_use_connections', 'Most connections in use at once since start.', [({}, pool['max_in_use'])])
+
+def ingest_metrics(out, db):
+    out.add_counter(leads_ingested)
+    out.add_counter(webhook_payloads)
+    out.add_counter(api_auth_failures)
+    writer = ingest_writer.stats()
+    out.counter('ingest_payloads_processed_total', 'Webhook payloads drained by this process.', [({}, writer['processed'])])
+    out.counter('ingest_dead_letters_total', 'Webhook payloads that failed to parse or ingest.', [({}, writer['dead_lettered'])])
+    out.counter('ingest_writer_errors_total', 'Ingest writer runs that failed.', [({}, writer['errors'])])
+    depth, oldest = db.execute("SELECT COUNT(*), COALESCE(MIN(strftime('%s', received_at)), 0) FROM ingest_queue").fetchone()
+    out.gauge('ingest_queue_oldest_seconds', 'Age of the oldest queued webhook payload.',
+              [({}, max(0.0, time.time() - int(oldest)) if depth else 0.0)])
+    dead_letters = db.execute('SELECT COUNT(*) FROM ingest_dead_letters').fetchone()[0]
+    out.gauge('ingest_dead_letter_payloads', 'Payloads parked in ingest_dead_letters awaiting replay.', [({}, dead_letters)])
+    return depth
+
+def cache_metrics(out):
+    caches = cache_stats()
+    out.counter('cache_hits_total', 'In-process cache hits.', [({'cache': name}, s['hits']) for name, s in caches.items()])
+    out.counter('cache_misses_total', 'In-process cache misses.', [({'cache': name}, s['misses']) for name, s in caches.items()])
+    out.gauge('cache_hit_ratio', 'In-process cache hit ratio since start.',
+              [({'cache': name}, float(s['hit_ratio'])) for name, s in caches.items()])
+
+def background_metrics(out, ingest_depth):
+    reminders = reminder_stats()
+    publisher = publisher_stats()
+    out.gauge('background_queue_depth', 'Work waiting in background queues.', [
+        ({'queue': 'ingest'}, ingest_depth),
+        ({'queue': 'card_views'}, view_counter.pending()),
+        ({'queue': 'api_usage'}, usage_counter.pending()),
+        ({'queue': 'reminders'}, reminders['pending'] if reminders else 0),
+        ({'queue': 'static_cards'}, publisher['pending'] if publisher else 0)
+    ])
+    events = event_hub.stats()
+    out.gauge('event_stream_connections', 'Open server-sent event streams.', [({}, events['connections'])])
+    out.gauge('event_stream_users', 'Users with at least one open event stream.', [({}, events['users'])])
+    out.counter('event_notifications_dispatched_total', 'Notifications read by the event hub.', [({}, events['dispatched'])])
+    domains = domain_index.stats()
+    out.gauge('domain_index_entries', 'Active companies and custom domains held in the domain index.',
+              [({'kind': 'companies'}, domains['companies']), ({'kind': 'domains'}, domains['domains'])])
+    if publisher:
+        out.counter('static_cards_published_total', 'Static card pages written.', [({}, publisher['published'])])
+        out.counter('static_cards_publish_errors_total', 'Static card publish runs that failed.', [({}, publisher['errors'])])
+    out.gauge('process_uptime_seconds', 'Seconds since this worker process started.', [({}, time.time() - STARTED_AT)])
+
+# Prometheus scrape endpoint, only served when METRICS_TOKEN is set and
+# always behind it. Everything is read from in-process counters
+# except the ingest queue and dead-letter counts, over tables that are
+# normally empty.
+@metrics_bp.route('/metrics')
+def metrics():
+    if not Config.METRICS_TOKEN:
+        return render_template('errors/404.html'), 404
+    if not authorized():
+        return 'Unauthorized', 401
+    out = Exposition()
+    request_metrics(out)
+    database_metrics(out)
+    depth = ingest_metrics(out, get_db())
+    cache_metrics(out)
+    background_metrics(out, depth)
+    return out.render(), 200, {'Content-Type': PROMETHEUS_CONTENT_TYPE}
@@ -2,18 +2,16 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request,
 from datetime import datetime, timedelta
 from config import Config
 from paytm_checksum import generate_checksum, verify_checksum
+from plan_expiry import schedule_company
+from cache import get_session_user
+from domains import company_changed
 import uuid
 import json
+from db import get_request_db as get_db
+from queries import PAYMENT_BY_ORDER
 
 payment_bp = Blueprint('payment', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 def payment_required(f):
     from functools import wraps
     @wraps(f)
@@ -62,7 +60,9 @@ def initiate_payment(plan):
     paytm_urls = Config.get_paytm_urls()
     callback_url = request.host_url.rstrip('/') + url_for('payment.callback')
     
-    user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+    user = get_session_user()
+    if user is None:
+        return redirect(url_for('auth.auth_logout'))
     
     paytm_params = {
         'MID': Config.PAYTM_MERCHANT_ID,
@@ -92,7 +92,7 @@ def callback():
     checksum = paytm_response.get('CHECKSUMHASH')
     
     db = get_db()
-    payment = db.execute('SELECT * FROM payments WHERE order_id = ?', (order_id,)).fetchone()
+    payment = db.execute(PAYMENT_BY_ORDER, (order_id,)).fetchone()
     
     if not payment:
         flash('Payment record not found.', 'danger')
@@ -134,6 +134,9 @@ def callback():
                   1 if plan_config['white_label'] else 0, company['id']))
         
         db.commit()
+        if plan_config:
+            schedule_company(company['id'], payment['plan'], expiry_date)
+            company_changed(db, company['id'])
         
         flash(f'Payment successful! Your plan has been upgraded to {plan_config["name"]}.', 'success')
         return redirect(url_for('payment.success', order_id=order_id))
@@ -182,7 +185,7 @@ def success(order_id):
 @payment_required
 def failed(order_id):
     db = get_db()
-    payment = db.execute('SELECT * FROM payments WHERE order_id = ?', (order_id,)).fetchone()
+    payment = db.execute(PAYMENT_BY_ORDER, (order_id,)).fetchone()
     
     if not payment:
         return render_template('errors/404.html'), 404
@@ -1,122 +1,139 @@
-from flask import Blueprint, render_template, request
-import uuid
+from flask import Blueprint, abort, render_template, request
+from cache import get_master_settings
+from leads import ingest_lead
+from page_cache import cached_page, company_page_key
+from domains import resolve_slug, resolve_host
+from db import get_request_db as get_db
 
 public_bp = Blueprint('public', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
+# Paths a company's custom domain serves from its root, mapped to the
+# microsite views below.
+CUSTOM_DOMAIN_PAGES = {
+    '/': 'home',
+    '/about': 'about',
+    '/features': 'features',
+    '/pricing': 'pricing',
+    '/contact': 'contact',
+    '/privacy': 'privacy',
+    '/terms': 'terms'
+}
+
+def platform_page(page, template):
+    return cached_page(('platform', page), lambda: render_template(template, settings=get_master_settings()))
+
+# The index can briefly outlive a company deleted by another worker.
+def load_company(company_id):
+    company = get_db().execute('SELECT * FROM companies WHERE id = ?', (company_id,)).fetchone()
+    if company is None:
+        abort(404)
+    return company
+
+# The slug is resolved from the in-memory domain index, so a cached page is
+# served without touching the database; the full row is only loaded to render.
+def company_page(slug, page, template):
+    entry = resolve_slug(slug)
+    if not entry:
+        return render_template('errors/404.html'), 404
+    return cached_page(company_page_key(entry, page),
+                       lambda: render_template(template, company=load_company(entry['id'])))
+
+@public_bp.before_app_request
+def serve_custom_domain():
+    page = CUSTOM_DOMAIN_PAGES.get(request.path)
+    if page is None:
+        return None
+    entry = resolve_host(request.host)
+    if entry is None:
+        return None
+    return COMPANY_VIEWS[page](entry['slug'])
 
 @public_bp.route('/')
 def home():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return render_template('public/home.html', settings=settings)
+    return platform_page('home', 'public/home.html')
 
 @public_bp.route('/about')
 def about():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return render_template('public/about.html', settings=settings)
+    return platform_page('about', 'public/about.html')
 
 @public_bp.route('/features')
 def features():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return render_template('public/features.html', settings=settings)
+    return platform_page('features', 'public/features.html')
 
 @public_bp.route('/privacy-policy')
 def privacy():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return render_template('public/privacy.html', settings=settings)
+    return platform_page('privacy', 'public/privacy.html')
 
 @public_bp.route('/terms-conditions')
 def terms():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    return render_template('public/terms.html', settings=settings)
+    return platform_page('terms', 'public/terms.html')
 
 @public_bp.route('/showcase')
 def showcase():
-    db = get_db()
-    settings = db.execute('SELECT * FROM master_settings LIMIT 1').fetchone()
-    projects = db.execute('SELECT * FROM master_showcase_projects ORDER BY display_order').fetchall()
-    companies = db.execute('SELECT * FROM companies WHERE is_active = 1').fetchall()
-    return render_template('public/showcase.html', settings=settings, projects=projects, companies=companies)
+    def render():
+        db = get_db()
+        projects = db.execute('SELECT * FROM master_showcase_projects ORDER BY display_order').fetchall()
+        companies = db.execute('SELECT * FROM companies WHERE is_active = 1').fetchall()
+        return render_template('public/showcase.html', settings=get_master_settings(), projects=projects, companies=companies)
+    return cached_page(('platform', 'showcase'), render)
 
 @public_bp.route('/company/<slug>')
 def company_home(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/home.html', company=company)
+    return company_page(slug, 'home', 'public/company/home.html')
 
 @public_bp.route('/company/<slug>/about')
 def company_about(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/about.html', company=company)
+    return company_page(slug, 'about', 'public/company/about.html')
 
 @public_bp.route('/company/<slug>/features')
 def company_features(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/features.html', company=company)
+    return company_page(slug, 'features', 'public/company/features.html')
 
 @public_bp.route('/company/<slug>/pricing')
 def company_pricing(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/pricing.html', company=company)
+    return company_page(slug, 'pricing', 'public/company/pricing.html')
 
 @public_bp.route('/company/<slug>/contact', methods=['GET', 'POST'])
 def company_contact(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
+    if request.method == 'GET':
+        return company_page(slug, 'contact', 'public/company/contact.html')
+    
+    entry = resolve_slug(slug)
+    if not entry:
         return render_template('errors/404.html'), 404
+    db = get_db()
+    company = load_company(entry['id'])
+    
+    name = request.form.get('name', '').strip()
+    phone = request.form.get('phone', '').strip()
+    email = request.form.get('email', '').strip()
+    message = request.form.get('message', '').strip()
     
-    if request.method == 'POST':
-        name = request.form.get('name', '').strip()
-        phone = request.form.get('phone', '').strip()
-        email = request.form.get('email', '').strip()
-        message = request.form.get('message', '').strip()
+    if phone:
+        ingest_lead(db, company, {
+            'name': name, 'phone': phone, 'email': email, 'source': 'contact_form',
+            'ip_address': request.remote_addr, 'remarks': message
+        })
+        db.commit()
         
-        if phone:
-            lead_uid = str(uuid.uuid4())
-            db.execute('''
-                INSERT INTO leads (uid, name, phone, email, source, company_id, ip_address, remarks)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (lead_uid, name, phone, email, 'contact_form', company['id'], request.remote_addr, message))
-            db.commit()
-            
-            return render_template('public/company/contact.html', company=company, success=True)
+        return render_template('public/company/contact.html', company=company, success=True)
     
     return render_template('public/company/contact.html', company=company)
 
 @public_bp.route('/company/<slug>/privacy')
 def company_privacy(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/privacy.html', company=company)
+    return company_page(slug, 'privacy', 'public/company/privacy.html')
 
 @public_bp.route('/company/<slug>/terms')
 def company_terms(slug):
-    db = get_db()
-    company = db.execute('SELECT * FROM companies WHERE slug = ? AND is_active = 1', (slug,)).fetchone()
-    if not company:
-        return render_template('errors/404.html'), 404
-    return render_template('public/company/terms.html', company=company)
+    return company_page(slug, 'terms', 'public/company/terms.html')
+
+COMPANY_VIEWS = {
+    'home': company_home,
+    'about': company_about,
+    'features': company_features,
+    'pricing': company_pricing,
+    'contact': company_contact,
+    'privacy': company_privacy,
+    'terms': company_terms
+}
@@ -1,15 +1,17 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, session
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session, jsonify, Response
 from datetime import datetime
+from config import Config
+from cache import get_session_user
+from pagination import decode_cursor, keyset_page
+from search import build_match_query, match_clause
+from followups import follow_up_agenda, serialize_agenda
+from reminders import schedule_follow_up
+from events import EventStream, unread_count
+from db import get_request_db as get_db
+from queries import ASSIGNED_LEADS_COUNT, ASSIGNED_LEADS_PAGE, ASSIGNED_NEW_LEADS_COUNT, ASSIGNED_RECENT_LEADS, LEAD_CALLS, USER_CALLS_PAGE, USER_NOTIFICATIONS_PAGE, USER_RECENT_CALLS, USER_RECENT_UNREAD
 
 sales_bp = Blueprint('sales', __name__)
 
-def get_db():
-    from flask import g
-    from db import get_db_connection
-    if 'db' not in g:
-        g.db = get_db_connection()
-    return g.db
-
 def sales_required(f):
     from functools import wraps
     @wraps(f)
@@ -30,31 +32,21 @@ def dashboard():
     user_id = session['user_id']
     company = db.execute('SELECT * FROM companies WHERE id = ?', (session.get('company_id'),)).fetchone()
     
-    total_leads = db.execute('SELECT COUNT(*) FROM leads WHERE assigned_to = ?', (user_id,)).fetchone()[0]
-    new_leads = db.execute("SELECT COUNT(*) FROM leads WHERE assigned_to = ? AND status = 'new'", (user_id,)).fetchone()[0]
-    
-    today = datetime.utcnow().strftime('%Y-%m-%d')
-    today_followups = db.execute('''
-        SELECT * FROM leads WHERE assigned_to = ? AND date(follow_up_date) = ? 
-        ORDER BY follow_up_date
-    ''', (user_id, today)).fetchall()
+    total_leads = db.execute(ASSIGNED_LEADS_COUNT, (user_id,)).fetchone()[0]
+    new_leads = db.execute(ASSIGNED_NEW_LEADS_COUNT, (user_id,)).fetchone()[0]
     
-    missed_followups = db.execute('''
-        SELECT * FROM leads WHERE assigned_to = ? AND date(follow_up_date) < ? 
-        AND status NOT IN ('converted', 'closed') ORDER BY follow_up_date DESC
-    ''', (user_id, today)).fetchall()
+    agenda = follow_up_agenda(db, user_id)
     
-    recent_leads = db.execute('SELECT * FROM leads WHERE assigned_to = ? ORDER BY created_at DESC LIMIT 10', (user_id,)).fetchall()
-    recent_calls = db.execute('SELECT ch.*, l.name, l.phone FROM call_history ch JOIN leads l ON ch.lead_id = l.id WHERE ch.user_id = ? ORDER BY ch.created_at DESC LIMIT 10', (user_id,)).fetchall()
+    recent_leads = db.execute(ASSIGNED_RECENT_LEADS, (user_id,)).fetchall()
+    recent_calls = db.execute(USER_RECENT_CALLS, (user_id,)).fetchall()
     
-    notifications = db.execute('SELECT * FROM notifications WHERE user_id = ? AND is_read = 0 ORDER BY created_at DESC LIMIT 5', (user_id,)).fetchall()
+    notifications = db.execute(USER_RECENT_UNREAD, (user_id,)).fetchall()
     
     cards = db.execute('SELECT * FROM visiting_cards WHERE user_id = ?', (user_id,)).fetchall()
     total_card_views = db.execute('SELECT COALESCE(SUM(views_count), 0) FROM visiting_cards WHERE user_id = ?', (user_id,)).fetchone()[0]
     
     return render_template('sales/dashboard.html', company=company,
-        total_leads=total_leads, new_leads=new_leads, today_followups=today_followups,
-        missed_followups=missed_followups, recent_leads=recent_leads, recent_calls=recent_calls,
+        total_leads=total_leads, new_leads=new_leads, agenda=agenda, recent_leads=recent_leads, recent_calls=recent_calls,
         notifications=notifications, cards=cards, total_card_views=total_card_views)
 
 @sales_bp.route('/leads')
@@ -65,15 +57,19 @@ def leads():
     
     db = get_db()
     user_id = session['user_id']
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     status = request.args.get('status', '')
     source = request.args.get('source', '')
+    search = request.args.get('search', '').strip()
     per_page = 50
-    offset = (page - 1) * per_page
     
-    query = 'SELECT * FROM leads WHERE assigned_to = ?'
+    query = ASSIGNED_LEADS_PAGE
     params = [user_id]
     
+    match = build_match_query(search, 'leads_fts')
+    if match:
+        query += ' AND ' + match_clause('leads_fts', 'id')
+        params.append(match)
     if status:
         query += ' AND status = ?'
         params.append(status)
@@ -81,13 +77,10 @@ def leads():
         query += ' AND source = ?'
         params.append(source)
     
-    query += ' ORDER BY created_at DESC LIMIT ? OFFSET ?'
-    params.extend([per_page, offset])
-    
-    leads = db.execute(query, params).fetchall()
+    leads, next_cursor = keyset_page(db, query, params, cursor, per_page)
     
     return render_template('sales/leads.html', leads=leads, 
-                          selected_status=status, selected_source=source, page=page)
+                          selected_status=status, selected_source=source, search=search, next_cursor=next_cursor)
 
 @sales_bp.route('/leads/<int:id>')
 @sales_required
@@ -102,7 +95,7 @@ def view_lead(id):
     if not lead:
         return render_template('errors/404.html'), 404
     
-    call_history = db.execute('SELECT ch.*, u.username FROM call_history ch LEFT JOIN users u ON ch.user_id = u.id WHERE ch.lead_id = ? ORDER BY ch.created_at DESC', (id,)).fetchall()
+    call_history = db.execute(LEAD_CALLS, (id,)).fetchall()
     
     return render_template('sales/view_lead.html', lead=lead, call_history=call_history)
 
@@ -144,6 +137,7 @@ def update_lead(id):
         id
     ))
     db.commit()
+    schedule_follow_up(id, full_follow_up, request.form.get('status', lead['status']))
     
     flash('Lead updated successfully!', 'success')
     return redirect(url_for('sales.view_lead', id=id))
@@ -176,28 +170,20 @@ def follow_ups():
     if session.get('role') != 'sales_person':
         return redirect(url_for('company.leads'))
     
-    db = get_db()
-    user_id = session['user_id']
-    today = datetime.utcnow().strftime('%Y-%m-%d')
-    
-    today_followups = db.execute('''
-        SELECT * FROM leads WHERE assigned_to = ? AND date(follow_up_date) = ?
-        ORDER BY follow_up_date
-    ''', (user_id, today)).fetchall()
-    
-    upcoming_followups = db.execute('''
-        SELECT * FROM leads WHERE assigned_to = ? AND date(follow_up_date) > ?
-        ORDER BY follow_up_date LIMIT 20
-    ''', (user_id, today)).fetchall()
-    
-    missed_followups = db.execute('''
-        SELECT * FROM leads WHERE assigned_to = ? AND date(follow_up_date) < ?
-        AND status NOT IN ('converted', 'closed') ORDER BY follow_up_date DESC
-    ''', (user_id, today)).fetchall()
-    
-    return render_template('sales/follow_ups.html',
-        today_followups=today_followups, upcoming_followups=upcoming_followups,
-        missed_followups=missed_followups)
+    agenda = follow_up_agenda(get_db(), session['user_id'])
+    return render_template('sales/follow_ups.html', agenda=agenda)
+
+@sales_bp.route('/follow-ups/agenda')
+@sales_required
+def follow_up_agenda_json():
+    if session.get('role') != 'sales_person':
+        return jsonify({'error': 'Only sales people have a follow-up agenda'}), 403
+    
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, 100))
+    agenda = follow_up_agenda(get_db(), session['user_id'], limit=limit)
+    return jsonify({'status': 'success', 'data': serialize_agenda(agenda)})
 
 @sales_bp.route('/call-history')
 @sales_required
@@ -206,17 +192,12 @@ def call_history():
         return redirect(url_for('company.dashboard'))
     
     db = get_db()
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     per_page = 50
-    offset = (page - 1) * per_page
     
-    calls = db.execute('''
-        SELECT ch.*, l.name, l.phone FROM call_history ch 
-        JOIN leads l ON ch.lead_id = l.id 
-        WHERE ch.user_id = ? ORDER BY ch.created_at DESC LIMIT ? OFFSET ?
-    ''', (session['user_id'], per_page, offset)).fetchall()
+    calls, next_cursor = keyset_page(db, USER_CALLS_PAGE, [session['user_id']], cursor, per_page, alias='ch')
     
-    return render_template('sales/call_history.html', calls=calls, page=page)
+    return render_template('sales/call_history.html', calls=calls, next_cursor=next_cursor)
 
 @sales_bp.route('/my-cards')
 @sales_required
@@ -232,15 +213,30 @@ def my_cards():
 @sales_required
 def notifications():
     db = get_db()
-    page = request.args.get('page', 1, type=int)
+    cursor = decode_cursor(request.args.get('cursor'))
     per_page = 50
-    offset = (page - 1) * per_page
     
-    notifications = db.execute('''
-        SELECT * FROM notifications WHERE user_id = ? ORDER BY created_at DESC LIMIT ? OFFSET ?
-    ''', (session['user_id'], per_page, offset)).fetchall()
+    notifications, next_cursor = keyset_page(db, USER_NOTIFICATIONS_PAGE,
+                                             [session['user_id']], cursor, per_page)
     
-    return render_template('sales/notifications.html', notifications=notifications, page=page)
+    return render_template('sales/notifications.html', notifications=notifications, next_cursor=next_cursor)
+
+@sales_bp.route('/notifications/unread-count')
+@sales_required
+def notifications_unread_count():
+    return jsonify({'unread': unread_count(get_db(), session['user_id'])})
+
+@sales_bp.route('/events')
+@sales_required
+def events():
+    if not Config.SSE_ENABLED:
+        return render_template('errors/404.html'), 404
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('last_event_id', type=int)
+    stream = EventStream(get_db(), session['user_id'], last_id)
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @sales_bp.route('/notifications/<int:id>/read', methods=['POST'])
 @sales_required
@@ -271,7 +267,9 @@ def mark_all_read():
 @sales_required
 def profile():
     db = get_db()
-    user = db.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
+    user = get_session_user()
+    if user is None:
+        return redirect(url_for('auth.auth_logout'))
     
     if request.method == 'POST':
         from werkzeug.security import check_password_hash, generate_password_hash
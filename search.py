@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+import re
+import sys
+
+from db import get_db_connection
+
+PHONE_SEPARATORS = ' -+().'
+PHONE_SUFFIX_LENGTHS = range(4, 11)
+MAX_TERMS = 8
+PHONE_QUERY = re.compile(r'^[\d\s\-+().]+$')
+
+def digits_sql(expr):
+    expr = f"COALESCE({expr}, '')"
+    for ch in PHONE_SEPARATORS:
+        expr = f"replace({expr}, '{ch}', '')"
+    return expr
+
+# Indexes the digits of a phone number followed by its last 4..10 digits as
+# separate tokens, so suffix searches become token prefix matches. Plain SQL
+# keeps the triggers usable from any SQLite client.
+def phone_terms_sql(expr):
+    terms = " || ' ' || ".join(['d'] + [f'substr(d, -{n})' for n in PHONE_SUFFIX_LENGTHS])
+    return f'(SELECT {terms} FROM (SELECT {digits_sql(expr)} AS d))'
+
+FTS_INDEXES = {
+    'leads_fts': {
+        'table': 'leads',
+        'columns': {
+            'name': '{ref}.name',
+            'phone': phone_terms_sql('{ref}.phone'),
+            'email': '{ref}.email',
+            'remarks': '{ref}.remarks'
+        }
+    },
+    'companies_fts': {
+        'table': 'companies',
+        'columns': {
+            'name': '{ref}.name',
+            'slug': '{ref}.slug',
+            'email': '{ref}.email'
+        }
+    },
+    'cards_fts': {
+        'table': 'visiting_cards',
+        'columns': {
+            'name': '{ref}.name',
+            'designation': '{ref}.designation',
+            'phone': phone_terms_sql('{ref}.phone'),
+            'email': '{ref}.email'
+        }
+    }
+}
+
+def column_values(spec, ref):
+    return ', '.join(expr.format(ref=ref) for expr in spec['columns'].values())
+
+# The indexes are contentless, so removing a row means replaying the exact
+# values it was indexed with through the 'delete' command. Index columns are
+# named after the base table columns they are derived from.
+def fts_triggers(index, spec):
+    table = spec['table']
+    columns = ', '.join(spec['columns'])
+    insert = f'INSERT INTO {index} (rowid, {columns}) VALUES (NEW.id, {column_values(spec, "NEW")});'
+    delete = f"INSERT INTO {index} ({index}, rowid, {columns}) VALUES ('delete', OLD.id, {column_values(spec, 'OLD')});"
+    changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in spec['columns'])
+    return {
+        f'{index}_insert': f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN
+                {insert}
+            END
+        ''',
+        f'{index}_delete': f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN
+                {delete}
+            END
+        ''',
+        f'{index}_update': f'''
+            CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {columns} ON {table}
+            WHEN {changed}
+            BEGIN
+                {delete}
+                {insert}
+            END
+        '''
+    }
+
+SEARCH_TRIGGERS = {}
+for _index, _spec in FTS_INDEXES.items():
+    SEARCH_TRIGGERS.update(fts_triggers(_index, _spec))
+
+def create_search_schema(conn):
+    for index, spec in FTS_INDEXES.items():
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (index,)).fetchone()
+        conn.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {index} USING fts5(
+                {', '.join(spec['columns'])}, content='', prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+            )
+        ''')
+        if not exists:
+            rebuild_index(conn, index)
+    for statement in SEARCH_TRIGGERS.values():
+        conn.execute(statement)
+
+def drop_search_triggers(conn):
+    for name in SEARCH_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def rebuild_index(conn, index):
+    spec = FTS_INDEXES[index]
+    conn.execute(f"INSERT INTO {index} ({index}) VALUES ('delete-all')")
+    conn.execute(f'''
+        INSERT INTO {index} (rowid, {', '.join(spec['columns'])})
+        SELECT id, {column_values(spec, spec['table'])} FROM {spec['table']}
+    ''')
+    conn.execute(f"INSERT INTO {index} ({index}) VALUES ('optimize')")
+
+# Turns free text into an FTS5 query for the given index where every word
+# must match as a prefix. Input that looks like a phone number is matched on
+# its digits against the phone column only, which also covers suffixes.
+def build_match_query(text, index):
+    text = (text or '').strip()
+    if not text:
+        return None
+    if PHONE_QUERY.match(text) and 'phone' in FTS_INDEXES[index]['columns']:
+        digits = re.sub(r'\D', '', text)
+        return f'phone : "{digits}"*' if digits else None
+    terms = re.findall(r'\w+', text)[:MAX_TERMS]
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+def match_clause(index, column):
+    return f'{column} IN (SELECT rowid FROM {index} WHERE {index} MATCH ?)'
+
+def main():
+    indexes = sys.argv[1:] or list(FTS_INDEXES)
+    unknown = [index for index in indexes if index not in FTS_INDEXES]
+    if unknown:
+        print(f"Unknown index: {', '.join(unknown)}")
+        print(f"Usage: python search.py [{' | '.join(FTS_INDEXES)}]...")
+        sys.exit(1)
+
+    conn = get_db_connection()
+    try:
+        for index in indexes:
+            rebuild_index(conn, index)
+            conn.commit()
+            print(f"Rebuilt {index}.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
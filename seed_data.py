@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+import argparse
+import calendar
+import random
+import time
+import uuid
+from datetime import datetime
+from itertools import accumulate
+from werkzeug.security import generate_password_hash
+
+from config import Config
+from db import CONNECTION_PRAGMAS, get_db_connection, init_database
+from init_db import create_master_admin, create_master_settings
+from stats import drop_stats_triggers, rebuild_stats
+from rollups import drop_rollup_triggers, rebuild_rollups
+from search import FTS_INDEXES, drop_search_triggers, rebuild_index
+
+SEED_PASSWORD = 'Seed@1234'
+BATCH_SIZE = 20000
+HISTORY_DAYS = 730
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Secondary indexes on these tables are dropped for the load and recreated
+# by init_database() afterwards, which is much faster than maintaining them
+# row by row.
+BULK_TABLES = ('users', 'visiting_cards', 'leads', 'call_history', 'notifications', 'payments',
+               'api_keys', 'card_views_daily')
+BULK_PRAGMAS = [
+    "PRAGMA foreign_keys = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY"
+]
+
+PLAN_WEIGHTS = {'free': 50, 'basic': 35, 'pro': 15}
+# Relative number of leads, and the range of sales people, per plan.
+PLAN_SCALE = {'free': 0.3, 'basic': 1.0, 'pro': 3.5}
+PLAN_SALES = {'free': (1, 2), 'basic': (2, 6), 'pro': (5, 25)}
+SOURCE_WEIGHTS = {'facebook_ads': 40, 'google_ads': 30, 'website': 10, 'contact_form': 8, 'card_call': 7, 'api': 5}
+STATUS_WEIGHTS = {'new': 30, 'contacted': 25, 'follow_up': 15, 'interested': 12, 'converted': 8, 'closed': 10}
+# Chance that a lead in each status carries a follow-up date.
+FOLLOW_UP_RATES = {'new': 0.05, 'contacted': 0.4, 'follow_up': 1.0, 'interested': 0.5, 'converted': 0.0, 'closed': 0.0}
+ASSIGNED_RATE = 0.75
+EMAIL_RATE = 0.6
+ACTIVE_COMPANY_RATE = 0.95
+CUSTOM_DOMAIN_RATE = 0.2
+FAILED_PAYMENT_RATE = 0.1
+
+FIRST_NAMES = ('Aarav', 'Vivaan', 'Aditya', 'Vihaan', 'Arjun', 'Sai', 'Reyansh', 'Krishna', 'Ishaan', 'Rohan',
+               'Ananya', 'Diya', 'Priya', 'Kavya', 'Saanvi', 'Meera', 'Pooja', 'Neha', 'Sneha', 'Riya')
+LAST_NAMES = ('Sharma', 'Verma', 'Gupta', 'Singh', 'Patel', 'Kumar', 'Reddy', 'Nair', 'Iyer', 'Mehta',
+              'Joshi', 'Shah', 'Das', 'Rao', 'Jain', 'Kapoor', 'Malhotra', 'Chopra', 'Bose', 'Mishra')
+COMPANY_WORDS = ('Apex', 'Blue', 'Bright', 'Prime', 'Urban', 'Green', 'Silver', 'Royal', 'Smart', 'Nova')
+COMPANY_KINDS = ('Realty', 'Motors', 'Infotech', 'Interiors', 'Travels', 'Clinic', 'Academy', 'Foods', 'Traders', 'Homes')
+DESIGNATIONS = ('Sales Executive', 'Sales Manager', 'Business Development Executive', 'Relationship Manager')
+REMARKS = ('Asked for a callback', 'Interested in the premium package', 'Wants pricing by email',
+           'Comparing with another vendor', 'Budget approval pending', 'Requested a site visit')
+CALL_NOTES = ('Discussed requirements', 'No answer, will retry', 'Shared brochure', 'Negotiating price', None)
+
+def weighted(weights):
+    return list(weights), list(accumulate(weights.values()))
+
+# Writes a deterministic multi-tenant dataset: the same seed and as-of date
+# always produce the same rows. Ids are assigned here rather than by SQLite so
+# child rows can reference them without reading anything back.
+class SeedGenerator:
+    def __init__(self, conn, seed, avg_leads, as_of):
+        self.conn = conn
+        self.rng = random.Random(seed)
+        self.avg_leads = avg_leads
+        self.now = calendar.timegm(as_of.timetuple())
+        self.now_ts = self.ts(self.now)
+        self.read_before = self.ts(self.now - 7 * 86400)
+        self.password_hash = generate_password_hash(SEED_PASSWORD)
+        self.plans = weighted(PLAN_WEIGHTS)
+        self.sources = weighted(SOURCE_WEIGHTS)
+        self.statuses = weighted(STATUS_WEIGHTS)
+        self.plan_scale = sum(PLAN_WEIGHTS[plan] * PLAN_SCALE[plan] for plan in PLAN_WEIGHTS) / sum(PLAN_WEIGHTS.values())
+        self.next_ids = {table: (conn.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0) + 1
+                         for table in ('companies', 'users', 'visiting_cards', 'leads', 'payments')}
+        self.batches = {}
+        self.counts = {}
+
+    def next_id(self, table):
+        value = self.next_ids[table]
+        self.next_ids[table] = value + 1
+        return value
+
+    def uid(self):
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+    def ts(self, seconds):
+        return time.strftime(TIMESTAMP_FORMAT, time.gmtime(seconds))
+
+    def pick(self, weighted):
+        population, cum_weights = weighted
+        return self.rng.choices(population, cum_weights=cum_weights)[0]
+
+    def between(self, start, end):
+        return self.rng.randint(start, max(start, end))
+
+    def person(self):
+        return f'{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}'
+
+    def phone(self):
+        return f'{self.rng.randint(6, 9)}{self.rng.randrange(10 ** 9):09d}'
+
+    def add(self, table, sql, row):
+        batch = self.batches.setdefault(table, (sql, []))[1]
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            self.flush(table)
+
+    def flush(self, table=None):
+        for name in [table] if table else list(self.batches):
+            sql, rows = self.batches[name]
+            if rows:
+                self.conn.executemany(sql, rows)
+                self.counts[name] = self.counts.get(name, 0) + len(rows)
+                rows.clear()
+
+    def company(self):
+        rng = self.rng
+        company_id = self.next_id('companies')
+        plan = self.pick(self.plans)
+        plan_config = Config.PLANS[plan]
+        created = self.now - rng.randrange(HISTORY_DAYS * 86400)
+        expiry = self.payments(company_id, plan, created)
+        name = f'{rng.choice(COMPANY_WORDS)} {rng.choice(COMPANY_KINDS)} {company_id}'
+        custom_domain = f'seed-{company_id}.example.com' if plan == 'pro' and rng.random() < CUSTOM_DOMAIN_RATE else None
+        self.add('companies', '''
+            INSERT INTO companies (id, uid, name, slug, email, phone, custom_domain, plan, plan_expiry_date,
+                                   cards_limit, white_label_enabled, is_active, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (company_id, self.uid(), name, f'seed-{company_id}', f'contact@seed-{company_id}.test', self.phone(),
+              custom_domain, plan, self.ts(expiry), plan_config['cards_limit'], int(plan_config['white_label']),
+              int(rng.random() < ACTIVE_COMPANY_RATE), self.ts(created)))
+        if plan != 'free':
+            self.add('api_keys', '''
+                INSERT INTO api_keys (company_id, key, name, source_type, created_at) VALUES (?, ?, ?, ?, ?)
+            ''', (company_id, f'{rng.getrandbits(256):064x}', 'Lead forms', 'api', self.ts(created)))
+
+        self.user(company_id, f'seed{company_id}-admin', 'company_admin', created)
+        sales = [self.user(company_id, f'seed{company_id}-sales{n}', 'sales_person', created)
+                 for n in range(1, rng.randint(*PLAN_SALES[plan]) + 1)]
+        limit = plan_config['cards_limit']
+        cards = [self.card(company_id, user_id, created) for user_id in (sales if limit < 0 else sales[:limit])]
+        leads = int(self.avg_leads * PLAN_SCALE[plan] / self.plan_scale * rng.expovariate(1.0))
+        for _ in range(leads):
+            self.lead(company_id, created, sales, cards)
+
+    # Payment history for paid plans: one successful payment per plan period
+    # since the company signed up, with the odd failed attempt. Returns the
+    # plan expiry timestamp.
+    def payments(self, company_id, plan, created):
+        plan_config = Config.PLANS[plan]
+        period = plan_config['days'] * 86400
+        if plan == 'free':
+            return created + period
+        paid_at = created
+        while True:
+            if self.rng.random() < FAILED_PAYMENT_RATE:
+                self.payment(company_id, plan, paid_at - 600, 'failed')
+            self.payment(company_id, plan, paid_at, 'success')
+            if paid_at + period > self.now:
+                return paid_at + period
+            paid_at += period + self.rng.randrange(3 * 86400)
+
+    def payment(self, company_id, plan, paid_at, status):
+        payment_id = self.next_id('payments')
+        day = time.strftime('%Y%m%d', time.gmtime(paid_at))
+        order_id = f"ORD{time.strftime('%Y%m%d%H%M%S', time.gmtime(paid_at))}{company_id}{self.rng.getrandbits(24):06X}"
+        success = status == 'success'
+        self.add('payments', '''
+            INSERT INTO payments (id, uid, company_id, order_id, transaction_id, amount, plan, status, payment_mode,
+                                  checksum_verified, invoice_number, created_at, completed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (payment_id, self.uid(), company_id, order_id, f'TXN{payment_id:012d}', Config.PLANS[plan]['price'],
+              plan, status, self.rng.choice(('UPI', 'CC', 'DC', 'NB')), 1,
+              f'INV{day}{payment_id:06d}' if success else None, self.ts(paid_at),
+              self.ts(paid_at + 30) if success else None))
+
+    def user(self, company_id, username, role, created):
+        user_id = self.next_id('users')
+        self.add('users', '''
+            INSERT INTO users (id, uid, username, email, password_hash, role, company_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, self.uid(), username, f'{username}@seed.test', self.password_hash, role, company_id,
+              self.ts(created)))
+        return user_id
+
+    def card(self, company_id, user_id, created):
+        rng = self.rng
+        card_id = self.next_id('visiting_cards')
+        views = 0
+        for days_ago in range(30):
+            daily = int(rng.expovariate(0.2)) if rng.random() < 0.6 else 0
+            if daily:
+                views += daily
+                self.add('card_views_daily', '''
+                    INSERT INTO card_views_daily (card_id, company_id, day, views) VALUES (?, ?, ?, ?)
+                ''', (card_id, company_id, time.strftime('%Y-%m-%d', time.gmtime(self.now - days_ago * 86400)), daily))
+        self.add('visiting_cards', '''
+            INSERT INTO visiting_cards (id, uid, user_id, company_id, name, designation, phone, email,
+                                        views_count, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (card_id, self.uid(), user_id, company_id, self.person(), rng.choice(DESIGNATIONS), self.phone(),
+              f'card{card_id}@seed.test', views + rng.randrange(500), self.ts(created)))
+        return card_id
+
+    def lead(self, company_id, company_created, sales, cards):
+        rng = self.rng
+        lead_id = self.next_id('leads')
+        created = self.between(company_created, self.now)
+        source = self.pick(self.sources)
+        status = self.pick(self.statuses)
+        assigned_to = rng.choice(sales) if sales and rng.random() < ASSIGNED_RATE else None
+        name = self.person()
+        phone = self.phone()
+
+        follow_up_date = follow_up_time = notified = None
+        if rng.random() < FOLLOW_UP_RATES[status]:
+            follow_up_time = f'{rng.randint(9, 18):02d}:{rng.choice((0, 15, 30, 45)):02d}'
+            day = time.strftime('%Y-%m-%d', time.gmtime(self.between(created, self.now + 30 * 86400)))
+            follow_up_date = f'{day} {follow_up_time}:00'
+            # Past follow-ups count as already reminded, so the reminder
+            # scheduler doesn't notify for the whole history at startup.
+            if assigned_to and follow_up_date <= self.now_ts:
+                notified = follow_up_date
+                self.notification(assigned_to, 'Follow-up Due', f'Time to follow up with {name} ({follow_up_time}).',
+                                  'follow_up', lead_id, follow_up_date)
+
+        last_contacted = None
+        if assigned_to and status != 'new':
+            calls = sorted(self.between(created, self.now) for _ in range(rng.randint(1, 4)))
+            for called in calls:
+                self.add('call_history', '''
+                    INSERT INTO call_history (lead_id, user_id, call_type, duration, notes, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (lead_id, assigned_to, 'outgoing' if rng.random() < 0.8 else 'incoming',
+                      rng.randint(0, 20), rng.choice(CALL_NOTES), self.ts(called)))
+            last_contacted = self.ts(calls[-1])
+        if assigned_to:
+            self.notification(assigned_to, 'New Lead Assigned', f'A new lead ({name}) has been assigned to you.',
+                              'lead_assigned', lead_id, self.ts(created))
+
+        self.add('leads', '''
+            INSERT INTO leads (id, uid, name, phone, phone_norm, email, source, ip_address, company_id, assigned_to,
+                               card_id, status, remarks, follow_up_date, follow_up_time, follow_up_notified,
+                               last_contacted, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (lead_id, self.uid(), name, phone, f'+{Config.DEFAULT_COUNTRY_CODE}{phone}',
+              f'lead{lead_id}@example.com' if rng.random() < EMAIL_RATE else None, source,
+              f'10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}' if source in ('website', 'contact_form') else None,
+              company_id, assigned_to, rng.choice(cards) if source == 'card_call' and cards else None, status,
+              rng.choice(REMARKS) if status != 'new' and rng.random() < 0.3 else None,
+              follow_up_date, follow_up_time, notified, last_contacted,
+              self.ts(created), last_contacted or self.ts(created)))
+
+    def notification(self, user_id, title, message, kind, lead_id, created_at):
+        # Anything older than a week has been read.
+        is_read = created_at < self.read_before or self.rng.random() < 0.5
+        self.add('notifications', '''
+            INSERT INTO notifications (user_id, title, message, type, is_read, link, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, title, message, kind, int(is_read), f'/sales/leads/{lead_id}', created_at))
+
+def drop_bulk_indexes(conn):
+    placeholders = ', '.join('?' * len(BULK_TABLES))
+    indexes = conn.execute(f'''
+        SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+    ''', BULK_TABLES).fetchall()
+    for (name,) in indexes:
+        conn.execute(f'DROP INDEX {name}')
+
+# Recreates the indexes and triggers dropped for the bulk load and rebuilds
+# the summaries and search index from whatever rows were committed.
+def restore_derived():
+    init_database()
+    conn = get_db_connection()
+    try:
+        rebuild_stats(conn)
+        rebuild_rollups(conn)
+        for index in FTS_INDEXES:
+            rebuild_index(conn, index)
+        conn.commit()
+        conn.execute('ANALYZE')
+        conn.commit()
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+
+# Loads `companies` generated tenants averaging `avg_leads` leads each. The
+# summary-table, rollup and search triggers and the secondary indexes are
+# dropped for the load; afterwards, even if the load fails, restore_derived()
+# recreates them and rebuilds the summaries and search indexes in one pass
+# each. Not meant to run against a database the app is serving.
+def seed(companies, avg_leads, seed=1, as_of=None):
+    init_database()
+    create_master_admin()
+    create_master_settings()
+    as_of = as_of or datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    conn = get_db_connection()
+    try:
+        for pragma in BULK_PRAGMAS:
+            conn.execute(pragma)
+        drop_stats_triggers(conn)
+        drop_rollup_triggers(conn)
+        drop_search_triggers(conn)
+        drop_bulk_indexes(conn)
+        conn.commit()
+
+        generator = SeedGenerator(conn, seed, avg_leads, as_of)
+        started = time.monotonic()
+        for n in range(1, companies + 1):
+            generator.company()
+            if n % 100 == 0 or n == companies:
+                generator.flush()
+                conn.commit()
+                leads = generator.counts.get('leads', 0)
+                print(f"{n}/{companies} companies, {leads} leads ({time.monotonic() - started:.0f}s)")
+    finally:
+        conn.rollback()
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        conn.close()
+        print("Rebuilding indexes, summaries and search...")
+        restore_derived()
+    return generator.counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic multi-tenant dataset for scale testing.')
+    parser.add_argument('companies', type=int)
+    parser.add_argument('--leads', type=int, default=1000, help='average leads per company')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--as-of', type=lambda value: datetime.strptime(value, '%Y-%m-%d'),
+                        help='date the history ends at (YYYY-MM-DD, default today)')
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    counts = seed(args.companies, args.leads, args.seed, args.as_of)
+    total = sum(counts.values())
+    print(f"Wrote {total} rows in {time.monotonic() - started:.0f}s:")
+    for table, count in sorted(counts.items()):
+        print(f"  {table}: {count}")
+    print(f"Seeded users log in with password {SEED_PASSWORD}")
+
+if __name__ == "__main__":
+    main()
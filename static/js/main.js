@@ -50,4 +50,115 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     });
+
+    var eventsUrl = document.body.getAttribute('data-events-url');
+    var unreadUrl = document.body.getAttribute('data-unread-url');
+    if (eventsUrl && window.EventSource) {
+        connectEvents(eventsUrl);
+    } else if (unreadUrl) {
+        pollUnreadCount(unreadUrl);
+    }
 });
+
+// Without an async worker there are no event streams; the badge is refreshed
+// from the unread count instead, and only while the tab is visible.
+var UNREAD_POLL_MS = 60000;
+
+function pollUnreadCount(url) {
+    function refresh() {
+        if (document.hidden) {
+            return;
+        }
+        fetch(url, {credentials: 'same-origin'}).then(function(response) {
+            return response.ok ? response.json() : null;
+        }).then(function(data) {
+            if (data) {
+                setUnreadCount(data.unread);
+            }
+        }).catch(function() {});
+    }
+
+    setInterval(refresh, UNREAD_POLL_MS);
+    document.addEventListener('visibilitychange', refresh);
+}
+
+// Live notifications over server-sent events. The last event id is kept per
+// tab so a new page resumes where the previous one stopped; reconnects within
+// a page resume through the browser's own Last-Event-ID header.
+function connectEvents(url) {
+    var lastId = sessionStorage.getItem('lastEventId');
+    var source = new EventSource(lastId ? url + '?last_event_id=' + encodeURIComponent(lastId) : url);
+
+    function remember(e) {
+        if (e.lastEventId) {
+            sessionStorage.setItem('lastEventId', e.lastEventId);
+        }
+    }
+
+    function onNotification(e) {
+        remember(e);
+        var data = JSON.parse(e.data);
+        if (data.unread !== undefined) {
+            setUnreadCount(data.unread);
+        }
+        showNotificationToast(data);
+    }
+
+    source.addEventListener('unread', function(e) {
+        setUnreadCount(JSON.parse(e.data).unread);
+    });
+    source.addEventListener('notification', onNotification);
+    source.addEventListener('lead_assigned', onNotification);
+}
+
+function setUnreadCount(count) {
+    var badge = document.getElementById('notification-count');
+    if (!badge) {
+        return;
+    }
+    badge.textContent = count > 99 ? '99+' : count;
+    badge.classList.toggle('d-none', !count);
+}
+
+function showNotificationToast(data) {
+    var container = document.getElementById('live-toasts');
+    if (!container) {
+        container = document.createElement('div');
+        container.id = 'live-toasts';
+        container.className = 'toast-container position-fixed bottom-0 end-0 p-3';
+        document.body.appendChild(container);
+    }
+
+    var toast = document.createElement('div');
+    toast.className = 'toast';
+    toast.setAttribute('role', 'alert');
+    var header = document.createElement('div');
+    header.className = 'toast-header';
+    var title = document.createElement('strong');
+    title.className = 'me-auto';
+    title.textContent = data.title;
+    var close = document.createElement('button');
+    close.type = 'button';
+    close.className = 'btn-close';
+    close.setAttribute('data-bs-dismiss', 'toast');
+    header.appendChild(title);
+    header.appendChild(close);
+    var body = document.createElement('div');
+    body.className = 'toast-body';
+    if (data.link) {
+        var link = document.createElement('a');
+        link.href = data.link;
+        link.textContent = data.message;
+        body.appendChild(link);
+    } else {
+        body.textContent = data.message;
+    }
+    toast.appendChild(header);
+    toast.appendChild(body);
+    container.appendChild(toast);
+
+    toast.addEventListener('hidden.bs.toast', function() {
+        toast.remove();
+    });
+    new bootstrap.Toast(toast, {delay: 8000}).show();
+}
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import sys
+import threading
+from flask import render_template, url_for
+
+from cache import TTLCache, MISSING
+from config import Config
+from db import get_db_connection
+from qr_cache import card_url, ensure_qr
+
+STATIC_QR_FORMATS = ('png', 'svg')
+
+# uid -> {'id', 'company_id'} of active cards (None for unknown or inactive
+# ones), so view beacons from published cards are counted without a query
+# per hit.
+beacon_cache = TTLCache('card_beacons', ttl=600, max_size=50000)
+
+def beacon_card(db, uid):
+    card = beacon_cache.get(uid)
+    if card is MISSING:
+        row = db.execute('SELECT id, company_id FROM visiting_cards WHERE uid = ? AND is_active = 1', (uid,)).fetchone()
+        card = beacon_cache.set(uid, dict(row) if row else None)
+    return card
+
+def vcard_text(card, company):
+    return f"""BEGIN:VCARD
+VERSION:3.0
+FN:{card['name']}
+ORG:{company['name']}
+TITLE:{card['designation'] or ''}
+TEL;TYPE=CELL:{card['phone']}
+EMAIL:{card['email'] or ''}
+ADR:{card['address'] or ''}
+NOTE:{card['bio'] or ''}
+END:VCARD"""
+
+def card_dir(out_dir, uid):
+    return os.path.join(out_dir, 'card', uid)
+
+# Writes only when the content changed, so an incremental republish leaves
+# untouched files (and their CDN copies) alone.
+def write_file(path, data):
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+# Renders one card into <out_dir>/card/<uid>/: index.html, vcard.vcf and the
+# QR image in each format, encoding the card's URL under base_url. The page
+# links to the static vCard, posts enquiries to the app and reports the view
+# through the beacon endpoint. Needs a request context for url_for() and the
+# template globals. Returns the number of files that changed.
+def publish_card(conn, card_id, out_dir, base_url):
+    card = conn.execute('SELECT * FROM visiting_cards WHERE id = ?', (card_id,)).fetchone()
+    if card is None:
+        return 0
+    if not card['is_active']:
+        return unpublish_card(out_dir, card['uid'])
+    company = conn.execute('SELECT * FROM companies WHERE id = ?', (card['company_id'],)).fetchone()
+    path = card_dir(out_dir, card['uid'])
+    os.makedirs(path, exist_ok=True)
+    app_url = Config.APP_URL.rstrip('/')
+    html = render_template('card/view.html', card=card, company=company,
+                           vcard_url=f"/card/{card['uid']}/vcard.vcf",
+                           action_url=app_url + url_for('card.card_action', uid=card['uid']),
+                           beacon_url=app_url + url_for('card.view_beacon', uid=card['uid']))
+    changed = write_file(os.path.join(path, 'index.html'), html.encode('utf-8'))
+    changed += write_file(os.path.join(path, 'vcard.vcf'), vcard_text(card, company).encode('utf-8'))
+    for fmt in STATIC_QR_FORMATS:
+        key, qr_path = ensure_qr(card_url(base_url, card['uid']), fmt=fmt)
+        with open(qr_path, 'rb') as f:
+            changed += write_file(os.path.join(path, f'qr.{fmt}'), f.read())
+    return changed
+
+def unpublish_card(out_dir, uid):
+    path = card_dir(out_dir, uid)
+    if not os.path.isdir(path):
+        return 0
+    shutil.rmtree(path)
+    return 1
+
+def company_card_ids(conn, company_id):
+    return [row['id'] for row in conn.execute('SELECT id FROM visiting_cards WHERE company_id = ?', (company_id,))]
+
+def publish_all(app, conn, out_dir, base_url):
+    card_ids = [row['id'] for row in conn.execute('SELECT id FROM visiting_cards WHERE is_active = 1')]
+    changed = 0
+    with app.test_request_context(base_url=Config.APP_URL or None):
+        for card_id in card_ids:
+            changed += publish_card(conn, card_id, out_dir, base_url)
+    return len(card_ids), changed
+
+# Republishes cards in the background after the edits that affect them.
+# Requests only record which cards or companies changed; repeated edits to
+# the same card before the worker gets to it are coalesced.
+class StaticCardPublisher:
+    def __init__(self, app, out_dir, base_url):
+        self.app = app
+        self.out_dir = out_dir
+        self.base_url = base_url
+        self.published = 0
+        self.changed = 0
+        self.errors = 0
+        self._cards = set()
+        self._companies = set()
+        self._everything = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def queue(self, card_ids=(), company_ids=(), everything=False):
+        with self._lock:
+            self._cards.update(card_ids)
+            self._companies.update(company_ids)
+            self._everything = self._everything or everything
+        self.start()
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='static-card-publisher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.run_once()
+
+    def run_once(self):
+        with self._lock:
+            card_ids, company_ids, everything = self._cards, self._companies, self._everything
+            self._cards, self._companies, self._everything = set(), set(), False
+        if not card_ids and not company_ids and not everything:
+            return 0
+        conn = get_db_connection()
+        try:
+            if everything:
+                card_ids.update(row['id'] for row in conn.execute('SELECT id FROM visiting_cards'))
+            for company_id in company_ids:
+                card_ids.update(company_card_ids(conn, company_id))
+            with self.app.test_request_context(base_url=Config.APP_URL or None):
+                for card_id in card_ids:
+                    try:
+                        self.changed += publish_card(conn, card_id, self.out_dir, self.base_url)
+                        self.published += 1
+                    except Exception as e:
+                        self.errors += 1
+                        print(f"Static card publish error for card {card_id}: {e}")
+        finally:
+            conn.close()
+        return len(card_ids)
+
+    def stats(self):
+        return {'published': self.published, 'changed': self.changed, 'errors': self.errors,
+                'pending': len(self._cards) + len(self._companies) + self._everything}
+
+_publisher = None
+
+def start_publisher(app):
+    global _publisher
+    if _publisher is None:
+        _publisher = StaticCardPublisher(app, Config.STATIC_CARDS_DIR, Config.STATIC_CARDS_URL)
+        _publisher.start()
+    return _publisher
+
+# Called after committing a change to a card, or to company branding, plan or
+# status that shows on its cards. No-ops unless static publishing is enabled.
+def card_changed(card):
+    beacon_cache.invalidate(card['uid'])
+    if _publisher is not None:
+        _publisher.queue(card_ids=(card['id'],))
+
+def company_cards_changed(company_id):
+    if _publisher is not None:
+        _publisher.queue(company_ids=(company_id,))
+
+def all_cards_changed():
+    if _publisher is not None:
+        _publisher.queue(everything=True)
+
+def publisher_stats():
+    return _publisher.stats() if _publisher is not None else None
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python static_cards.py <output_dir> <base_url>")
+        print("Example: python static_cards.py /var/www/cards https://cards.example.com/")
+        sys.exit(1)
+
+    from app import app
+    out_dir, base_url = sys.argv[1], sys.argv[2]
+    conn = get_db_connection()
+    try:
+        cards, changed = publish_all(app, conn, out_dir, base_url)
+    finally:
+        conn.close()
+    print(f"Published {cards} cards to {out_dir} ({changed} files changed).")
+
+if __name__ == "__main__":
+    main()
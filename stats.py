@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+from datetime import datetime
+
+from db import get_db_connection
+
+STATS_TABLES = [
+    '''
+        CREATE TABLE IF NOT EXISTS company_stats (
+            company_id INTEGER PRIMARY KEY,
+            total_cards INTEGER DEFAULT 0,
+            total_views INTEGER DEFAULT 0,
+            total_sales INTEGER DEFAULT 0,
+            total_leads INTEGER DEFAULT 0,
+            unassigned_leads INTEGER DEFAULT 0,
+            leads_today INTEGER DEFAULT 0,
+            leads_today_date TEXT
+        )
+    ''',
+    '''
+        CREATE TABLE IF NOT EXISTS platform_stats (
+            id INTEGER PRIMARY KEY CHECK(id = 1),
+            total_companies INTEGER DEFAULT 0,
+            active_companies INTEGER DEFAULT 0,
+            free_companies INTEGER DEFAULT 0,
+            basic_companies INTEGER DEFAULT 0,
+            pro_companies INTEGER DEFAULT 0,
+            total_users INTEGER DEFAULT 0,
+            total_leads INTEGER DEFAULT 0,
+            total_revenue REAL DEFAULT 0,
+            api_usage INTEGER DEFAULT 0
+        )
+    '''
+]
+
+# Each tracked row contributes to the summary tables. The *_ADD and
+# *_REMOVE fragments apply that contribution for NEW or OLD; updates remove
+# the old contribution and add the new one.
+LEAD_ADD = '''
+    INSERT INTO company_stats (company_id, total_leads, unassigned_leads, leads_today, leads_today_date)
+    VALUES (NEW.company_id, 1, NEW.assigned_to IS NULL, 1, date(NEW.created_at))
+    ON CONFLICT(company_id) DO UPDATE SET
+        total_leads = total_leads + 1,
+        unassigned_leads = unassigned_leads + excluded.unassigned_leads,
+        leads_today = CASE
+            WHEN leads_today_date IS excluded.leads_today_date THEN leads_today + 1
+            WHEN leads_today_date IS NULL OR leads_today_date < excluded.leads_today_date THEN 1
+            ELSE leads_today END,
+        leads_today_date = CASE
+            WHEN leads_today_date IS NULL OR leads_today_date < excluded.leads_today_date THEN excluded.leads_today_date
+            ELSE leads_today_date END;
+'''
+
+LEAD_REMOVE = '''
+    UPDATE company_stats SET
+        total_leads = total_leads - 1,
+        unassigned_leads = unassigned_leads - (OLD.assigned_to IS NULL),
+        leads_today = leads_today - (leads_today_date IS date(OLD.created_at))
+    WHERE company_id = OLD.company_id;
+'''
+
+CARD_ADD = '''
+    INSERT INTO company_stats (company_id, total_cards, total_views)
+    VALUES (NEW.company_id, 1, COALESCE(NEW.views_count, 0))
+    ON CONFLICT(company_id) DO UPDATE SET
+        total_cards = total_cards + 1,
+        total_views = total_views + excluded.total_views;
+'''
+
+CARD_REMOVE = '''
+    UPDATE company_stats SET
+        total_cards = total_cards - 1,
+        total_views = total_views - COALESCE(OLD.views_count, 0)
+    WHERE company_id = OLD.company_id;
+'''
+
+USER_ADD = '''
+    INSERT INTO company_stats (company_id, total_sales)
+    SELECT NEW.company_id, 1 WHERE NEW.role = 'sales_person' AND NEW.company_id IS NOT NULL
+    ON CONFLICT(company_id) DO UPDATE SET total_sales = total_sales + 1;
+    UPDATE platform_stats SET total_users = total_users + (NEW.role != 'master_admin') WHERE id = 1;
+'''
+
+USER_REMOVE = '''
+    UPDATE company_stats SET total_sales = total_sales - 1
+    WHERE company_id = OLD.company_id AND OLD.role = 'sales_person';
+    UPDATE platform_stats SET total_users = total_users - (OLD.role != 'master_admin') WHERE id = 1;
+'''
+
+COMPANY_ADD = '''
+    UPDATE platform_stats SET
+        active_companies = active_companies + (NEW.is_active IS 1),
+        free_companies = free_companies + (NEW.plan IS 'free'),
+        basic_companies = basic_companies + (NEW.plan IS 'basic'),
+        pro_companies = pro_companies + (NEW.plan IS 'pro')
+    WHERE id = 1;
+'''
+
+COMPANY_REMOVE = '''
+    UPDATE platform_stats SET
+        active_companies = active_companies - (OLD.is_active IS 1),
+        free_companies = free_companies - (OLD.plan IS 'free'),
+        basic_companies = basic_companies - (OLD.plan IS 'basic'),
+        pro_companies = pro_companies - (OLD.plan IS 'pro')
+    WHERE id = 1;
+'''
+
+PAYMENT_ADD = '''
+    UPDATE platform_stats SET total_revenue = total_revenue + CASE WHEN NEW.status = 'success' THEN NEW.amount ELSE 0 END
+    WHERE id = 1;
+'''
+
+PAYMENT_REMOVE = '''
+    UPDATE platform_stats SET total_revenue = total_revenue - CASE WHEN OLD.status = 'success' THEN OLD.amount ELSE 0 END
+    WHERE id = 1;
+'''
+
+STATS_TRIGGERS = {
+    'stats_leads_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_leads_insert AFTER INSERT ON leads BEGIN
+            {LEAD_ADD}
+            UPDATE platform_stats SET total_leads = total_leads + 1 WHERE id = 1;
+        END
+    ''',
+    'stats_leads_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_leads_delete AFTER DELETE ON leads BEGIN
+            {LEAD_REMOVE}
+            UPDATE platform_stats SET total_leads = total_leads - 1 WHERE id = 1;
+        END
+    ''',
+    'stats_leads_update': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_leads_update AFTER UPDATE OF company_id, assigned_to, created_at ON leads
+        WHEN OLD.company_id IS NOT NEW.company_id
+            OR (OLD.assigned_to IS NULL) != (NEW.assigned_to IS NULL)
+            OR OLD.created_at IS NOT NEW.created_at
+        BEGIN
+            {LEAD_REMOVE}
+            {LEAD_ADD}
+        END
+    ''',
+    'stats_cards_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_cards_insert AFTER INSERT ON visiting_cards BEGIN
+            {CARD_ADD}
+        END
+    ''',
+    'stats_cards_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_cards_delete AFTER DELETE ON visiting_cards BEGIN
+            {CARD_REMOVE}
+        END
+    ''',
+    'stats_cards_update': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_cards_update AFTER UPDATE OF company_id, views_count ON visiting_cards
+        WHEN OLD.company_id IS NOT NEW.company_id OR OLD.views_count IS NOT NEW.views_count
+        BEGIN
+            {CARD_REMOVE}
+            {CARD_ADD}
+        END
+    ''',
+    'stats_users_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_users_insert AFTER INSERT ON users BEGIN
+            {USER_ADD}
+        END
+    ''',
+    'stats_users_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_users_delete AFTER DELETE ON users BEGIN
+            {USER_REMOVE}
+        END
+    ''',
+    'stats_users_update': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_users_update AFTER UPDATE OF company_id, role ON users
+        WHEN OLD.company_id IS NOT NEW.company_id OR OLD.role IS NOT NEW.role
+        BEGIN
+            {USER_REMOVE}
+            {USER_ADD}
+        END
+    ''',
+    'stats_companies_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_companies_insert AFTER INSERT ON companies BEGIN
+            INSERT OR IGNORE INTO company_stats (company_id) VALUES (NEW.id);
+            UPDATE platform_stats SET total_companies = total_companies + 1 WHERE id = 1;
+            {COMPANY_ADD}
+        END
+    ''',
+    'stats_companies_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_companies_delete AFTER DELETE ON companies BEGIN
+            DELETE FROM company_stats WHERE company_id = OLD.id;
+            UPDATE platform_stats SET total_companies = total_companies - 1 WHERE id = 1;
+            {COMPANY_REMOVE}
+        END
+    ''',
+    'stats_companies_update': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_companies_update AFTER UPDATE OF is_active, plan ON companies
+        WHEN OLD.is_active IS NOT NEW.is_active OR OLD.plan IS NOT NEW.plan
+        BEGIN
+            {COMPANY_REMOVE}
+            {COMPANY_ADD}
+        END
+    ''',
+    'stats_payments_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_payments_insert AFTER INSERT ON payments BEGIN
+            {PAYMENT_ADD}
+        END
+    ''',
+    'stats_payments_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_payments_delete AFTER DELETE ON payments BEGIN
+            {PAYMENT_REMOVE}
+        END
+    ''',
+    'stats_payments_update': f'''
+        CREATE TRIGGER IF NOT EXISTS stats_payments_update AFTER UPDATE OF status, amount ON payments
+        WHEN OLD.status IS NOT NEW.status OR OLD.amount IS NOT NEW.amount
+        BEGIN
+            {PAYMENT_REMOVE}
+            {PAYMENT_ADD}
+        END
+    ''',
+    'stats_api_keys_insert': '''
+        CREATE TRIGGER IF NOT EXISTS stats_api_keys_insert AFTER INSERT ON api_keys BEGIN
+            UPDATE platform_stats SET api_usage = api_usage + COALESCE(NEW.usage_count, 0) WHERE id = 1;
+        END
+    ''',
+    'stats_api_keys_delete': '''
+        CREATE TRIGGER IF NOT EXISTS stats_api_keys_delete AFTER DELETE ON api_keys BEGIN
+            UPDATE platform_stats SET api_usage = api_usage - COALESCE(OLD.usage_count, 0) WHERE id = 1;
+        END
+    ''',
+    'stats_api_keys_update': '''
+        CREATE TRIGGER IF NOT EXISTS stats_api_keys_update AFTER UPDATE OF usage_count ON api_keys
+        WHEN OLD.usage_count IS NOT NEW.usage_count
+        BEGIN
+            UPDATE platform_stats SET api_usage = api_usage + COALESCE(NEW.usage_count, 0) - COALESCE(OLD.usage_count, 0) WHERE id = 1;
+        END
+    '''
+}
+
+def create_stats_schema(conn):
+    for statement in STATS_TABLES:
+        conn.execute(statement)
+    created = conn.execute('INSERT OR IGNORE INTO platform_stats (id) VALUES (1)').rowcount
+    for statement in STATS_TRIGGERS.values():
+        conn.execute(statement)
+    # A database that predates the summary tables needs one full pass.
+    if created:
+        rebuild_stats(conn)
+
+def drop_stats_triggers(conn):
+    for name in STATS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+def rebuild_stats(conn):
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    conn.execute('DELETE FROM company_stats')
+    conn.execute('''
+        INSERT INTO company_stats (company_id, total_cards, total_views, total_sales, total_leads,
+                                   unassigned_leads, leads_today, leads_today_date)
+        SELECT c.id,
+            (SELECT COUNT(*) FROM visiting_cards WHERE company_id = c.id),
+            (SELECT COALESCE(SUM(views_count), 0) FROM visiting_cards WHERE company_id = c.id),
+            (SELECT COUNT(*) FROM users WHERE company_id = c.id AND role = 'sales_person'),
+            (SELECT COUNT(*) FROM leads WHERE company_id = c.id),
+            (SELECT COUNT(*) FROM leads WHERE company_id = c.id AND assigned_to IS NULL),
+            (SELECT COUNT(*) FROM leads WHERE company_id = c.id AND created_at >= ? AND created_at < date(?, '+1 day')),
+            ?
+        FROM companies c
+    ''', (today, today, today))
+    conn.execute('''
+        UPDATE platform_stats SET
+            total_companies = (SELECT COUNT(*) FROM companies),
+            active_companies = (SELECT COUNT(*) FROM companies WHERE is_active = 1),
+            free_companies = (SELECT COUNT(*) FROM companies WHERE plan = 'free'),
+            basic_companies = (SELECT COUNT(*) FROM companies WHERE plan = 'basic'),
+            pro_companies = (SELECT COUNT(*) FROM companies WHERE plan = 'pro'),
+            total_users = (SELECT COUNT(*) FROM users WHERE role != 'master_admin'),
+            total_leads = (SELECT COUNT(*) FROM leads),
+            total_revenue = (SELECT COALESCE(SUM(amount), 0) FROM payments WHERE status = 'success'),
+            api_usage = (SELECT COALESCE(SUM(usage_count), 0) FROM api_keys)
+        WHERE id = 1
+    ''')
+
+def company_stats(db, company_id):
+    row = db.execute('SELECT * FROM company_stats WHERE company_id = ?', (company_id,)).fetchone()
+    stats = dict(row) if row else {
+        'total_cards': 0, 'total_views': 0, 'total_sales': 0,
+        'total_leads': 0, 'unassigned_leads': 0, 'leads_today': 0, 'leads_today_date': None
+    }
+    if stats['leads_today_date'] != datetime.utcnow().strftime('%Y-%m-%d'):
+        stats['leads_today'] = 0
+    return stats
+
+def platform_stats(db):
+    return db.execute('SELECT * FROM platform_stats WHERE id = 1').fetchone()
+
+def main():
+    conn = get_db_connection()
+    try:
+        rebuild_stats(conn)
+        conn.commit()
+        stats = platform_stats(conn)
+        companies = conn.execute('SELECT COUNT(*) FROM company_stats').fetchone()[0]
+    finally:
+        conn.close()
+    print(f"Rebuilt stats for {companies} companies ({stats['total_leads']} leads, {stats['total_users']} users).")
+
+if __name__ == "__main__":
+    main()
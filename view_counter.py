@@ -0,0 +1,39 @@
+from datetime import datetime, timedelta
+
+from buffered_counter import BufferedCounter
+
+VIEW_TREND_QUERY = '''
+    SELECT day, SUM(views) AS views FROM card_views_daily
+    WHERE company_id = ? AND day >= ? GROUP BY day
+'''
+
+class CardViewCounter(BufferedCounter):
+    def __init__(self):
+        super().__init__('card_views', flush_interval=5, flush_threshold=500)
+
+    def record(self, card):
+        day = datetime.utcnow().strftime('%Y-%m-%d')
+        self.add((card['id'], card['company_id'], day))
+
+    def write(self, conn, batch):
+        per_card = {}
+        for (card_id, company_id, day), views in batch.items():
+            per_card[card_id] = per_card.get(card_id, 0) + views
+        conn.executemany('UPDATE visiting_cards SET views_count = views_count + ? WHERE id = ?',
+                         [(views, card_id) for card_id, views in per_card.items()])
+        conn.executemany('''
+            INSERT INTO card_views_daily (card_id, company_id, day, views) VALUES (?, ?, ?, ?)
+            ON CONFLICT(card_id, day) DO UPDATE SET views = views + excluded.views
+        ''', [(card_id, company_id, day, views) for (card_id, company_id, day), views in batch.items()])
+
+view_counter = CardViewCounter()
+
+def view_trend(db, company_id, days=14):
+    start = datetime.utcnow().date() - timedelta(days=days - 1)
+    rows = db.execute(VIEW_TREND_QUERY, (company_id, start.isoformat())).fetchall()
+    views_by_day = {row['day']: row['views'] for row in rows}
+    trend = []
+    for offset in range(days):
+        day = (start + timedelta(days=offset)).isoformat()
+        trend.append({'day': day, 'views': views_by_day.get(day, 0)})
+    return trend